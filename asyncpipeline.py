@@ -0,0 +1,132 @@
+"""
+Module with the asyncio pipeline overlapping disk reads, encryption and writes.
+
+The pipeline has three stages connected by bounded queues: a reader pulling blocks
+from a blocking iterator in a thread, a crypto stage handing the blocks to the workers
+of a ParallelEngine, and a writer saving the results in order in a thread. While one
+chunk is written, the next ones are encrypted and read. When a stage falls behind,
+the bounded queues make the previous stages wait, so the memory usage stays bounded.
+"""
+
+import asyncio
+from functools import partial
+import ciphers
+import compressors
+import container
+from instrumentation import stats
+from outputfile import atomic_output
+
+DEFAULT_DEPTH = 8
+_END = object()
+
+
+async def _read(iterator, queue):
+    """
+    Moves the items of a blocking iterator to the queue, reading them in a thread.
+    """
+    index = 0
+    while True:
+        item = await asyncio.to_thread(next, iterator, _END)
+        if item is _END:
+            break
+        await queue.put((index, item))
+        index += 1
+    await queue.put(_END)
+
+
+async def _process(operation, key, source, results):
+    """
+    Starts the operation for every queued item and queues the pending results in order,
+    each one together with the length of its input.
+    """
+    while True:
+        item = await source.get()
+        if item is _END:
+            break
+        index, data = item
+        await results.put((asyncio.ensure_future(operation(key, index, data)), len(data)))
+    await results.put(_END)
+
+
+async def _write(write, results):
+    """
+    Waits for the results in order and writes each one in a thread.
+    """
+    while True:
+        item = await results.get()
+        if item is _END:
+            break
+        pending, length = item
+        await asyncio.to_thread(write, await pending, length)
+
+
+async def _run(operation, key, items, write, depth):
+    """
+    Runs the three stages, cancelling all of them if one fails.
+    """
+    read_queue = asyncio.Queue(maxsize=depth)
+    results = asyncio.Queue(maxsize=depth)
+    tasks = [asyncio.ensure_future(_read(iter(items), read_queue)),
+             asyncio.ensure_future(_process(operation, key, read_queue, results)),
+             asyncio.ensure_future(_write(write, results))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        while not results.empty():
+            item = results.get_nowait()
+            if item is not _END:
+                item[0].cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def encrypt_to_file(engine, key, header, chunks, file_path, depth=DEFAULT_DEPTH, fsync=False):
+    """
+    Encrypts the chunks and writes them to a chunked container with its index.
+
+    The container replaces the file only once it is complete.
+
+    Args:
+        engine (ParallelEngine): The engine encrypting the chunks.
+        key (bytes): The derived key.
+        header (dict): The header of the container, naming the compression codec
+            and the cipher if any.
+        chunks (Iterable[bytes or memoryview]): The plaintext chunks, read in a thread.
+        file_path (str): The path to the container.
+        depth (int): The maximal number of chunks waiting in each queue.
+        fsync (bool): If True, the container is flushed to the disk.
+    """
+    with atomic_output(file_path, fsync) as file:
+        writer = container.ContainerWriter(file, key, container.write_header(file, header))
+        operation = partial(engine.encrypt_async, codec=header.get('compression', compressors.NONE),
+                            cipher=header.get('cipher', ciphers.FERNET))
+        await _run(operation, key, chunks, writer.write, depth)
+        writer.finish()
+
+
+async def decrypt_to_file(engine, key, tokens, file_path, depth=DEFAULT_DEPTH,
+                          codec=compressors.NONE, cipher=ciphers.FERNET, fsync=False):
+    """
+    Decrypts the chunks of a container and writes the content to a file.
+
+    The content replaces the file only once it is complete.
+
+    Args:
+        engine (ParallelEngine): The engine decrypting the chunks.
+        key (bytes): The derived key.
+        tokens (Iterable[bytes]): The encrypted chunks, read in a thread.
+        file_path (str): The path to the decrypted file.
+        depth (int): The maximal number of chunks waiting in each queue.
+        codec (str): The name of the codec the chunks were compressed with.
+        cipher (str): The name of the cipher the chunks were encrypted with.
+        fsync (bool): If True, the file is flushed to the disk.
+    """
+    with atomic_output(file_path, fsync) as file:
+        def write(data, _):
+            with stats.timer('write', len(data)):
+                file.write(data)
+
+        await _run(partial(engine.decrypt_async, codec=codec, cipher=cipher), key, tokens, write,
+                   depth)
@@ -0,0 +1,89 @@
+""" Module with tests for asyncpipeline module"""
+
+import asyncio
+import os
+import shutil
+import time
+import unittest
+import asyncpipeline
+import container
+from engine import ParallelEngine
+
+
+class TestAsyncPipeline(unittest.TestCase):
+    """
+    Test suite for the asyncio pipeline.
+    """
+    def setUp(self):
+        """
+        Prepare a key, chunks and a folder for the files.
+        """
+        self.key = os.urandom(32)
+        self.chunks = [os.urandom(number * 10) for number in range(40)]
+        self.temp_dir = 'temp_async_dir'
+        os.mkdir(self.temp_dir)
+
+    def tearDown(self):
+        """
+        Remove the folder.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """
+        Checks that chunks written by the pipeline are read back in order
+        by the pipeline and by the blocking engine.
+        """
+        encrypted = os.path.join(self.temp_dir, 'file.encrypt')
+        decrypted = os.path.join(self.temp_dir, 'file.decrypt')
+        with ParallelEngine(2, use_threads=True) as engine:
+            asyncio.run(asyncpipeline.encrypt_to_file(engine, self.key, {'version': 1},
+                                                      iter(self.chunks), encrypted, depth=3))
+            with open(encrypted, 'rb') as file:
+                self.assertEqual(container.read_header(file), {'version': 1})
+                entries, _ = container.read_index(file, self.key)
+                tokens = list(container.read_records(file, entries))
+            asyncio.run(asyncpipeline.decrypt_to_file(engine, self.key, tokens, decrypted))
+
+        with ParallelEngine() as engine:
+            self.assertEqual(list(engine.decrypt(self.key, tokens)), self.chunks)
+        with open(decrypted, 'rb') as file:
+            self.assertEqual(file.read(), b''.join(self.chunks))
+
+    def test_error_is_raised(self):
+        """
+        Checks that an error in the crypto stage stops the pipeline and reaches the caller.
+        """
+        with ParallelEngine() as engine:
+            tokens = list(engine.encrypt(self.key, self.chunks))
+            with self.assertRaises(container.ContainerError):
+                asyncio.run(asyncpipeline.decrypt_to_file(
+                    engine, self.key, reversed(tokens), os.path.join(self.temp_dir, 'file')))
+
+    def test_backpressure(self):
+        """
+        Checks that a slow writer keeps the reader from running far ahead.
+        """
+        produced = []
+        written = []
+        ahead = []
+
+        def chunks():
+            for chunk in self.chunks:
+                produced.append(chunk)
+                ahead.append(len(produced) - len(written))
+                yield chunk
+
+        def write(token, length):
+            time.sleep(0.002)
+            written.append(token)
+
+        with ParallelEngine() as engine:
+            asyncio.run(asyncpipeline._run(engine.encrypt_async, self.key, chunks(), write, 2))
+
+        self.assertEqual(len(written), len(self.chunks))
+        self.assertLessEqual(max(ahead), 2 * 2 + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Module with the batch mode processing many directories in a single run.
+
+Every run of main.py pays for the interpreter startup, the imports and the key
+derivation. The batch mode takes the targets from the command line, as paths or globs,
+and from job files, and runs the operation on all of them in one process, so the key
+is derived once and the pool of workers is shared.
+
+A job file holds one path or glob per line. Empty lines and lines starting with '#'
+are skipped.
+"""
+
+import glob
+import time
+
+
+def read_job_file(path: str):
+    """
+    Reads the targets listed in a job file.
+
+    Args:
+        path (str): The path to the job file.
+
+    Returns:
+        list of str: The paths and globs in the order of the file.
+    """
+    with open(path, 'r', encoding='utf8') as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def expand_targets(patterns=(), job_file=None):
+    """
+    Expands the paths and globs of the targets.
+
+    A pattern without glob characters is kept even if the path does not exist,
+    so the missing target is reported instead of being skipped silently.
+
+    Args:
+        patterns (Iterable[str]): Paths and globs given on the command line.
+        job_file (str or None): The path to a job file with more targets.
+
+    Returns:
+        list of str: The targets without duplicates, in the order they were given.
+    """
+    patterns = list(patterns)
+    if job_file is not None:
+        patterns.extend(read_job_file(job_file))
+    targets = {}
+    for pattern in patterns:
+        if any(character in pattern for character in '*?['):
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                targets.setdefault(path, None)
+        else:
+            targets.setdefault(pattern, None)
+    return list(targets)
+
+
+def run_batch(targets, operation):
+    """
+    Runs the operation for every target, going on when one of them fails.
+
+    Args:
+        targets (Iterable[str]): The targets to process.
+        operation (Callable[[str], str]): The function processing a target
+            and returning a message about the result.
+
+    Yields:
+        dict: The 'target', whether it succeeded as 'ok', the 'message'
+        and the time of the operation in 'seconds'.
+    """
+    for target in targets:
+        start = time.perf_counter()
+        try:
+            message, ok = operation(target), True
+        except Exception as error:
+            message, ok = str(error) or type(error).__name__, False
+        yield {'target': target, 'ok': ok, 'message': message,
+               'seconds': time.perf_counter() - start}
@@ -0,0 +1,57 @@
+""" Module with tests for batch module"""
+
+import os
+import shutil
+import unittest
+import batch
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Test suite for expanding and running the targets of a batch.
+    """
+    def setUp(self):
+        """
+        Create directories of tenants and a job file.
+        """
+        for name in ['tenant1', 'tenant2', 'other']:
+            os.makedirs(os.path.join('temp_batch_dir', name))
+        with open(os.path.join('temp_batch_dir', 'jobs.txt'), 'w', encoding='utf8') as file:
+            file.write('# nightly\n\ntemp_batch_dir/other\ntemp_batch_dir/tenant1\n')
+
+    def tearDown(self):
+        """
+        Remove the directories.
+        """
+        shutil.rmtree('temp_batch_dir')
+
+    def test_expand_targets(self):
+        """
+        Checks that globs are expanded, job files are read, duplicates are dropped
+        and missing paths are kept.
+        """
+        targets = batch.expand_targets(['temp_batch_dir/tenant*', 'temp_batch_dir/missing'],
+                                       os.path.join('temp_batch_dir', 'jobs.txt'))
+
+        self.assertEqual(targets, [os.path.join('temp_batch_dir', 'tenant1'),
+                                   os.path.join('temp_batch_dir', 'tenant2'),
+                                   'temp_batch_dir/missing', 'temp_batch_dir/other'])
+
+    def test_run_batch(self):
+        """
+        Checks that a failing target is reported and the next ones are processed.
+        """
+        def operation(target):
+            if target == 'bad':
+                raise ValueError('broken')
+            return f'done {target}'
+
+        results = list(batch.run_batch(['first', 'bad', 'last'], operation))
+
+        self.assertEqual([(result['ok'], result['message']) for result in results],
+                         [(True, 'done first'), (False, 'broken'), (True, 'done last')])
+        self.assertTrue(all(result['seconds'] >= 0 for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,538 @@
+"""
+Module with benchmarks of the encryption.
+
+The suite generates synthetic directory trees, times the hot paths of DirectoryFile
+and EncryptDecrypt on them and writes the results as JSON, so runs of different
+commits can be compared.
+
+Run it directly, for example:
+    $ python3 benchmark.py suite --shape small large --output before.json
+    $ python3 benchmark.py compare before.json after.json
+    $ python3 benchmark.py workers --size 64 --workers 1 2 4 8
+    $ python3 benchmark.py compression --size 16 --data text random
+    $ python3 benchmark.py ciphers --size 64
+    $ python3 benchmark.py login --kdf scrypt
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import ciphers
+import compressors
+import container
+import kdf
+import passwordfile
+from encryptdecrypt import EncryptDecrypt
+from engine import ParallelEngine
+from instrumentation import peak_rss_kb
+from keycache import KeyCache
+
+SHAPES = {
+    'small': {'files': 2000, 'file_size': 2 * 1024, 'depth': 1},
+    'large': {'files': 2, 'file_size': 32 * 1024 * 1024, 'depth': 1},
+    'deep': {'files': 500, 'file_size': 4 * 1024, 'depth': 25},
+}
+CONTENT_OPERATIONS = {'text_from_file', 'encrypt', 'save_encrypted_text', 'decrypt',
+                      'save_decrypted_text'}
+WORDS = ['kacper', 'kamil', 'oliwia', 'cipher', 'machine', 'directory', 'encrypt', 'decrypt',
+         'lorem', 'ipsum', 'dolor', 'sit', 'amet', '2023-10-01', 'INFO', 'ERROR']
+
+
+def generate_tree(root, files, file_size, depth, seed=0):
+    """
+    Generates a directory tree with text files of pseudo-random words.
+
+    The files are spread over a chain of depth nested directories.
+
+    Args:
+        root (str): The directory where the tree is created.
+        files (int): The number of files.
+        file_size (int): The approximate size of every file in bytes.
+        depth (int): The number of nested directory levels.
+        seed (int): The seed making the content reproducible.
+
+    Returns:
+        int: The total size of the generated files in bytes.
+    """
+    generator = random.Random(seed)
+    levels = [root]
+    for level in range(1, depth):
+        levels.append(os.path.join(levels[-1], f'level{level}'))
+    os.makedirs(levels[-1], exist_ok=True)
+    line = ' '.join(generator.choice(WORDS) for _ in range(12)) + '\n'
+    total = 0
+    for number in range(files):
+        lines = []
+        size = 0
+        while size < file_size:
+            words = line.split()
+            generator.shuffle(words)
+            lines.append(' '.join(words) + '\n')
+            size += len(lines[-1])
+        path = os.path.join(levels[number % depth], f'file{number}.txt')
+        with open(path, 'w', encoding='utf8') as file:
+            file.writelines(lines)
+        total += size
+    return total
+
+
+def generate_text(size, seed=0):
+    """
+    Generates log-like text with timestamps, numbers and words.
+
+    Args:
+        size (int): The approximate size of the text in bytes.
+        seed (int): The seed making the content reproducible.
+
+    Returns:
+        bytes: The text encoded as UTF-8.
+    """
+    generator = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size:
+        words = ' '.join(generator.choice(WORDS) for _ in range(generator.randint(3, 10)))
+        lines.append(f'{1696118400 + total // 50} {generator.choice(("INFO", "WARN", "ERROR"))} '
+                     f'request={generator.getrandbits(32):08x} took={generator.random():.4f} {words}\n')
+        total += len(lines[-1])
+    return ''.join(lines).encode('utf-8')
+
+
+def measure(function, trace_allocations=True):
+    """
+    Times the function and, in a second run, measures its allocations.
+
+    Args:
+        function (callable): The operation to measure, it is called once or twice.
+        trace_allocations (bool): If False, the allocation run is skipped.
+
+    Returns:
+        dict: 'seconds', 'peak_rss_kb', 'alloc_peak_bytes' and 'alloc_retained_blocks',
+        the number of memory blocks allocated by the operation and still held after it,
+        counted in a tracemalloc snapshot. Python does not count the blocks allocated
+        and freed in between.
+    """
+    start = time.perf_counter()
+    function()
+    result = {'seconds': time.perf_counter() - start, 'peak_rss_kb': peak_rss_kb(),
+              'alloc_peak_bytes': None, 'alloc_retained_blocks': None}
+    if trace_allocations:
+        tracemalloc.start()
+        try:
+            function()
+            result['alloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        result['alloc_retained_blocks'] = sum(statistic.count
+                                              for statistic in snapshot.statistics('filename'))
+    return result
+
+
+def drain(iterator):
+    """
+    Consumes an iterator without keeping its items.
+    """
+    for _ in iterator:
+        pass
+
+
+def bench_shape(shape, files, file_size, depth, workers=1, trace_allocations=True, async_io=False):
+    """
+    Measures the hot paths on a generated directory tree.
+
+    Args:
+        shape (str): The name of the shape reported in the results.
+        files (int): The number of files.
+        file_size (int): The approximate size of every file in bytes.
+        depth (int): The number of nested directory levels.
+        workers (int): The number of workers used by EncryptDecrypt.
+        trace_allocations (bool): If False, allocations are not measured.
+        async_io (bool): If True, EncryptDecrypt uses the asyncio pipeline.
+
+    Returns:
+        list of dict: One result per operation with its throughput in files/s,
+        and in MB/s for the operations processing the content of the files.
+    """
+    root = tempfile.mkdtemp(prefix='cipher_benchmark_')
+    try:
+        directory = os.path.join(root, 'tree')
+        total = generate_tree(directory, files, file_size, depth)
+        encrypt_decrypt = EncryptDecrypt(directory, workers=workers, async_io=async_io)
+        encrypt_decrypt.new_folder = Path(root, 'result')
+        encrypt_decrypt.create_kdf()
+        append_target = encrypt_decrypt.get_file()[0]
+
+        def create_kdf():
+            encrypt_decrypt.key_cache = KeyCache()
+            encrypt_decrypt.create_kdf()
+
+        operations = [
+            ('get_file', encrypt_decrypt.get_file),
+            ('text_from_file', encrypt_decrypt.text_from_file),
+            ('create_kdf', create_kdf),
+            ('encrypt', lambda: drain(encrypt_decrypt.iter_encrypt_chunks())),
+            ('save_encrypted_text', encrypt_decrypt.save_encrypted_text),
+            ('decrypt', lambda: drain(encrypt_decrypt.iter_decrypt())),
+            ('save_decrypted_text', encrypt_decrypt.save_decrypted_text),
+            ('append_text_to_file',
+             lambda: encrypt_decrypt.append_text_to_file('benchmark', append_target)),
+        ]
+        results = []
+        for operation, function in operations:
+            result = measure(function, trace_allocations)
+            seconds = max(result['seconds'], 1e-9)
+            results.append({
+                'shape': shape,
+                'operation': operation,
+                'files': files,
+                'bytes': total,
+                'mb_per_s': total / 1_000_000 / seconds if operation in CONTENT_OPERATIONS else None,
+                'files_per_s': files / seconds,
+                **result,
+            })
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def run_suite(shapes, workers=1, trace_allocations=True, scale=1.0, async_io=False):
+    """
+    Runs the benchmarks for the chosen shapes.
+
+    Args:
+        shapes (list of str): Names of shapes from SHAPES.
+        workers (int): The number of workers used by EncryptDecrypt.
+        trace_allocations (bool): If False, allocations are not measured.
+        scale (float): Factor applied to the number of files, to make runs shorter or longer.
+        async_io (bool): If True, EncryptDecrypt uses the asyncio pipeline.
+
+    Returns:
+        dict: 'meta' describing the host and 'results' with one entry per shape and operation.
+    """
+    results = []
+    for shape in shapes:
+        parameters = dict(SHAPES[shape])
+        parameters['files'] = max(1, int(parameters['files'] * scale))
+        results.extend(bench_shape(shape, workers=workers, trace_allocations=trace_allocations,
+                                   async_io=async_io, **parameters))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': workers,
+            'async_io': async_io,
+            'scale': scale,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(before, after, threshold=0.1):
+    """
+    Compares the times of two suite runs.
+
+    Args:
+        before (dict): The results of the baseline run.
+        after (dict): The results of the new run.
+        threshold (float): Relative slowdown above which an operation is a regression.
+
+    Returns:
+        list of dict: 'shape', 'operation', both times, the 'ratio' of the new time
+        to the old one and whether it is a 'regression'.
+    """
+    baseline = {(result['shape'], result['operation']): result['seconds']
+                for result in before['results']}
+    rows = []
+    for result in after['results']:
+        key = (result['shape'], result['operation'])
+        if key not in baseline:
+            continue
+        ratio = result['seconds'] / max(baseline[key], 1e-9)
+        rows.append({'shape': key[0], 'operation': key[1], 'before_s': baseline[key],
+                     'after_s': result['seconds'], 'ratio': ratio,
+                     'regression': ratio > 1 + threshold})
+    return rows
+
+
+def bench_workers(size_mb, worker_counts, chunk_size=container.DEFAULT_CHUNK_SIZE, use_threads=False):
+    """
+    Measures the encryption and decryption throughput for each number of workers.
+
+    Args:
+        size_mb (int): The amount of data to encrypt in MiB.
+        worker_counts (list of int): The numbers of workers to compare.
+        chunk_size (int): The size of a chunk in bytes.
+        use_threads (bool): If True, threads are used instead of processes.
+
+    Returns:
+        list of dict: Results with the number of workers, the time of encryption and
+        decryption in seconds and the speedup against the first number of workers.
+    """
+    key = os.urandom(32)
+    chunks = list(container.split_chunks(os.urandom(size_mb * 1024 * 1024), chunk_size))
+    results = []
+    for workers in worker_counts:
+        with ParallelEngine(workers, use_threads) as engine:
+            start = time.perf_counter()
+            tokens = list(engine.encrypt(key, chunks))
+            encrypt_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in engine.decrypt(key, tokens):
+                pass
+            decrypt_time = time.perf_counter() - start
+        results.append({'workers': workers, 'encrypt_s': encrypt_time, 'decrypt_s': decrypt_time})
+    for result in results:
+        result['speedup'] = (results[0]['encrypt_s'] + results[0]['decrypt_s']) \
+            / (result['encrypt_s'] + result['decrypt_s'])
+    return results
+
+
+def bench_compression(data, codecs, chunk_size=container.DEFAULT_CHUNK_SIZE):
+    """
+    Measures the cost and the gain of every compression codec on the data.
+
+    For every codec other than 'none' the crossover bandwidth is computed: the speed
+    of the disk or network below which writing and reading fewer bytes saves more time
+    than the codec spends. Compression pays off on storage slower than that.
+
+    Args:
+        data (bytes): The data to encrypt.
+        codecs (list of str): The names of the codecs to compare.
+        chunk_size (int): The size of a chunk in bytes.
+
+    Returns:
+        list of dict: Results with the codec, the time of encryption and decryption
+        in seconds, the size of the encrypted chunks, the ratio of the original size
+        to the encrypted size and the crossover bandwidth in MB/s. The crossover is None
+        if the codec does not make the data smaller and infinite if it is faster than 'none'.
+    """
+    key = os.urandom(32)
+    chunks = list(container.split_chunks(data, chunk_size))
+    results = []
+    with ParallelEngine() as engine:
+        for codec in [compressors.NONE] + [codec for codec in codecs if codec != compressors.NONE]:
+            start = time.perf_counter()
+            tokens = list(engine.encrypt(key, chunks, codec=codec))
+            encrypt_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in engine.decrypt(key, tokens, codec=codec):
+                pass
+            decrypt_time = time.perf_counter() - start
+            results.append({'codec': codec, 'encrypt_s': encrypt_time, 'decrypt_s': decrypt_time,
+                            'encrypted_bytes': sum(len(token) for token in tokens)})
+    baseline = results[0]
+    for result in results:
+        result['ratio'] = len(data) / result['encrypted_bytes']
+        saved = baseline['encrypted_bytes'] - result['encrypted_bytes']
+        extra = result['encrypt_s'] + result['decrypt_s'] - baseline['encrypt_s'] - baseline['decrypt_s']
+        if result is baseline or saved <= 0:
+            result['crossover_mb_per_s'] = None
+        elif extra <= 0:
+            result['crossover_mb_per_s'] = float('inf')
+        else:
+            result['crossover_mb_per_s'] = saved / extra / 1e6
+    return [result for result in results if result['codec'] in codecs]
+
+
+def bench_ciphers(data, names, chunk_size=container.DEFAULT_CHUNK_SIZE):
+    """
+    Measures the throughput and the size overhead of every cipher on the data.
+
+    Args:
+        data (bytes): The data to encrypt.
+        names (list of str): The names of the ciphers to compare.
+        chunk_size (int): The size of a chunk in bytes.
+
+    Returns:
+        list of dict: Results with the cipher, the time of encryption and decryption
+        in seconds, the size of the encrypted chunks and their overhead
+        relative to the size of the data.
+    """
+    key = os.urandom(32)
+    chunks = list(container.split_chunks(data, chunk_size))
+    results = []
+    with ParallelEngine() as engine:
+        for name in names:
+            drain(engine.encrypt(key, [b'import'], cipher=name))
+            start = time.perf_counter()
+            tokens = list(engine.encrypt(key, chunks, cipher=name))
+            encrypt_time = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in engine.decrypt(key, tokens, cipher=name):
+                pass
+            decrypt_time = time.perf_counter() - start
+            encrypted = sum(len(token) for token in tokens)
+            results.append({'cipher': name, 'encrypt_s': encrypt_time, 'decrypt_s': decrypt_time,
+                            'encrypted_bytes': encrypted, 'overhead': encrypted / len(data) - 1})
+    return results
+
+
+def bench_login(files=10, file_size=10000, params=None):
+    """
+    Measures the latency of a run of the program: checking the password
+    and then encrypting a small tree.
+
+    The 'plaintext' flow compares the password with the one saved in plain text
+    and derives the key of the data with a separate full key derivation.
+    The 'separate' flow checks the verifier but still derives the key of the data
+    separately, and the 'verifier' flow, used by the program, derives the key
+    of the data from the key of the password with HKDF. Every flow starts with
+    an empty key cache, as a new process does, but the modules are imported beforehand.
+
+    Args:
+        files (int): The number of files of the tree.
+        file_size (int): The approximate size of every file in bytes.
+        params (dict or None): The key derivation parameters, kdf.create_params() by default.
+
+    Returns:
+        list of dict: Results with the flow and the time of the login, of the first
+        operation and of both in seconds.
+    """
+    params = kdf.create_params() if params is None else params
+    with ParallelEngine() as engine:
+        drain(engine.encrypt(os.urandom(32), [b'import']))
+    root = tempfile.mkdtemp(prefix='cipher_benchmark_')
+    try:
+        directory = os.path.join(root, 'tree')
+        generate_tree(directory, files, file_size, 1)
+        password_file = os.path.join(root, 'password.txt')
+        results = []
+        for flow in ('plaintext', 'separate', 'verifier'):
+            key_cache = KeyCache()
+            if flow == 'plaintext':
+                with open(password_file, 'w', encoding='utf8') as file:
+                    file.write('password')
+                start = time.perf_counter()
+                correct = passwordfile.read_password_file(password_file) == 'password'
+                master_key = None
+            else:
+                passwordfile.write_password('password', password_file, params, KeyCache())
+                start = time.perf_counter()
+                master_key = passwordfile.verify_password('password', password_file, key_cache)
+                correct = master_key is not None
+                if flow == 'separate':
+                    master_key = None
+            login = time.perf_counter() - start
+            if not correct:
+                raise RuntimeError(f'The password was rejected in the {flow} flow')
+            encrypt_decrypt = EncryptDecrypt(directory, key_cache=key_cache, kdf_params=params,
+                                             master_key=master_key)
+            encrypt_decrypt.new_folder = Path(root, f'result_{flow}')
+            start = time.perf_counter()
+            encrypt_decrypt.save_encrypted_text()
+            operation = time.perf_counter() - start
+            results.append({'flow': flow, 'login_s': login, 'first_operation_s': operation,
+                            'total_s': login + operation})
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def main(args=None):
+    """
+    Parses the command-line arguments and prints the results of the chosen benchmark.
+
+    Returns:
+        int: The exit code, 1 if compare found a regression.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks of the Cipher machine')
+    benchmarks = parser.add_subparsers(dest='benchmark', required=True)
+    suite = benchmarks.add_parser('suite', help='Time the hot paths on generated directory trees')
+    suite.add_argument('--shape', help='Shapes of the trees', nargs='+', choices=sorted(SHAPES),
+                       default=sorted(SHAPES))
+    suite.add_argument('--scale', help='Factor applied to the number of files', type=float,
+                       default=1.0)
+    suite.add_argument('--workers', help='Number of workers', type=int, default=1)
+    suite.add_argument('--async-io', help='Use the asyncio pipeline', action='store_true')
+    suite.add_argument('--no-alloc', help='Do not measure allocations', action='store_true')
+    suite.add_argument('--output', help='Write the results as JSON to this file')
+    comparison = benchmarks.add_parser('compare', help='Compare two JSON results of the suite')
+    comparison.add_argument('before', help='JSON results of the baseline')
+    comparison.add_argument('after', help='JSON results to check')
+    comparison.add_argument('--threshold', help='Allowed relative slowdown', type=float, default=0.1)
+    workers = benchmarks.add_parser('workers', help='Speedup against the number of workers')
+    workers.add_argument('--size', help='Amount of data in MiB', type=int, default=64)
+    workers.add_argument('--workers', help='Numbers of workers to compare', type=int, nargs='+',
+                         default=[1, 2, 4, os.cpu_count() or 1])
+    workers.add_argument('--threads', help='Use threads instead of processes', action='store_true')
+    compression = benchmarks.add_parser('compression', help='Cost and gain of the compression codecs')
+    compression.add_argument('--size', help='Amount of data in MiB', type=int, default=16)
+    compression.add_argument('--data', help='Kinds of data', nargs='+', choices=['text', 'random'],
+                             default=['text', 'random'])
+    compression.add_argument('--codecs', help='Codecs to compare', nargs='+',
+                             choices=sorted(compressors.CODECS), default=sorted(compressors.CODECS))
+    cipher_parser = benchmarks.add_parser('ciphers', help='Throughput and overhead of the ciphers')
+    cipher_parser.add_argument('--size', help='Amount of data in MiB', type=int, default=64)
+    cipher_parser.add_argument('--ciphers', help='Ciphers to compare', nargs='+',
+                               choices=ciphers.CIPHERS, default=list(ciphers.CIPHERS))
+    login = benchmarks.add_parser('login', help='Latency of the password check and the first operation')
+    login.add_argument('--kdf', help='Key derivation of the password', choices=kdf.ALGORITHMS,
+                       default=kdf.PBKDF2)
+    login.add_argument('--kdf-cost', help='Iterations of pbkdf2-sha256 or N of scrypt', type=int)
+    args = parser.parse_args(args)
+
+    if args.benchmark == 'suite':
+        report = run_suite(args.shape, args.workers, not args.no_alloc, args.scale, args.async_io)
+        print(f'{"shape":<6} {"operation":<20} {"seconds":>9} {"MB/s":>9} {"files/s":>10} '
+              f'{"alloc KiB":>10}')
+        for result in report['results']:
+            alloc = '' if result['alloc_peak_bytes'] is None else result['alloc_peak_bytes'] // 1024
+            speed = '' if result['mb_per_s'] is None else f'{result["mb_per_s"]:.1f}'
+            print(f'{result["shape"]:<6} {result["operation"]:<20} {result["seconds"]:>9.4f} '
+                  f'{speed:>9} {result["files_per_s"]:>10.1f} {alloc:>10}')
+        if args.output:
+            with open(args.output, 'w', encoding='utf8') as file:
+                json.dump(report, file, indent=1)
+    elif args.benchmark == 'compare':
+        with open(args.before, encoding='utf8') as file:
+            before = json.load(file)
+        with open(args.after, encoding='utf8') as file:
+            after = json.load(file)
+        rows = compare(before, after, args.threshold)
+        for row in rows:
+            flag = 'REGRESSION' if row['regression'] else ''
+            print(f'{row["shape"]:<6} {row["operation"]:<20} {row["before_s"]:>9.4f} '
+                  f'{row["after_s"]:>9.4f} {row["ratio"]:>6.2f}x {flag}')
+        return 1 if any(row['regression'] for row in rows) else 0
+    elif args.benchmark == 'workers':
+        print(f'{"workers":>8} {"encrypt MB/s":>13} {"decrypt MB/s":>13} {"speedup":>8}')
+        for result in bench_workers(args.size, args.workers, use_threads=args.threads):
+            print(f'{result["workers"]:>8} {args.size / result["encrypt_s"]:>13.1f} '
+                  f'{args.size / result["decrypt_s"]:>13.1f} {result["speedup"]:>8.2f}')
+    elif args.benchmark == 'compression':
+        print(f'{"data":<7} {"codec":<6} {"encrypt MB/s":>13} {"decrypt MB/s":>13} {"ratio":>6} '
+              f'{"pays below MB/s":>16}')
+        for kind in args.data:
+            size = args.size * 1024 * 1024
+            data = generate_text(size) if kind == 'text' else os.urandom(size)
+            for result in bench_compression(data[:size], args.codecs):
+                crossover = '' if result['crossover_mb_per_s'] is None \
+                    else f'{result["crossover_mb_per_s"]:.1f}'
+                print(f'{kind:<7} {result["codec"]:<6} {args.size / result["encrypt_s"]:>13.1f} '
+                      f'{args.size / result["decrypt_s"]:>13.1f} {result["ratio"]:>6.2f} {crossover:>16}')
+    elif args.benchmark == 'ciphers':
+        print(f'{"cipher":<18} {"encrypt MB/s":>13} {"decrypt MB/s":>13} {"overhead %":>11}')
+        for result in bench_ciphers(os.urandom(args.size * 1024 * 1024), args.ciphers):
+            print(f'{result["cipher"]:<18} {args.size / result["encrypt_s"]:>13.1f} '
+                  f'{args.size / result["decrypt_s"]:>13.1f} {result["overhead"] * 100:>11.2f}')
+    elif args.benchmark == 'login':
+        print(f'{"flow":<10} {"login s":>9} {"first op s":>11} {"total s":>9}')
+        for result in bench_login(params=kdf.create_params(args.kdf, args.kdf_cost)):
+            print(f'{result["flow"]:<10} {result["login_s"]:>9.4f} {result["first_operation_s"]:>11.4f} '
+                  f'{result["total_s"]:>9.4f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+""" Module with tests for benchmark module"""
+
+import os
+import shutil
+import unittest
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Test suite for the benchmark harness.
+    """
+    def test_generate_tree(self):
+        """
+        Checks that the generated tree has the requested files and nesting.
+        """
+        try:
+            total = benchmark.generate_tree('temp_benchmark_tree', 6, 100, 3)
+            paths = [os.path.join(path, file) for path, _, files in os.walk('temp_benchmark_tree')
+                     for file in files]
+
+            self.assertEqual(len(paths), 6)
+            self.assertEqual(total, sum(os.path.getsize(path) for path in paths))
+            self.assertTrue(os.path.isdir(os.path.join('temp_benchmark_tree', 'level1', 'level2')))
+        finally:
+            shutil.rmtree('temp_benchmark_tree')
+
+    def test_bench_shape(self):
+        """
+        Checks that every hot path is measured on a tiny tree.
+        """
+        results = benchmark.bench_shape('tiny', files=3, file_size=200, depth=2)
+
+        self.assertEqual([result['operation'] for result in results],
+                         ['get_file', 'text_from_file', 'create_kdf', 'encrypt',
+                          'save_encrypted_text', 'decrypt', 'save_decrypted_text',
+                          'append_text_to_file'])
+        for result in results:
+            self.assertGreater(result['seconds'], 0)
+            self.assertIsNotNone(result['alloc_peak_bytes'])
+            self.assertGreaterEqual(result['alloc_retained_blocks'], 0)
+
+    def test_bench_compression(self):
+        """
+        Checks that compressible text gets a crossover bandwidth and random data does not.
+        """
+        text = benchmark.bench_compression(benchmark.generate_text(200000), ['none', 'zlib'])
+        random_data = benchmark.bench_compression(os.urandom(200000), ['zlib'])
+
+        self.assertEqual([result['codec'] for result in text], ['none', 'zlib'])
+        self.assertGreater(text[1]['ratio'], 2)
+        self.assertIsNotNone(text[1]['crossover_mb_per_s'])
+        self.assertIsNone(text[0]['crossover_mb_per_s'])
+        self.assertIsNone(random_data[0]['crossover_mb_per_s'])
+
+    def test_bench_ciphers(self):
+        """
+        Checks that every cipher is measured and that the AEAD ciphers store
+        the chunks in binary, with less overhead than the base64 of Fernet.
+        """
+        results = benchmark.bench_ciphers(os.urandom(200000), ['fernet', 'aes-gcm', 'chacha20-poly1305'])
+
+        self.assertEqual([result['cipher'] for result in results],
+                         ['fernet', 'aes-gcm', 'chacha20-poly1305'])
+        self.assertGreater(results[0]['overhead'], 0.3)
+        self.assertLess(results[1]['overhead'], 0.01)
+        self.assertLess(results[2]['overhead'], 0.01)
+
+    def test_bench_login(self):
+        """
+        Checks that the login flows are measured and that the verifier flow,
+        which derives the key only once, is faster than the separate derivations.
+        """
+        results = benchmark.bench_login(files=2, file_size=100,
+                                        params={'algorithm': 'pbkdf2-sha256', 'iterations': 200000})
+
+        self.assertEqual([result['flow'] for result in results], ['plaintext', 'separate', 'verifier'])
+        self.assertLess(results[2]['total_s'], results[1]['total_s'])
+
+    def test_compare(self):
+        """
+        Checks that an operation slower than the threshold is reported as a regression.
+        """
+        before = {'results': [{'shape': 'small', 'operation': 'encrypt', 'seconds': 1.0},
+                              {'shape': 'small', 'operation': 'decrypt', 'seconds': 1.0}]}
+        after = {'results': [{'shape': 'small', 'operation': 'encrypt', 'seconds': 1.05},
+                             {'shape': 'small', 'operation': 'decrypt', 'seconds': 1.5}]}
+
+        rows = benchmark.compare(before, after, threshold=0.1)
+
+        self.assertEqual([row['regression'] for row in rows], [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
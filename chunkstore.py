@@ -0,0 +1,190 @@
+"""
+Module with the content-addressed store of encrypted chunks.
+
+With deduplication, the chunks of the files of a per-file encrypted directory
+are saved once in the '.chunks' folder of the directory, whatever the number
+of files holding them:
+
+    result/<directory>.encrypt/.chunks/<id[:2]>/<id>
+
+The id of a chunk is an HMAC-SHA256 of its plaintext, the compression codec
+and the cipher, keyed with a key derived from the key of the directory, so
+the ids do not reveal the content. Every chunk is encrypted bound to the first
+64 bits of its id instead of its position in a file, so a chunk saved under
+another id fails to decrypt. Chunks are split at fixed offsets, so identical
+files and identical leading parts of files are stored once.
+
+Chunks are deduplicated only within one encrypted directory, not across
+directories: every directory has its own store, and the key of its chunks is
+derived from the salt of the directory, which is chosen when the directory is
+first encrypted. A chunk shared by two directories is stored in both.
+
+The chunks of a file are listed in order in its own encrypted container,
+'<path>.chunks', and the manifest of the directory records them as well,
+so unreferenced chunks are removed without decrypting every list.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+from collections import deque
+import kdf
+from instrumentation import stats
+from outputfile import atomic_output
+
+FOLDER = '.chunks'
+
+
+class ChunkStore:
+    """
+    Class saving encrypted chunks under their ids and reading them back.
+
+    Attributes:
+        folder (str): The path to the folder of the chunks.
+        key (bytes): The key encrypting the chunks.
+        codec (str): The name of the codec compressing the chunks.
+        cipher (str): The name of the cipher encrypting the chunks.
+        fsync (bool): If True, every chunk is flushed to the disk.
+
+    Methods:
+        chunk_id(chunk): Returns the id of a plaintext chunk.
+        store(engine, chunks): Saves the new chunks and returns the list of the file.
+        read(engine, refs): Yields the plaintext chunks of a list.
+    """
+    def __init__(self, folder, key, codec, cipher, fsync=False):
+        """
+        Initializes the ChunkStore object.
+
+        Args:
+            folder (str): The path to the folder of the chunks.
+            key (bytes): The key encrypting the chunks.
+            codec (str): The name of the codec compressing the chunks.
+            cipher (str): The name of the cipher encrypting the chunks.
+            fsync (bool): If True, every chunk is flushed to the disk.
+        """
+        self.folder = folder
+        self.key = key
+        self.codec = codec
+        self.cipher = cipher
+        self.fsync = fsync
+        self.id_key = kdf.hkdf(key, b'', b'chunk id')
+
+    def chunk_id(self, chunk):
+        """
+        Returns the id of a plaintext chunk.
+
+        Args:
+            chunk (bytes or memoryview): The plaintext chunk.
+
+        Returns:
+            str: The hex digest of the chunk, the codec and the cipher.
+        """
+        digest = hmac.new(self.id_key, f'{self.codec}\0{self.cipher}\0'.encode('ascii'), hashlib.sha256)
+        digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, chunk_id):
+        """
+        Returns the path of the chunk with the given id.
+        """
+        return os.path.join(self.folder, chunk_id[:2], chunk_id)
+
+    @staticmethod
+    def position(chunk_id):
+        """
+        Returns the position the chunk with the given id is bound to.
+        """
+        return int(chunk_id[:16], 16)
+
+    def store(self, engine, chunks):
+        """
+        Encrypts and saves the chunks which are not in the store yet.
+
+        Args:
+            engine (ParallelEngine): The engine encrypting the chunks.
+            chunks (Iterable[bytes or memoryview]): The plaintext chunks of a file.
+
+        Returns:
+            list: The id and the length of every chunk of the file, in order.
+        """
+        refs = []
+        new_ids = deque()
+        seen = set()
+
+        def new_chunks():
+            for chunk in chunks:
+                chunk_id = self.chunk_id(chunk)
+                refs.append([chunk_id, len(chunk)])
+                if chunk_id in seen or os.path.exists(self.path(chunk_id)):
+                    stats.count('chunks reused')
+                    continue
+                seen.add(chunk_id)
+                new_ids.append(chunk_id)
+                yield self.position(chunk_id), chunk
+
+        for token in engine.encrypt_indexed(self.key, new_chunks(), self.codec, self.cipher):
+            path = self.path(new_ids.popleft())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with stats.timer('write', len(token)), atomic_output(path, self.fsync) as file:
+                file.write(token)
+            stats.count('chunks stored')
+        return refs
+
+    def read(self, engine, refs):
+        """
+        Reads and decrypts the chunks of a file.
+
+        Args:
+            engine (ParallelEngine): The engine decrypting the chunks.
+            refs (list): The id and the length of every chunk of the file, in order.
+
+        Yields:
+            bytes: The plaintext chunks.
+        """
+        def tokens():
+            for chunk_id, _ in refs:
+                with open(self.path(chunk_id), 'rb') as file:
+                    yield self.position(chunk_id), file.read()
+
+        items = stats.iter_timed('read', tokens(), lambda item: len(item[1]))
+        yield from engine.decrypt_indexed(self.key, items, self.codec, self.cipher)
+
+
+def collect_garbage(folder, referenced):
+    """
+    Removes the chunks of a store which are not in the given set of ids.
+
+    Args:
+        folder (str): The path to the folder of the chunks.
+        referenced (set of str): The ids of the chunks still listed by a file.
+
+    Returns:
+        int: The number of removed chunks.
+    """
+    removed = 0
+    if not os.path.isdir(folder):
+        return removed
+    for prefix in os.scandir(folder):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if entry.name not in referenced and len(entry.name) == 64:
+                os.remove(entry.path)
+                removed += 1
+    stats.count('chunks removed', removed)
+    return removed
+
+
+def encode_refs(refs):
+    """
+    Encodes the chunk list of a file as saved in its encrypted '.chunks' container.
+    """
+    return json.dumps({'version': 1, 'chunks': refs}).encode('utf-8')
+
+
+def decode_refs(data):
+    """
+    Decodes the chunk list of a file from the content of its '.chunks' container.
+    """
+    return json.loads(data)['chunks']
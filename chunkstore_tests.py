@@ -0,0 +1,63 @@
+""" Module with tests for the chunkstore module"""
+
+import os
+import shutil
+import unittest
+import chunkstore
+import container
+from engine import ParallelEngine
+
+
+class TestChunkStore(unittest.TestCase):
+    """
+    Test suite for the content-addressed chunk store.
+    """
+    def setUp(self):
+        self.folder = 'random_directory18'
+        self.store = chunkstore.ChunkStore(self.folder, os.urandom(32), 'none', 'aes-gcm')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def stored_ids(self):
+        return {name for _, _, names in os.walk(self.folder) for name in names}
+
+    def test_store_and_read(self):
+        """
+        Checks that identical chunks are saved once and read back in order.
+        """
+        with ParallelEngine() as engine:
+            refs = self.store.store(engine, [b'same', b'other', b'same'])
+            again = self.store.store(engine, [b'other'])
+            self.assertEqual(list(self.store.read(engine, refs)), [b'same', b'other', b'same'])
+
+        self.assertEqual(refs[0], refs[2])
+        self.assertEqual(again, [refs[1]])
+        self.assertEqual(self.stored_ids(), {refs[0][0], refs[1][0]})
+        self.assertNotEqual(chunkstore.ChunkStore(self.folder, os.urandom(32), 'none', 'aes-gcm')
+                            .chunk_id(b'same'), refs[0][0])
+
+    def test_swapped_chunk(self):
+        """
+        Checks that a chunk saved under the id of another one fails to decrypt.
+        """
+        with ParallelEngine() as engine:
+            first, second = self.store.store(engine, [b'first', b'second'])
+            shutil.copyfile(self.store.path(second[0]), self.store.path(first[0]))
+            with self.assertRaises(container.ContainerError):
+                list(self.store.read(engine, [first]))
+
+    def test_collect_garbage(self):
+        """
+        Checks that only the chunks missing from the given ids are removed.
+        """
+        with ParallelEngine() as engine:
+            kept, dropped = self.store.store(engine, [b'kept', b'dropped'])
+
+        self.assertEqual(chunkstore.collect_garbage(self.folder, {kept[0]}), 1)
+        self.assertEqual(self.stored_ids(), {kept[0]})
+        self.assertFalse(os.path.exists(self.store.path(dropped[0])))
+
+
+if __name__ == '__main__':
+    unittest.main()
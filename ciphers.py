@@ -0,0 +1,108 @@
+"""
+Module with the ciphers encrypting the chunks of the containers.
+
+Every cipher binds a chunk to its position in the container, so reordered
+or dropped chunks fail to decrypt:
+
+    fernet             AES-128-CBC with HMAC-SHA256, as base64 text. The position
+                       is encrypted in front of the chunk.
+    aes-gcm            AES-256-GCM, raw binary, fast with AES-NI.
+    chacha20-poly1305  ChaCha20-Poly1305, raw binary, fast without AES-NI.
+
+The AEAD ciphers store a random 96-bit nonce in front of the ciphertext and
+authenticate the position as associated data, so it costs no space. Nonces
+are random rather than counters because a container may be rewritten with
+the same key. The name of the cipher is stored in the header of the container.
+"""
+
+import base64
+import os
+import struct
+
+FERNET = 'fernet'
+AES_GCM = 'aes-gcm'
+CHACHA20 = 'chacha20-poly1305'
+CIPHERS = (FERNET, AES_GCM, CHACHA20)
+NONCE_SIZE = 12
+_INDEX = struct.Struct('>Q')
+
+
+class InvalidChunk(Exception):
+    """ Raised when a chunk was not encrypted at the expected position or with the key. """
+
+
+def check_cipher(name):
+    """
+    Checks that the cipher is known.
+
+    Args:
+        name (str): The name of the cipher.
+
+    Raises:
+        ValueError: If there is no cipher with that name.
+    """
+    if name not in CIPHERS:
+        raise ValueError(f'Unknown cipher: {name}')
+
+
+class FernetCipher:
+    """
+    Class encrypting chunks with Fernet, the position being encrypted with the chunk.
+    """
+    def __init__(self, key):
+        from cryptography.fernet import Fernet
+        self.fernet = Fernet(base64.urlsafe_b64encode(key))
+
+    def encrypt(self, index, data):
+        return self.fernet.encrypt(_INDEX.pack(index) + data)
+
+    def decrypt(self, index, token):
+        from cryptography.fernet import InvalidToken
+        try:
+            data = self.fernet.decrypt(token)
+        except InvalidToken as error:
+            raise InvalidChunk(f'Chunk {index} is damaged or has another key') from error
+        if _INDEX.unpack_from(data)[0] != index:
+            raise InvalidChunk(f'Chunk {index} is out of order')
+        return data[_INDEX.size:]
+
+
+class AeadCipher:
+    """
+    Class encrypting chunks with an AEAD cipher, the position being the associated data.
+    """
+    def __init__(self, algorithm, key):
+        self.aead = algorithm(key)
+
+    def encrypt(self, index, data):
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self.aead.encrypt(nonce, data, _INDEX.pack(index))
+
+    def decrypt(self, index, token):
+        from cryptography.exceptions import InvalidTag
+        try:
+            return self.aead.decrypt(token[:NONCE_SIZE], token[NONCE_SIZE:], _INDEX.pack(index))
+        except InvalidTag as error:
+            raise InvalidChunk(f'Chunk {index} is out of order, damaged or has another key') from error
+
+
+def create_cipher(name, key):
+    """
+    Creates the cipher with the given name.
+
+    Args:
+        name (str): One of CIPHERS.
+        key (bytes): The 32 byte derived key.
+
+    Returns:
+        FernetCipher or AeadCipher: The object with encrypt(index, data)
+        and decrypt(index, token) methods.
+    """
+    check_cipher(name)
+    if name == FERNET:
+        return FernetCipher(key)
+    if name == AES_GCM:
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        return AeadCipher(AESGCM, key)
+    from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+    return AeadCipher(ChaCha20Poly1305, key)
@@ -0,0 +1,52 @@
+""" Module with tests for the ciphers module"""
+
+import os
+import unittest
+import ciphers
+
+
+class TestCiphers(unittest.TestCase):
+    """
+    Test suite for the ciphers encrypting the chunks.
+    """
+    def setUp(self):
+        self.key = os.urandom(32)
+
+    def test_round_trip(self):
+        """
+        Checks that every cipher decrypts what it encrypted, and that the AEAD ciphers
+        add only the nonce and the tag.
+        """
+        for name in ciphers.CIPHERS:
+            cipher = ciphers.create_cipher(name, self.key)
+            for data in (b'', b'chunk' * 1000):
+                token = cipher.encrypt(3, data)
+                self.assertEqual(cipher.decrypt(3, token), data)
+                if name != ciphers.FERNET:
+                    self.assertEqual(len(token), len(data) + ciphers.NONCE_SIZE + 16)
+
+    def test_position_and_tampering(self):
+        """
+        Checks that a chunk decrypted at another position, modified or decrypted
+        with another key is rejected.
+        """
+        for name in ciphers.CIPHERS:
+            cipher = ciphers.create_cipher(name, self.key)
+            token = cipher.encrypt(0, b'chunk')
+            with self.assertRaises(ciphers.InvalidChunk):
+                cipher.decrypt(1, token)
+            with self.assertRaises(ciphers.InvalidChunk):
+                cipher.decrypt(0, token[:-1] + bytes([token[-1] ^ 1]))
+            with self.assertRaises(ciphers.InvalidChunk):
+                ciphers.create_cipher(name, os.urandom(32)).decrypt(0, token)
+
+    def test_unknown_cipher(self):
+        """
+        Checks that an unknown cipher is rejected.
+        """
+        with self.assertRaises(ValueError):
+            ciphers.create_cipher('des', self.key)
+
+
+if __name__ == '__main__':
+    unittest.main()
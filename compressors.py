@@ -0,0 +1,62 @@
+"""
+Module with the codecs compressing chunks before they are encrypted.
+
+Ciphertext does not compress, so the chunks are compressed before encryption.
+Every chunk is compressed on its own, which keeps random access to the chunks
+and lets the workers compress in parallel. The name of the codec is stored
+in the header of the container.
+"""
+
+import lzma
+import zlib
+
+NONE = 'none'
+CODECS = {
+    NONE: (bytes, bytes),
+    'zlib': (zlib.compress, zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+def check_codec(codec):
+    """
+    Checks that the codec is known.
+
+    Args:
+        codec (str): The name of the codec.
+
+    Raises:
+        ValueError: If there is no codec with that name.
+    """
+    if codec not in CODECS:
+        raise ValueError(f'Unknown compression: {codec}')
+
+
+def compress(codec, data):
+    """
+    Compresses a chunk with the codec.
+
+    Args:
+        codec (str): The name of the codec.
+        data (bytes or memoryview): The chunk.
+
+    Returns:
+        bytes: The compressed chunk, or the unchanged chunk for 'none'.
+    """
+    check_codec(codec)
+    return CODECS[codec][0](data)
+
+
+def decompress(codec, data):
+    """
+    Decompresses a chunk compressed with the codec.
+
+    Args:
+        codec (str): The name of the codec.
+        data (bytes): The compressed chunk.
+
+    Returns:
+        bytes: The original chunk.
+    """
+    check_codec(codec)
+    return CODECS[codec][1](data)
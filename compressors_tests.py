@@ -0,0 +1,31 @@
+""" Module with tests for compressors module"""
+
+import unittest
+import compressors
+
+
+class TestCompressors(unittest.TestCase):
+    """
+    Test suite for the compression codecs.
+    """
+    def test_round_trip(self):
+        """
+        Checks that every codec restores the data and that text gets smaller.
+        """
+        data = b'kacper kamil oliwia\n' * 500
+        for codec in compressors.CODECS:
+            compressed = compressors.compress(codec, memoryview(data))
+            self.assertEqual(compressors.decompress(codec, compressed), data)
+            if codec != compressors.NONE:
+                self.assertLess(len(compressed), len(data) // 10)
+
+    def test_unknown_codec(self):
+        """
+        Checks that an unknown codec is rejected.
+        """
+        with self.assertRaises(ValueError):
+            compressors.compress('brotli', b'data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,477 @@
+"""
+Module with the chunked container format used for encrypted files.
+
+A container starts with a magic value and a length-prefixed JSON header
+describing the chunk size, the key derivation parameters and a random id. The chunks
+are encrypted with a key derived from the derived key and the id, so every container
+has its own key even when several of them share the key derivation. The header is followed
+by records, each one being a length-prefixed token holding a single encrypted chunk.
+Every chunk is bound to its position, so reordered or dropped chunks fail to decrypt.
+Chunks may be compressed before encryption with the codec named in the header,
+and are encrypted with the cipher named in the header, Fernet by default.
+
+The records are followed by a trailing index with the offset of every record,
+the offset and length of its plaintext and a SHA-256 digest of the record, and by
+a footer pointing at the index. The footer holds an HMAC-SHA256 of the header,
+the index and its offset, keyed with a key derived from the key of the container.
+Records are read at the offsets of the index and checked against their digests,
+so dropped trailing records, records copied from another container with the same
+key and an index copied from another container are detected. Containers without
+the HMAC are rejected.
+
+New records are appended after the footer, followed by a new index of all the records
+and a new footer, so appending costs time proportional to the new data and the size
+of the index. The previous index stays valid until the new footer is written: a reader
+which finds no footer at the end of the file uses the last valid one before it,
+so an interrupted append leaves the previous content, and the next append removes
+what it left. The footer counts the bytes of the replaced indexes, and the container
+is rewritten without them once they make up half of it.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import ciphers
+import compressors
+import kdf
+from instrumentation import stats
+
+MAGIC = b'CIPHERM1'
+DEFAULT_CHUNK_SIZE = 64 * 1024
+_LENGTH = struct.Struct('>I')
+INDEX_MAGIC = b'CMINDEX2'
+_ENTRY = struct.Struct('>QQI16s')
+_DIGEST_SIZE = 16
+_OFFSET = struct.Struct('>Q')
+_FOOTER = struct.Struct('>QQ32s8s')
+_SEARCH_BLOCK = 64 * 1024
+
+
+class ContainerError(Exception):
+    """ Raised when a container is malformed or its chunks are out of order. """
+
+
+def is_container(path):
+    """
+    Checks whether the file at the given path is a chunked container.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        bool: True if the file starts with the container magic value.
+    """
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def split_chunks(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Splits data into chunks of at most chunk_size bytes.
+
+    Args:
+        data (bytes): The data to split.
+        chunk_size (int): The maximal size of a chunk.
+
+    Yields:
+        bytes: Consecutive chunks of the data.
+    """
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+
+def write_header(file, header):
+    """
+    Writes the magic value and the header to a binary file.
+
+    Args:
+        file (BinaryIO): The file opened for writing.
+        header (dict): The header, it has to be serializable to JSON.
+
+    Returns:
+        bytes: The encoded header, authenticated by the index.
+    """
+    encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+    file.write(MAGIC)
+    file.write(_LENGTH.pack(len(encoded)))
+    file.write(encoded)
+    return encoded
+
+
+def read_header(file):
+    """
+    Reads the magic value and the header from a binary file.
+
+    Args:
+        file (BinaryIO): The file opened for reading, positioned at its beginning.
+
+    Returns:
+        dict: The header of the container.
+    """
+    return json.loads(_read_header_data(file).decode('utf-8'))
+
+
+def _read_header_data(file):
+    """
+    Reads the magic value and returns the encoded header.
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ContainerError('The file is not an encrypted container')
+    (length,) = _LENGTH.unpack(_read_exactly(file, _LENGTH.size))
+    return _read_exactly(file, length)
+
+
+def header_codec(header):
+    """
+    Returns the name of the codec the chunks of a container were compressed with.
+
+    Args:
+        header (dict): The header of the container.
+
+    Returns:
+        str: The name of the codec, 'none' for containers written without compression.
+    """
+    codec = header.get('compression', compressors.NONE)
+    try:
+        compressors.check_codec(codec)
+    except ValueError as error:
+        raise ContainerError(str(error)) from error
+    return codec
+
+
+def container_key(key, header):
+    """
+    Derives the key of the chunks of a container from the key of its key derivation.
+
+    Args:
+        key (bytes): The key derived with the key derivation of the header.
+        header (dict): The header of the container.
+
+    Returns:
+        bytes: The key bound to the id of the container, the key itself
+        for containers written before the id was recorded.
+    """
+    if 'id' not in header:
+        return key
+    try:
+        container_id = base64.b64decode(header['id'], validate=True)
+    except (ValueError, TypeError) as error:
+        raise ContainerError(f'Invalid container id: {error}') from error
+    return kdf.hkdf(key, container_id, b'container chunks')
+
+
+def header_cipher(header):
+    """
+    Returns the name of the cipher the chunks of a container were encrypted with.
+
+    Args:
+        header (dict): The header of the container.
+
+    Returns:
+        str: The name of the cipher, 'fernet' for containers written before it was recorded.
+    """
+    cipher = header.get('cipher', ciphers.FERNET)
+    try:
+        ciphers.check_cipher(cipher)
+    except ValueError as error:
+        raise ContainerError(str(error)) from error
+    return cipher
+
+
+def write_record(file, token):
+    """
+    Writes a single length-prefixed record to a binary file.
+
+    Args:
+        file (BinaryIO): The file opened for writing.
+        token (bytes): The encrypted chunk.
+    """
+    file.write(_LENGTH.pack(len(token)))
+    file.write(token)
+
+
+def read_records(file, entries):
+    """
+    Reads the records listed by the index of a container and checks their digests.
+
+    Args:
+        file (BinaryIO): The seekable container.
+        entries (list): The index entries of the records to read, see read_index().
+
+    Yields:
+        bytes: The encrypted chunks in the order of the entries.
+
+    Raises:
+        ContainerError: If a record does not match the digest of its entry.
+    """
+    for record_offset, _, _, digest in entries:
+        if file.tell() != record_offset:
+            file.seek(record_offset)
+        (length,) = _LENGTH.unpack(_read_exactly(file, _LENGTH.size))
+        with stats.timer('read', length):
+            token = _read_exactly(file, length)
+        if not hmac.compare_digest(token_digest(token), digest):
+            raise ContainerError(f'The record at {record_offset} does not match the index')
+        yield token
+
+
+def token_digest(token):
+    """
+    Returns the digest of a record stored in its index entry.
+    """
+    return hashlib.sha256(token).digest()[:_DIGEST_SIZE]
+
+
+def index_key(key):
+    """
+    Derives the key authenticating the index of a container from the key of its chunks.
+    """
+    return kdf.hkdf(key, b'', b'container index')
+
+
+def _index_mac(key, header_data, data, index_offset, dead_size):
+    """
+    Computes the HMAC of the encoded header, the encoded index, the offset of the index
+    and the size of the replaced indexes.
+    """
+    digest = hmac.new(index_key(key), _LENGTH.pack(len(header_data)), hashlib.sha256)
+    digest.update(header_data)
+    digest.update(data)
+    digest.update(_OFFSET.pack(index_offset))
+    digest.update(_OFFSET.pack(dead_size))
+    return digest.digest()
+
+
+def _read_footer(file, key, header_data, end):
+    """
+    Reads and authenticates the index whose footer ends at the given offset.
+
+    Returns:
+        tuple of (list, int, int) or None: The index entries, the offset of the index
+        and the size of the replaced indexes, None if there is no footer at the offset.
+    """
+    if end < _FOOTER.size:
+        return None
+    file.seek(end - _FOOTER.size)
+    index_offset, dead_size, mac, magic = _FOOTER.unpack(file.read(_FOOTER.size))
+    if magic != INDEX_MAGIC:
+        return None
+    index_size = end - _FOOTER.size - index_offset
+    if index_size < 0 or index_size % _ENTRY.size:
+        raise ContainerError('The index of the container is damaged')
+    file.seek(index_offset)
+    data = _read_exactly(file, index_size)
+    if not hmac.compare_digest(mac, _index_mac(key, header_data, data, index_offset, dead_size)):
+        raise ContainerError('The index of the container is damaged or has another key')
+    return list(_ENTRY.iter_unpack(data)), index_offset, dead_size
+
+
+def _footer_ends(file, end):
+    """
+    Yields the offsets where a footer may end before the given offset, the last one first.
+    """
+    position = end
+    while position > 0:
+        start = max(position - _SEARCH_BLOCK, 0)
+        file.seek(start)
+        block = file.read(min(position + len(INDEX_MAGIC), end) - start)
+        found = position - start
+        while (found := block.rfind(INDEX_MAGIC, 0, found + len(INDEX_MAGIC) - 1)) >= 0:
+            yield start + found + len(INDEX_MAGIC)
+        position = start
+
+
+def find_index(file, key):
+    """
+    Finds and authenticates the index of a container, skipping an interrupted append.
+
+    If the file does not end with a footer, the last valid footer before its end is used,
+    so the records and the index written by an interrupted append are ignored.
+    The position of the file is not preserved.
+
+    Args:
+        file (BinaryIO): The container opened for reading.
+        key (bytes): The key of the chunks of the container.
+
+    Returns:
+        tuple of (list, int, int, int): The index entries, the offset where the index
+        starts, the size of the indexes it replaced and the offset where its footer ends.
+
+    Raises:
+        ContainerError: If the index is missing, damaged or written with another key.
+    """
+    file.seek(0)
+    header_data = _read_header_data(file)
+    size = file.seek(0, 2)
+    index = _read_footer(file, key, header_data, size)
+    if index is not None:
+        return (*index, size)
+    for end in _footer_ends(file, size):
+        try:
+            index = _read_footer(file, key, header_data, end)
+        except ContainerError:
+            continue
+        if index is not None:
+            stats.count('interrupted appends skipped')
+            return (*index, end)
+    raise ContainerError('The container is truncated, its index is missing')
+
+
+def read_index(file, key):
+    """
+    Reads and authenticates the trailing index of a container.
+
+    The position of the file is not preserved.
+
+    Args:
+        file (BinaryIO): The container opened for reading.
+        key (bytes): The key of the chunks of the container.
+
+    Returns:
+        tuple of (list, int): The index entries, each one a tuple of the record
+        offset, the plaintext offset, the plaintext length and the digest of the record,
+        and the offset where the index starts.
+
+    Raises:
+        ContainerError: If the index is missing, damaged or written with another key.
+    """
+    entries, index_offset, _, _ = find_index(file, key)
+    return entries, index_offset
+
+
+def append_writer(file, key):
+    """
+    Creates the writer appending records to a container after its footer.
+
+    What an interrupted append left after the footer is removed first.
+
+    Args:
+        file (BinaryIO): The container opened for reading and writing.
+        key (bytes): The key of the chunks of the container.
+
+    Returns:
+        ContainerWriter: The writer, positioned after the footer.
+    """
+    entries, index_offset, dead_size, end = find_index(file, key)
+    file.seek(0)
+    header_data = _read_header_data(file)
+    file.seek(end)
+    file.truncate()
+    return ContainerWriter(file, key, header_data, entries, dead_size + end - index_offset)
+
+
+class ContainerWriter:
+    """
+    Class writing records to a container and the authenticated index after them.
+
+    Attributes:
+        file (BinaryIO): The file opened for writing, positioned where the next record goes.
+        key (bytes): The key of the chunks, authenticating the index.
+        header_data (bytes): The encoded header, authenticated by the index.
+        entries (list): The index entries of the records written so far.
+        dead_size (int): The size of the replaced indexes left between the records.
+
+    Methods:
+        write(token, length): Writes a record holding a chunk of the given plaintext length.
+        finish(): Writes the index and the footer.
+    """
+    def __init__(self, file, key, header_data, entries=None, dead_size=0):
+        """
+        Initializes the ContainerWriter object.
+
+        Args:
+            file (BinaryIO): The file opened for writing.
+            key (bytes): The key of the chunks, authenticating the index.
+            header_data (bytes): The encoded header returned by write_header().
+            entries (list or None): The index entries of the records already in the file.
+            dead_size (int): The size of the replaced indexes already in the file.
+        """
+        self.file = file
+        self.key = key
+        self.header_data = header_data
+        self.entries = [] if entries is None else entries
+        self.dead_size = dead_size
+
+    @property
+    def plaintext_size(self):
+        """
+        Returns the total length of the plaintext of the records.
+        """
+        if not self.entries:
+            return 0
+        _, offset, length, _ = self.entries[-1]
+        return offset + length
+
+    def write(self, token, length):
+        """
+        Writes a record and adds it to the index.
+
+        Args:
+            token (bytes): The encrypted chunk.
+            length (int): The length of the plaintext chunk.
+        """
+        self.entries.append((self.file.tell(), self.plaintext_size, length, token_digest(token)))
+        with stats.timer('write', _LENGTH.size + len(token)):
+            write_record(self.file, token)
+
+    def finish(self):
+        """
+        Writes the index and the footer with its HMAC after the records.
+        """
+        index_offset = self.file.tell()
+        data = b''.join(_ENTRY.pack(*entry) for entry in self.entries)
+        mac = _index_mac(self.key, self.header_data, data, index_offset, self.dead_size)
+        self.file.write(data)
+        self.file.write(_FOOTER.pack(index_offset, self.dead_size, mac, INDEX_MAGIC))
+
+
+def encrypt_chunk(cipher, index, chunk, codec=compressors.NONE):
+    """
+    Compresses a chunk and encrypts it together with its position in the container.
+
+    Args:
+        cipher (FernetCipher or AeadCipher): The cipher created by ciphers.create_cipher().
+        index (int): The position of the chunk.
+        chunk (bytes): The plaintext chunk.
+        codec (str): The name of the compression codec.
+
+    Returns:
+        bytes: The encrypted chunk.
+    """
+    if codec != compressors.NONE:
+        chunk = compressors.compress(codec, chunk)
+    return cipher.encrypt(index, chunk)
+
+
+def decrypt_chunk(cipher, index, token, codec=compressors.NONE):
+    """
+    Decrypts a chunk, checks that it was stored at the expected position and decompresses it.
+
+    Args:
+        cipher (FernetCipher or AeadCipher): The cipher created by ciphers.create_cipher().
+        index (int): The expected position of the chunk.
+        token (bytes): The encrypted chunk.
+        codec (str): The name of the compression codec.
+
+    Returns:
+        bytes: The plaintext chunk.
+    """
+    try:
+        data = cipher.decrypt(index, token)
+    except ciphers.InvalidChunk as error:
+        raise ContainerError(str(error)) from error
+    if codec != compressors.NONE:
+        return compressors.decompress(codec, data)
+    return data
+
+
+def _read_exactly(file, size):
+    """
+    Reads exactly size bytes from a file.
+    """
+    data = file.read(size)
+    if len(data) != size:
+        raise ContainerError('The container is truncated')
+    return data
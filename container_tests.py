@@ -0,0 +1,129 @@
+""" Module with tests for container module"""
+
+import io
+import unittest
+import container
+
+KEY = b'0' * 32
+
+
+class TestContainer(unittest.TestCase):
+    """
+    Test suite for reading and writing chunked containers.
+    """
+    def test_header_and_records(self):
+        """
+        Checks that the header and records are read back as they were written.
+        """
+        file = io.BytesIO()
+        writer = container.ContainerWriter(file, KEY, container.write_header(file, {'chunk_size': 4}))
+        for token in [b'first', b'', b'second']:
+            writer.write(token, 4)
+        writer.finish()
+        file.seek(0)
+
+        self.assertEqual(container.read_header(file), {'chunk_size': 4})
+        entries, _ = container.read_index(file, KEY)
+        self.assertEqual(list(container.read_records(file, entries)), [b'first', b'', b'second'])
+
+    def test_truncated_record(self):
+        """
+        Checks that a record cut in the middle is reported as an error.
+        """
+        file = io.BytesIO()
+        container.write_record(file, b'first')
+
+        with self.assertRaises(container.ContainerError):
+            list(container.read_records(io.BytesIO(file.getvalue()[:-1]),
+                                        [(0, 0, 4, container.token_digest(b'first'))]))
+
+    def test_not_a_container(self):
+        """
+        Checks that a file without the magic value is rejected.
+        """
+        with self.assertRaises(container.ContainerError):
+            container.read_header(io.BytesIO(b'gAAAAA\n'))
+
+    def test_index(self):
+        """
+        Checks that the index records every record, also after records are appended
+        after the old index, and that the replaced index is counted.
+        """
+        file = io.BytesIO()
+        writer = container.ContainerWriter(file, KEY, container.write_header(file, {'chunk_size': 4}))
+        writer.write(b'first', 4)
+        writer.write(b'second', 2)
+        writer.finish()
+        writer = container.append_writer(file, KEY)
+        writer.write(b'third', 3)
+        writer.finish()
+        file.seek(0)
+        container.read_header(file)
+        entries, _, dead_size, _ = container.find_index(file, KEY)
+
+        self.assertEqual(list(container.read_records(file, entries)), [b'first', b'second', b'third'])
+        self.assertEqual([entry[1:3] for entry in entries], [(0, 4), (4, 2), (6, 3)])
+        self.assertEqual(dead_size, 2 * 36 + 56)
+
+    def test_interrupted_append(self):
+        """
+        Checks that the previous index is used while an append is incomplete,
+        and that the next append removes what the interrupted one left.
+        """
+        file = io.BytesIO()
+        writer = container.ContainerWriter(file, KEY, container.write_header(file, {'chunk_size': 4}))
+        writer.write(b'first', 4)
+        writer.finish()
+        committed = file.getvalue()
+        writer = container.append_writer(file, KEY)
+        writer.write(b'second', 4)
+        writer.finish()
+        complete = file.getvalue()
+
+        for size in range(len(committed), len(complete)):
+            entries, _ = container.read_index(io.BytesIO(complete[:size]), KEY)
+            self.assertEqual(len(entries), 1)
+        file = io.BytesIO(complete[:-1])
+        writer = container.append_writer(file, KEY)
+        writer.write(b'third', 4)
+        writer.finish()
+        entries, _ = container.read_index(file, KEY)
+        self.assertEqual(list(container.read_records(file, entries)), [b'first', b'third'])
+
+    def test_unauthenticated_end(self):
+        """
+        Checks that a container cut between records, without its index, with an index
+        of another key, with the index of another container or with a record of another
+        container is rejected.
+        """
+        containers = []
+        for tokens in [[b'aaaa', b'bbbb', b'cccc'], [b'dddd', b'eeee', b'ffff']]:
+            file = io.BytesIO()
+            writer = container.ContainerWriter(file, KEY,
+                                               container.write_header(file, {'chunk_size': 4}))
+            for token in tokens:
+                writer.write(token, 4)
+            writer.finish()
+            containers.append((file.getvalue(), writer.entries))
+        (data, entries), (other, other_entries) = containers
+        second, third = entries[1][0], entries[2][0]
+        index_offset = other_entries[-1][0] + 8
+
+        for damaged, key in [(data[:third], KEY), (data, b'k' * 32),
+                             (data[:third] + other[third:], KEY),
+                             (data[:second] + other[second:third] + data[third:], KEY),
+                             (data[:index_offset] + other[index_offset:], KEY),
+                             (data[:-1], KEY)]:
+            with self.assertRaises(container.ContainerError):
+                file = io.BytesIO(damaged)
+                list(container.read_records(file, container.read_index(file, key)[0]))
+
+    def test_split_chunks(self):
+        """
+        Checks that the data is split into chunks of the given size.
+        """
+        self.assertEqual(list(container.split_chunks(b'abcdefg', 3)), [b'abc', b'def', b'g'])
+
+
+if __name__ == '__main__':
+    unittest.main()
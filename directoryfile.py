@@ -1,7 +1,13 @@
 """ This module defines the DirectoryFile class for performing file operations in a specified directory. """
+import mmap
 import os
-from os import walk
+from fnmatch import fnmatch
 from os.path import isdir
+from fileindex import fast_digest
+from instrumentation import stats
+from scanner import DEFAULT_EXCLUDE, DEFAULT_INCLUDE, scan
+
+MMAP_THRESHOLD = 4 * 1024 * 1024
 
 
 class DirectoryFile:
@@ -10,20 +16,109 @@ class DirectoryFile:
 
     Attributes:
         directory (str): The path to the directory where file operations will be performed.
+        include (tuple of str): Globs of the file names to process.
+        exclude (tuple of str): Globs of the files and directories to skip.
+        file_index (FileIndex or None): The index of files seen in previous runs.
+        mmap_threshold (int): The size from which files are memory-mapped instead of read.
 
     Methods:
+        iter_file(): Yields paths to text files in the specified directory one by one.
+        iter_stat(): Yields paths to text files together with their stat data.
+        iter_changes(): Yields paths to text files and whether they changed since the last run.
         get_file(): Returns a list of paths to text files in the specified directory.
         text_from_file(): Reads the content of text files in the directory and concatenates them into a single text.
+        iter_words(): Yields the words of the text files without reading whole files into memory.
+        iter_bytes(chunk_size): Yields the content of the text files in blocks of chunk_size bytes.
+        read_blocks(file, chunk_size): Yields the content of a single file in blocks of chunk_size bytes.
+        relative_path(file): Returns the path of a file relative to the specified directory.
         append_text_to_file(text, file_name): Appends the specified text to an existing file with the given name.
     """
-    def __init__(self, directory: str):
+    def __init__(self, directory: str, include=DEFAULT_INCLUDE, exclude=DEFAULT_EXCLUDE,
+                 file_index=None):
         """
         Initializes the DirectoryFile object.
 
         Args:
             directory (str): The path to the directory where file operations will be performed.
+            include (Iterable[str]): Globs of the file names to process, '*.txt' by default.
+            exclude (Iterable[str]): Globs of the files and directories to skip. Rules from
+                '.cipherignore' files in the directory are applied as well.
+            file_index (FileIndex or None): The index of files seen in previous runs.
         """
         self.directory = directory
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.file_index = file_index
+        self.mmap_threshold = MMAP_THRESHOLD
+
+    def iter_stat(self):
+        """
+        Yields paths to text files in the specified directory together with their stat data.
+
+        The directory is scanned with os.scandir, so the stat data is the one
+        cached by the directory entries.
+
+        Yields:
+            tuple of (str, os.stat_result): Path to a text file and its stat data.
+        """
+        if isdir(self.directory):
+            for entry in stats.iter_timed('scan', scan(self.directory, self.include, self.exclude), None):
+                yield entry.path, entry.stat()
+        elif any(fnmatch(os.path.basename(self.directory), pattern) for pattern in self.include):
+            yield self.directory, os.stat(self.directory)
+
+    def iter_file(self):
+        """
+        Yields paths to text files in the specified directory as they are found.
+
+        Yields:
+            str: Path to a text file (file with a .txt extension by default).
+        """
+        if isdir(self.directory):
+            for entry in stats.iter_timed('scan', scan(self.directory, self.include, self.exclude), None):
+                yield entry.path
+        elif any(fnmatch(os.path.basename(self.directory), pattern) for pattern in self.include):
+            yield self.directory
+
+    def iter_changes(self):
+        """
+        Yields paths to text files and whether they changed since they were last seen.
+
+        Files with the inode, size and modification time recorded in the file index
+        are reported as unchanged without being opened. Other files are hashed, so
+        a file which was only touched is unchanged as well. The index is updated
+        with the new state, and files which no longer exist are removed from it.
+
+        Yields:
+            tuple of (str, os.stat_result, bool): Path to a text file, its stat data and
+            True if the file is new or its content changed.
+        """
+        known = self.file_index.entries_under(os.path.abspath(self.directory))
+        for path, stat in self.iter_stat():
+            key = os.path.abspath(path)
+            record = known.pop(key, None)
+            if record is not None and record[:3] == (stat.st_ino, stat.st_size, stat.st_mtime_ns):
+                yield path, stat, False
+                continue
+            digest = fast_digest(path)
+            self.file_index.update(key, stat, digest)
+            yield path, stat, record is None or record[3] != digest
+        for key in known:
+            self.file_index.remove(key)
+
+    def has_changes(self):
+        """
+        Checks whether any text file was added, changed or removed since the last run.
+
+        Returns:
+            bool: True if the files differ from the ones recorded in the file index.
+        """
+        removed = len(self.file_index.entries_under(os.path.abspath(self.directory)))
+        changed = False
+        for _, _, file_changed in self.iter_changes():
+            changed = changed or file_changed
+            removed -= 1
+        return changed or removed > 0
 
     def get_file(self):
         """
@@ -32,33 +127,147 @@ class DirectoryFile:
         Returns:
             List[str]: List of paths to text files (files with a .txt extension).
         """
-        outputs = []
-        if isdir(self.directory):
-            for path, directories, files in walk(self.directory):
-                for file in files:
-                    if file.endswith('.txt'):
-                        outputs.append(f'{path}/{file}')
-        elif self.directory.endswith('.txt'):
-            outputs.append(self.directory)
+        return list(self.iter_file())
 
-        return outputs
-
-    def text_from_file(self):
+    def text_from_file(self, strip=True):
         """
        Reads the content of text files in the directory and concatenates them into a single text.
 
+       Args:
+           strip (bool): If True, every line is stripped and the files are joined with a new line.
+               If False, the content of the files is concatenated unchanged.
+
        Returns:
            str: Combined text from the text files in the directory.
        """
         texts = []
         for file in self.get_file():
             with open(f'{file}') as output:
-                text = "\n".join(text.strip() for text in output.readlines())
+                if strip:
+                    text = "\n".join(text.strip() for text in output.readlines())
+                else:
+                    text = output.read()
                 texts.append(text)
 
-        combined_texts = "\n".join(texts)
+        combined_texts = ("\n" if strip else "").join(texts)
         return combined_texts
 
+    def iter_words(self):
+        """
+        Yields the words of the text files in the directory, reading them line by line.
+
+        The words are the same as the ones of text_from_file().split().
+
+        Yields:
+            str: The consecutive words of the files.
+        """
+        for file in self.iter_file():
+            with open(f'{file}') as output:
+                for line in stats.iter_timed('read', output):
+                    yield from line.split()
+
+    def iter_bytes(self, chunk_size: int):
+        """
+        Yields the unchanged content of the text files in the directory in blocks.
+
+        The files are read in binary mode and treated as one stream, so every block
+        except the last one has exactly chunk_size bytes. Blocks lying within a single
+        large file are slices of its memory map, only blocks spanning two files are
+        copied into a buffer.
+
+        Args:
+            chunk_size (int): The size of a block in bytes.
+
+        Yields:
+            bytes or memoryview: Consecutive blocks of the files content.
+        """
+        buffer = bytearray()
+        for file in self.iter_file():
+            first_size = chunk_size - len(buffer) if buffer else None
+            for block in self.read_blocks(file, chunk_size, first_size):
+                if not buffer and len(block) == chunk_size:
+                    yield block
+                    continue
+                buffer += block
+                if len(buffer) == chunk_size:
+                    yield bytes(buffer)
+                    buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    def read_blocks(self, file: str, chunk_size: int, first_size=None):
+        """
+        Yields the unchanged content of a single file in blocks.
+
+        Files of at least mmap_threshold bytes are memory-mapped and the blocks are
+        memoryview slices of the map, so the content is not copied. Smaller files
+        are read with buffered reads.
+
+        Args:
+            file (str): The path to the file.
+            chunk_size (int): The size of a block in bytes.
+            first_size (int or None): The size of the first block, chunk_size by default.
+
+        Returns:
+            Iterator[bytes or memoryview]: Consecutive blocks of the file, only the first
+            and the last one may be shorter.
+        """
+        return stats.iter_timed('read', self._read_blocks(file, chunk_size, first_size))
+
+    def _read_blocks(self, file, chunk_size, first_size):
+        """
+        Yields the blocks of a file, see read_blocks().
+        """
+        first_size = chunk_size if first_size is None else first_size
+        with open(file, 'rb') as output:
+            size = os.fstat(output.fileno()).st_size
+            if size < self.mmap_threshold:
+                block = output.read(first_size)
+                while block:
+                    yield block
+                    block = output.read(chunk_size)
+                return
+            mapped = mmap.mmap(output.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        try:
+            start = 0
+            end = min(first_size, len(view))
+            while start < len(view):
+                yield view[start:end]
+                start, end = end, end + chunk_size
+        finally:
+            del view
+            try:
+                mapped.close()
+            except BufferError:
+                pass
+
+    def relative_path(self, file: str):
+        """
+        Returns the path of a file relative to the specified directory.
+
+        Args:
+            file (str): A path returned by get_file().
+
+        Returns:
+            str: The relative path, or the file name if the directory is a single file.
+        """
+        if isdir(self.directory):
+            return os.path.relpath(file, self.directory)
+        return os.path.basename(file)
+
+    def matching_files(self, file_name: str):
+        """
+        Returns the files of the directory whose path contains the given name.
+
+        Args:
+            file_name (str): The name or path looked for.
+
+        Returns:
+            list of str: The paths of the matching files.
+        """
+        return [sample for sample in self.get_file() if file_name in sample]
+
     def append_text_to_file(self, text: str, file_name: str):
         """
         Appends the specified text to an existing file with the given name.
@@ -71,17 +280,15 @@ class DirectoryFile:
             str: Success message or file not found information.
         """
 
-        samples = self.get_file()
         found = False
 
-        for sample in samples:
-            if file_name in sample:
-                if os.path.exists(file_name):
-                    with open(sample, 'a') as output:
-                        output.write(f'{text}\n')
-                    found = True
-                else:
-                    print('You provided the wrong file path."')
+        for sample in self.matching_files(file_name):
+            if os.path.exists(file_name):
+                with open(sample, 'a') as output:
+                    output.write(f'{text}\n')
+                found = True
+            else:
+                print('You provided the wrong file path."')
         if found:
             return f'File(s) containing "{file_name}" have been updated.'
         else:
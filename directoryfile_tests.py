@@ -4,6 +4,7 @@ import os
 import shutil
 import unittest
 from directoryfile import DirectoryFile
+from fileindex import FileIndex
 
 
 class TestDirectoryFile(unittest.TestCase):
@@ -54,6 +55,72 @@ class TestDirectoryFile(unittest.TestCase):
         self.assertIn("Example content", result)
         self.assertIn("Another example", result)
 
+    def test_text_from_file_unstripped(self):
+        """
+        Verifies that the method keeps the content of the files unchanged
+        when stripping is disabled.
+        """
+        with open(os.path.join(self.temp_dir, 'file1.txt'), 'a', encoding='UTF-8') as file:
+            file.write("  \n")
+        dir_fil = DirectoryFile(self.temp_dir)
+        result = dir_fil.text_from_file(strip=False)
+
+        self.assertIn("Example content  \n", result)
+        self.assertIn("Another example", result)
+
+    def test_iter_bytes(self):
+        """
+        Verifies that the method yields blocks of the requested size
+        spanning the boundaries between files.
+        """
+        dir_fil = DirectoryFile(self.temp_dir)
+        blocks = list(dir_fil.iter_bytes(4))
+
+        self.assertTrue(all(len(block) == 4 for block in blocks[:-1]))
+        self.assertEqual(len(b''.join(blocks)), len("Example content") + len("Another example"))
+        self.assertEqual(list(dir_fil.iter_words()), dir_fil.text_from_file().split())
+
+    def test_read_blocks_memory_map(self):
+        """
+        Verifies that large files are read as slices of a memory map
+        with the same blocks as the buffered reads of small files.
+        """
+        file_path = os.path.join(self.temp_dir, 'file1.txt')
+        dir_fil = DirectoryFile(self.temp_dir)
+        buffered = list(dir_fil.read_blocks(file_path, 4, first_size=3))
+        dir_fil.mmap_threshold = 1
+        mapped = list(dir_fil.read_blocks(file_path, 4, first_size=3))
+
+        self.assertTrue(all(isinstance(block, memoryview) for block in mapped))
+        self.assertEqual([bytes(block) for block in mapped], buffered)
+        self.assertEqual([len(block) for block in mapped], [3, 4, 4, 4])
+        self.assertEqual(b''.join(dir_fil.iter_bytes(4)), b''.join(DirectoryFile(self.temp_dir).iter_bytes(4)))
+
+    def test_iter_changes(self):
+        """
+        Verifies that files recorded in the file index are reported as unchanged,
+        and that modified, touched, added and removed files are recognized.
+        """
+        file1 = os.path.join(self.temp_dir, 'file1.txt')
+        file2 = os.path.join(self.temp_dir, 'temp_dir2', 'file2.txt')
+        with FileIndex(os.path.join(self.temp_dir, 'index.sqlite')) as index:
+            dir_fil = DirectoryFile(self.temp_dir, file_index=index)
+            first = {path: changed for path, _, changed in dir_fil.iter_changes()}
+            second = {path: changed for path, _, changed in dir_fil.iter_changes()}
+            os.utime(file1, ns=(0, 0))
+            with open(file2, 'a', encoding='UTF-8') as file:
+                file.write("!")
+            third = {path: changed for path, _, changed in dir_fil.iter_changes()}
+            unchanged = dir_fil.has_changes()
+            os.remove(file1)
+            removed = dir_fil.has_changes()
+
+        self.assertEqual(first, {file1: True, file2: True})
+        self.assertEqual(second, {file1: False, file2: False})
+        self.assertEqual(third, {file1: False, file2: True})
+        self.assertFalse(unchanged)
+        self.assertTrue(removed)
+
     def test_append_text_to_file(self):
         """
         Ensures that the method appends the provided text content
@@ -1,12 +1,33 @@
 """ Module with encryptdecrypt class """
 
+import asyncio
 import base64
+import bisect
+import codecs
+import contextlib
+import copy
+import hashlib
+import io
 import os
+from collections import deque
 from pathlib import Path
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import asyncpipeline
+import chunkstore
+import ciphers
+import compressors
+import container
+import kdf
 from directoryfile import DirectoryFile
+from engine import ParallelEngine
+from instrumentation import stats
+from keycache import default_cache
+from manifest import Manifest
+from outputfile import atomic_output, locked_file
+import passwordfile
+from passwordfile import PASSWORD_FILE, verify_password, write_password
+from scanner import DEFAULT_EXCLUDE, DEFAULT_INCLUDE
+
+BINARY_INCLUDE = ('*',)
 
 
 class EncryptDecrypt(DirectoryFile):
@@ -15,63 +36,606 @@ class EncryptDecrypt(DirectoryFile):
 
    Args:
        directory (str): The path to the directory where files will be encrypted and decrypted.
+       key_cache (KeyCache): The cache holding derived keys, shared by the whole process by default.
+       word_mode (bool): If True, the legacy format with one Fernet token per word is used
+           instead of the chunked container.
+       chunk_size (int): The size of plaintext chunks in the chunked container.
+       workers (int): The number of workers encrypting and decrypting chunks in parallel.
+       use_threads (bool): If True, the workers are threads instead of processes.
+       per_file (bool): If True, every file is encrypted to its own container
+           in a tree mirroring the directory, and only changed files are encrypted again.
+       include (Iterable[str]): Globs of the file names to encrypt.
+       exclude (Iterable[str]): Globs of the files and directories to skip.
+       file_index (FileIndex or None): The index used to skip unchanged files without reading them.
+       binary (bool): If True, files of any type are encrypted byte for byte. Unless include
+           is given, all files are selected, and a directory is always encrypted per file,
+           so the boundaries between the files are kept.
+       async_io (bool): If True, reading, encryption and writing of chunked files overlap
+           in an asyncio pipeline.
+       compression (str): The codec compressing every chunk before encryption,
+           one of compressors.CODECS. It is recorded in the header of the container.
+       engine (ParallelEngine or None): An engine shared with other objects, used instead
+           of creating one for every operation. It is not closed by this object.
+       kdf_params (dict or None): The key derivation of the password and, without a master key,
+           of the containers written by this object, created by kdf.create_params(),
+           PBKDF2 with 390000 iterations by default. Every container stores it
+           in its header with a random salt. With a master key and a password,
+           the containers use the key derivation of the password file unless
+           kdf_params is given.
+       master_key (bytes or None): The key derived from the checked access password.
+           If given, the key of every container is derived from it with HKDF, and the
+           header stores the key derivation, the salt and the verifier of the password,
+           so the password alone rebuilds the key.
+       password (str or None): The checked access password. It derives the master key
+           of containers written with another password file or other kdf_params.
+       cipher (str): The cipher encrypting the chunks of the containers written by this object,
+           one of ciphers.CIPHERS. It is recorded in the header of the container, so
+           containers are decrypted with the cipher they were written with.
+       fsync (bool): If True, every output file is flushed to the disk before it replaces
+           the previous one. Output files are always written to a temporary file first,
+           so an interrupted run never leaves a half-written file.
+       dedup (bool): If True, the directory is encrypted per file and the chunks are saved
+           once in a content-addressed chunk store, so identical content is encrypted
+           and stored once. Every file gets a '.chunks' list of its chunks instead
+           of a container.
     """
-    def __init__(self, directory: str):
-        super().__init__(directory)
+    def __init__(self, directory: str, key_cache=default_cache, word_mode=False,
+                 chunk_size=container.DEFAULT_CHUNK_SIZE, workers=1, use_threads=False,
+                 per_file=False, include=None, exclude=DEFAULT_EXCLUDE, file_index=None,
+                 binary=False, async_io=False, compression=compressors.NONE, engine=None,
+                 kdf_params=None, master_key=None, cipher=ciphers.FERNET, fsync=False,
+                 dedup=False, password=None):
+        if binary and word_mode:
+            raise ValueError('Word mode cannot be used for binary files')
+        compressors.check_codec(compression)
+        ciphers.check_cipher(cipher)
+        requested_kdf = None if kdf_params is None else kdf.check_params(kdf_params)
+        kdf_params = kdf.create_params() if kdf_params is None else requested_kdf
+        if include is None:
+            include = BINARY_INCLUDE if binary else DEFAULT_INCLUDE
+        super().__init__(directory, include, exclude, file_index)
         self.key = b'!123!321!'
+        self.salt = b'123qwerty123'
+        self.iterations = 390000
+        self.key_cache = key_cache
+        self.word_mode = word_mode
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.use_threads = use_threads
+        self.binary = binary
+        self.async_io = async_io
+        self.compression = compression
+        self.cipher = cipher
+        self.fsync = fsync
+        self.dedup = dedup
+        self.engine = engine
+        self.kdf_params = kdf_params
+        self.requested_kdf = requested_kdf
+        self.kdf_header = None
+        self.master_key = master_key
+        self.password = password
+        self.password_entry = None
+        self.per_file = per_file or dedup \
+            or (binary and directory is not None and os.path.isdir(directory))
         self.new_folder = Path('result')
-        self.password_file = "password.txt"
+        self.password_file = PASSWORD_FILE
 
     def set_password(self, password):
         """
-        Sets the password in the 'password.txt' file.
+        Saves the verifier of the password in the 'password.txt' file
+        and uses its key as the master key.
 
         Args:
             password (str): The password to set in the file.
         """
-        with open(self.password_file, 'w', encoding='utf8') as file:
-            file.write(password)
+        self.master_key = write_password(password, self.password_file, self.kdf_params,
+                                         self.key_cache)
+        self.password = password
+        self.password_entry = None
 
-    def get_password(self):
+    def check_password(self, password):
         """
-        Retrieves the stored password from the 'password.txt' file.
+        Checks the password against the verifier in the 'password.txt' file
+        and uses its key as the master key if it is correct.
+
+        Args:
+            password (str): The password to check.
 
         Returns:
-            str or None: The stored password if it exists, or None if the file is not found.
+            bool: True if the password is correct.
         """
-        try:
-            with open(self.password_file, 'r', encoding='utf8') as file:
-                return file.read().strip()
-        except FileNotFoundError:
-            return None
+        master_key = verify_password(password, self.password_file, self.key_cache)
+        if master_key is None:
+            return False
+        self.master_key = master_key
+        self.password = password
+        self.password_entry = None
+        return True
 
-    def create_kdf(self):
+    def derive_key(self, salt, params):
+        """
+        Derives the key with the given salt and key derivation parameters.
+
+        The derived key is kept in the key cache, so the KDF runs only once
+        per process for the same key and parameters.
+
+        Args:
+            salt (bytes): The salt.
+            params (dict): The parameters created by kdf.create_params().
+
+        Returns:
+            bytes: The derived key.
+        """
+        def derive():
+            with stats.timer('kdf'):
+                return kdf.derive(self.key, salt, params)
+
+        cost, name = kdf.cache_parameters(params)
+        return self.key_cache.get_or_derive(self.key, salt, cost, name, derive)
+
+    def create_kdf(self, salt=None, iterations=None, legacy=False):
         """
         Creates a Key Derivation Function (KDF)
          using the PBKDF2-HMAC algorithm with specified parameters.
 
+        The key is used by the word mode, which has no header, so it is derived
+        with the fixed salt of the object unless another one is given. With a master key
+        and neither a salt nor iterations, the key is derived from the master key
+        with HKDF and the fixed salt instead, so it depends on the access password.
+
+        Args:
+            salt (bytes or None): The salt, defaults to the salt of the object.
+            iterations (int or None): The number of iterations, defaults to the object setting.
+            legacy (bool): If True, the key of older versions is derived even with a master key.
+
         Returns:
             bytes: The derived key based on the provided key and salt.
         """
-        salt = b'123qwerty123'
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=390000
-        )
-        return kdf.derive(self.key)
+        if self.master_key is not None and not legacy and salt is None and iterations is None:
+            return kdf.hkdf(self.master_key, self.salt, b'word key')
+        salt = self.salt if salt is None else salt
+        iterations = self.iterations if iterations is None else iterations
+        return self.derive_key(salt, kdf.create_params(kdf.PBKDF2, iterations))
 
-    def create_fernet(self):
+    def create_fernet(self, salt=None, iterations=None, legacy=False):
         """
         Creates a Fernet encryption object using a derived key.
 
+        Args:
+            salt (bytes or None): The salt passed to create_kdf().
+            iterations (int or None): The number of iterations passed to create_kdf().
+            legacy (bool): If True, the key of older versions is used even with a master key.
+
         Returns:
             Fernet: A Fernet encryption object initialized with a derived key.
         """
-        fernet = Fernet(base64.urlsafe_b64encode(self.create_kdf()))
+        from cryptography.fernet import Fernet
+        fernet = Fernet(base64.urlsafe_b64encode(self.create_kdf(salt, iterations, legacy)))
         return fernet
 
+    def create_header(self):
+        """
+        Creates the header of the chunked container.
+
+        Every header has its own random id, which the key of the chunks is derived from.
+
+        Returns:
+            dict: The chunk size, the compression codec, the cipher,
+            the key derivation parameters and the id of the container.
+        """
+        return {
+            'version': 1,
+            'chunk_size': self.chunk_size,
+            'compression': self.compression,
+            'cipher': self.cipher,
+            'kdf': self.output_kdf(),
+            'id': base64.b64encode(os.urandom(16)).decode('ascii'),
+        }
+
+    def output_kdf(self):
+        """
+        Returns the key derivation of the containers written by this object.
+
+        The salt is chosen at random the first time and then used for all the containers
+        written by the object, so the key is derived once per run, not once per file.
+        Every container still has its own key, derived from it and the id of its header.
+
+        Returns:
+            dict: The parameters and the salt, as stored in the header.
+        """
+        if self.kdf_header is None:
+            self.kdf_header = self.create_kdf_header(os.urandom(kdf.SALT_SIZE))
+        return self.kdf_header
+
+    def create_kdf_header(self, salt):
+        """
+        Creates the key derivation of the containers written by this object with a salt.
+
+        Args:
+            salt (bytes): The salt of the containers.
+
+        Returns:
+            dict: The parameters and the salt, with the password entry if the key
+            is derived from a master key whose password entry is known.
+        """
+        kdf_header = kdf.create_header(self.output_params(), salt)
+        if self.master_key is not None and self.output_password() is not None:
+            kdf_header['password'] = self.output_password()
+        return kdf_header
+
+    def output_password(self):
+        """
+        Returns the password entry stored in the headers of the containers written
+        with the master key.
+
+        The entry of the password file is used if it belongs to the master key.
+        If kdf_params asks for other parameters and the password is known, the master key
+        is derived again from the password with them and a random salt, once per object.
+
+        Returns:
+            dict or None: The parameters, the salt and the verifier of the password,
+            or None if they are not known.
+        """
+        if self.password_entry is None and self.master_key is not None:
+            entry = passwordfile.read_entry(self.password_file)
+            if entry is not None and not passwordfile.matches_entry(self.master_key, entry):
+                entry = None
+            if self.password is not None and self.requested_kdf is not None \
+                    and (entry is None or kdf.check_params(entry) != self.requested_kdf):
+                _, entry = passwordfile.create_entry(self.password, self.requested_kdf,
+                                                     self.key_cache)
+            self.password_entry = entry
+        return self.password_entry
+
+    def output_params(self):
+        """
+        Returns the key derivation parameters of the containers written by this object.
+
+        Returns:
+            dict: HKDF from the master key if there is one, kdf_params otherwise.
+        """
+        if self.master_key is not None:
+            return kdf.check_params({'algorithm': kdf.HKDF})
+        return self.kdf_params
+
+    def reuse_kdf(self, kdf_header):
+        """
+        Writes the next containers with the salt of an existing output, if its parameters
+        are the configured ones, so rewriting the output does not need a new key.
+
+        Args:
+            kdf_header (dict or None): The key derivation stored with the existing output.
+        """
+        try:
+            if kdf_header is not None and kdf.check_params(kdf_header) == self.output_params():
+                self.kdf_header = self.create_kdf_header(base64.b64decode(kdf_header['salt']))
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    def output_key(self):
+        """
+        Derives the key of the key derivation of the containers written by this object.
+
+        The key of the chunks of every container is derived from it and the id
+        of the container, while the chunk store and the digests of the manifest use it directly.
+
+        Returns:
+            bytes: The key matching the key derivation of create_header().
+        """
+        return self.kdf_key(self.output_kdf())
+
+    def kdf_key(self, kdf_header):
+        """
+        Derives the key using the key derivation parameters stored with an output.
+
+        Args:
+            kdf_header (dict): The key derivation parameters and the salt.
+
+        Returns:
+            bytes: The derived key.
+        """
+        try:
+            params = kdf.check_params(kdf_header)
+            salt = base64.b64decode(kdf_header['salt'])
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            raise container.ContainerError(f'Invalid key derivation: {error}') from error
+        if params['algorithm'] == kdf.HKDF:
+            return kdf.hkdf(self.master_key_for(kdf_header.get('password')), salt)
+        return self.derive_key(salt, params)
+
+    def key_from_header(self, header):
+        """
+        Derives the key using the key derivation parameters and the id stored in a header.
+
+        Args:
+            header (dict): The header of the chunked container.
+
+        Returns:
+            bytes: The key able to decrypt the chunks of the container.
+        """
+        return container.container_key(self.kdf_key(header.get('kdf')), header)
+
+    def master_key_for(self, entry):
+        """
+        Returns the master key of the password entry stored in a header.
+
+        The master key of the object is used if it matches the entry, otherwise
+        the key is derived from the password with the parameters and the salt of the entry.
+
+        Args:
+            entry (dict or None): The password entry, None for containers written
+                before it was stored, which need the master key of the object.
+
+        Returns:
+            bytes: The master key.
+
+        Raises:
+            ContainerError: If the key cannot be derived or the password is not
+                the one the container was encrypted with.
+        """
+        if entry is None:
+            if self.master_key is None:
+                raise container.ContainerError('The container needs the key of the access password')
+            return self.master_key
+        try:
+            if self.master_key is not None and passwordfile.matches_entry(self.master_key, entry):
+                return self.master_key
+            if self.password is None:
+                raise container.ContainerError(
+                    'The container was encrypted with a different password file, '
+                    'its password is needed to decrypt it')
+            master_key = passwordfile.check_entry(self.password, entry, self.key_cache)
+        except (ValueError, KeyError, TypeError) as error:
+            raise container.ContainerError(f'Invalid password entry: {error}') from error
+        if master_key is None:
+            raise container.ContainerError('Wrong password: the container was encrypted '
+                                           'with a different password')
+        return master_key
+
+    def create_engine(self):
+        """
+        Creates the engine encrypting and decrypting chunks with the configured workers.
+
+        Returns:
+            ParallelEngine: The engine, it should be closed after use. A shared engine
+            is returned in a context manager which leaves it open.
+        """
+        if self.engine is not None:
+            return contextlib.nullcontext(self.engine)
+        return ParallelEngine(self.workers, self.use_threads)
+
+    def write_container(self, file_path, engine, key, chunks):
+        """
+        Encrypts the chunks and writes them to a chunked container with its index.
+
+        The container replaces the file only once it is complete.
+
+        Args:
+            file_path (str): The path to the container.
+            engine (ParallelEngine): The engine encrypting the chunks.
+            key (bytes): The key of the key derivation, see output_key().
+            chunks (Iterable[bytes]): The plaintext chunks.
+        """
+        if self.async_io:
+            header = self.create_header()
+            asyncio.run(asyncpipeline.encrypt_to_file(engine, container.container_key(key, header),
+                                                      header, chunks, file_path, fsync=self.fsync))
+            return
+        with atomic_output(file_path, self.fsync) as file:
+            self.write_stream(file, engine, key, chunks)
+
+    def write_stream(self, file, engine, key, chunks):
+        """
+        Encrypts the chunks and writes a chunked container with its index to an open file.
+
+        Args:
+            file (BinaryIO): The file opened for writing.
+            engine (ParallelEngine): The engine encrypting the chunks.
+            key (bytes): The key of the key derivation, see output_key().
+            chunks (Iterable[bytes]): The plaintext chunks.
+        """
+        lengths = deque()
+
+        def measured():
+            for chunk in chunks:
+                lengths.append(len(chunk))
+                yield chunk
+
+        header = self.create_header()
+        key = container.container_key(key, header)
+        writer = container.ContainerWriter(file, key, container.write_header(file, header))
+        for token in engine.encrypt(key, measured(), codec=self.compression, cipher=self.cipher):
+            writer.write(token, lengths.popleft())
+        writer.finish()
+
+    def encrypt_bytes(self, data):
+        """
+        Encrypts data held in memory to a chunked container.
+
+        Args:
+            data (bytes): The plaintext.
+
+        Returns:
+            bytes: The container, in the same format as the '.encrypt' files.
+        """
+        file = io.BytesIO()
+        with self.create_engine() as engine:
+            self.write_stream(file, engine, self.output_key(),
+                              container.split_chunks(data, self.chunk_size))
+        return file.getvalue()
+
+    def decrypt_bytes(self, data):
+        """
+        Decrypts a chunked container held in memory.
+
+        Args:
+            data (bytes): The container.
+
+        Returns:
+            bytes: The plaintext.
+        """
+        file = io.BytesIO(data)
+        header = container.read_header(file)
+        key = self.key_from_header(header)
+        entries, _ = container.read_index(file, key)
+        with self.create_engine() as engine:
+            return b''.join(engine.decrypt(key, container.read_records(file, entries),
+                                           codec=container.header_codec(header),
+                                           cipher=container.header_cipher(header)))
+
+    def append_to_container(self, file_path, data, engine):
+        """
+        Encrypts data and appends it to a chunked container as a new segment.
+
+        Only the new chunks and the index are written, the chunks already in the container
+        are left untouched. Their positions continue the ones of the existing chunks,
+        and the index is authenticated again, so the segment is authenticated together
+        with the rest of the container. The new chunks and index are written after
+        the previous index, which stays valid if the append is interrupted.
+        With fsync, the chunks are flushed to the disk before the index pointing at them.
+        The container is locked while it is appended to and compacted, so appends
+        of other threads and processes to the same container wait for their turn.
+
+        Args:
+            file_path (str): The path to the container.
+            data (bytes): The plaintext to append.
+            engine (ParallelEngine): The engine encrypting the chunks.
+        """
+        with locked_file(file_path) as file:
+            header = container.read_header(file)
+            key = self.key_from_header(header)
+            codec = container.header_codec(header)
+            cipher = container.header_cipher(header)
+            writer = container.append_writer(file, key)
+            first = len(writer.entries)
+            chunks = list(container.split_chunks(data, header['chunk_size']))
+            for chunk, token in zip(chunks, engine.encrypt(key, chunks, first, codec, cipher)):
+                writer.write(token, len(chunk))
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+            writer.finish()
+            if self.fsync:
+                file.flush()
+                os.fsync(file.fileno())
+            if writer.dead_size * 2 > file.tell():
+                file.flush()
+                self.compact_container(file_path, header, key)
+
+    def compact_container(self, file_path, header, key):
+        """
+        Rewrites a chunked container without the indexes replaced by appends.
+
+        The encrypted chunks are copied as they are, and the container is replaced
+        only once the copy is complete. The caller should hold the lock of the container.
+
+        Args:
+            file_path (str): The path to the container.
+            header (dict): The header of the container.
+            key (bytes): The key of the chunks of the container.
+        """
+        with open(file_path, 'rb') as source, atomic_output(file_path, self.fsync) as file:
+            entries, _ = container.read_index(source, key)
+            writer = container.ContainerWriter(file, key, container.write_header(file, header))
+            for (_, _, length, _), token in zip(entries, container.read_records(source, entries)):
+                writer.write(token, length)
+            writer.finish()
+        stats.count('containers compacted')
+
+    def decrypt_range(self, file_path, offset, length):
+        """
+        Decrypts a range of the content of a chunked container.
+
+        The index of the container is used to find the chunks overlapping the range,
+        so only those chunks are read and decrypted.
+
+        Args:
+            file_path (str): The path to the container.
+            offset (int): The position of the first byte of the range in the content.
+                A negative offset is counted from the end of the content.
+            length (int): The maximal number of bytes to return.
+
+        Returns:
+            bytes: The content in the range, shorter if the range goes past the end.
+        """
+        with open(file_path, 'rb') as file, self.create_engine() as engine:
+            header = container.read_header(file)
+            key = self.key_from_header(header)
+            codec = container.header_codec(header)
+            cipher = container.header_cipher(header)
+            entries, _ = container.read_index(file, key)
+            size = entries[-1][1] + entries[-1][2] if entries else 0
+            if offset < 0:
+                offset = max(size + offset, 0)
+            end = min(offset + length, size)
+            if offset >= end:
+                return b''
+            positions = [entry[1] for entry in entries]
+            first = bisect.bisect_right(positions, offset) - 1
+            last = bisect.bisect_left(positions, end)
+            tokens = container.read_records(file, entries[first:last])
+            data = b''.join(engine.decrypt(key, tokens, first, codec, cipher))
+        return data[offset - positions[first]:end - positions[first]]
+
+    def read_container(self, file_path, engine):
+        """
+        Reads and decrypts the chunks of a chunked container.
+
+        Args:
+            file_path (str): The path to the container.
+            engine (ParallelEngine): The engine decrypting the chunks.
+
+        Yields:
+            bytes: The plaintext chunks.
+        """
+        with open(file_path, 'rb') as file:
+            header = container.read_header(file)
+            key = self.key_from_header(header)
+            entries, _ = container.read_index(file, key)
+            yield from engine.decrypt(key, container.read_records(file, entries),
+                                      codec=container.header_codec(header),
+                                      cipher=container.header_cipher(header))
+
+    def decrypt_container_to_file(self, source, target, engine):
+        """
+        Decrypts a chunked container and writes its content, byte for byte, to a file.
+
+        The content replaces the file only once it is complete.
+
+        Args:
+            source (str): The path to the container.
+            target (str): The path to the decrypted file.
+            engine (ParallelEngine): The engine decrypting the chunks.
+        """
+        if self.async_io:
+            with open(source, 'rb') as file:
+                header = container.read_header(file)
+                key = self.key_from_header(header)
+                entries, _ = container.read_index(file, key)
+                asyncio.run(asyncpipeline.decrypt_to_file(
+                    engine, key, container.read_records(file, entries), target,
+                    codec=container.header_codec(header), cipher=container.header_cipher(header),
+                    fsync=self.fsync))
+            return
+        with atomic_output(target, self.fsync) as file:
+            for chunk in self.read_container(source, engine):
+                with stats.timer('write', len(chunk)):
+                    file.write(chunk)
+
+    def iter_encrypt(self):
+        """
+        Encrypts the words of the files one by one using Fernet encryption.
+
+        Yields:
+            bytes: The encrypted words in the order they appear in the files.
+        """
+        fernet = self.create_fernet()
+        for text in self.iter_words():
+            data = text.encode('utf-8')
+            with stats.timer('encrypt', len(data)):
+                token = fernet.encrypt(data)
+            yield token
+
     def encrypt(self):
         """
         Encrypts text from a file using Fernet encryption.
@@ -79,44 +643,151 @@ class EncryptDecrypt(DirectoryFile):
         Returns:
             list of bytes: A list of encrypted words from the file.
         """
-        fernet = self.create_fernet()
-        encrypted_words = []
-        for text in self.text_from_file().split():
-            encrypted_word = fernet.encrypt(text.encode('utf-8'))
-            encrypted_words.append(encrypted_word)
+        return list(self.iter_encrypt())
 
-        return encrypted_words
+    def iter_encrypt_chunks(self):
+        """
+        Encrypts the unchanged content of the files in chunks of chunk_size bytes.
 
-    def decrypt(self):
+        The files are streamed, so only a bounded number of chunks
+        is held in memory at a time, even with many workers. The chunks are encrypted
+        with the key of output_key(), which matches a header without an id.
+
+        Yields:
+            bytes: The encrypted chunks.
+        """
+        with self.create_engine() as engine:
+            yield from engine.encrypt(self.output_key(), self.iter_bytes(self.chunk_size),
+                                      codec=self.compression, cipher=self.cipher)
+
+    def encrypt_chunks(self):
         """
-        Decrypts encrypted words using Fernet decryption.
+        Encrypts the unchanged content of the files in chunks of chunk_size bytes.
 
         Returns:
-           list of str: A list of decrypted words from the encrypted data.
+            list of bytes: A list of encrypted chunks.
+        """
+        return list(self.iter_encrypt_chunks())
+
+    def read_encrypted_tokens(self):
+        """
+        Reads encrypted tokens from the '.encrypt' file in the 'result' folder.
+
+        Lines written by older versions as a bytes representation (b'...')
+        are accepted as well.
+
+        Yields:
+            bytes: The encrypted tokens, one per line of the file.
+        """
+        with open(self.result_path('encrypt'), 'rb') as file:
+            for line in file:
+                token = line.strip()
+                if token.startswith(b"b'") and token.endswith(b"'"):
+                    token = token[2:-1]
+                if token:
+                    yield token
+
+    def iter_decrypt_bytes(self):
+        """
+        Decrypts the chunks saved in the chunked '.encrypt' file one by one without decoding them.
+
+        Yields:
+            bytes: The decrypted content, byte for byte as it was encrypted.
+        """
+        with self.create_engine() as engine:
+            yield from self.read_container(self.result_path('encrypt'), engine)
+
+    def iter_decrypt_chunks(self):
+        """
+        Decrypts the chunks saved in the chunked '.encrypt' file one by one.
+
+        Yields:
+            str: The decrypted text, in pieces of about chunk_size bytes.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for chunk in self.iter_decrypt_bytes():
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+    def iter_decrypt(self):
+        """
+        Decrypts the saved '.encrypt' file piece by piece.
+
+        The format of the file is detected, so files saved in word mode
+        and chunked files can both be decrypted. Word-mode files written before
+        their key was derived from the master key are decrypted as well.
+
+        Yields:
+            str: The decrypted words, or pieces of text for a chunked file.
         """
+        if container.is_container(self.result_path('encrypt')):
+            yield from self.iter_decrypt_chunks()
+            return
         fernet = self.create_fernet()
-        decrypted_words = []
-        for text in self.encrypt():
-            decrypted_word = fernet.decrypt(text).decode('utf-8')
-            decrypted_words.append(decrypted_word)
+        if self.master_key is not None:
+            from cryptography.fernet import MultiFernet
+            fernet = MultiFernet([fernet, self.create_fernet(legacy=True)])
+        for token in self.read_encrypted_tokens():
+            with stats.timer('decrypt', len(token)):
+                data = fernet.decrypt(token)
+            yield data.decode('utf-8')
+
+    def decrypt(self):
+        """
+        Decrypts the encrypted data saved in the '.encrypt' file using Fernet decryption.
+
+        Returns:
+           list of str: A list of decrypted words, or pieces of text for a chunked file.
+        """
+        return list(self.iter_decrypt())
+
+    def result_path(self, extension):
+        """
+        Returns the path of a result file for the directory.
+
+        The file is named based on the directory path, replacing '/' with '_'.
+
+        Args:
+            extension (str): The extension of the result file, e.g. 'encrypt'.
 
-        return decrypted_words
+        Returns:
+            str: The path to the file in the 'result' folder.
+        """
+        file_name = f'{self.directory.replace("/", "_")}.{extension}'
+        return os.path.join(self.new_folder, file_name)
 
     def save_encrypted_text(self):
         """
         Saves encrypted text to a file in the 'result' folder.
 
         The file is named based on the directory path, replacing '/' with '_',
-        and has a '.encrypt' extension.
+        and has a '.encrypt' extension. In word mode it holds one token per line,
+        otherwise it is a chunked container. The tokens are written in large batches,
+        and the file replaces the previous one only once it is complete.
+        In per-file mode save_encrypted_files() is used instead.
 
         """
-        file_name = f'{self.directory.replace("/", "_")}.encrypt'
-        file_path = os.path.join(self.new_folder, file_name)
+        file_path = self.result_path('encrypt')
+        if self.per_file:
+            return self.save_encrypted_files()
         if not self.new_folder.exists():
             self.new_folder.mkdir(parents=True)
-        with open(file_path, 'w', encoding='utf8') as file:
-            for text in self.encrypt():
-                file.write(f'{text}\n')
+        if not self.word_mode:
+            if os.path.isfile(file_path) and container.is_container(file_path):
+                with open(file_path, 'rb') as file:
+                    self.reuse_kdf(container.read_header(file).get('kdf'))
+            with self.create_engine() as engine:
+                self.write_container(file_path, engine, self.output_key(),
+                                     self.iter_bytes(self.chunk_size))
+            return
+        with atomic_output(file_path, self.fsync) as file:
+            for token in self.iter_encrypt():
+                with stats.timer('write', len(token) + 1):
+                    file.write(token + b'\n')
 
     def save_decrypted_text(self):
         """
@@ -124,12 +795,319 @@ class EncryptDecrypt(DirectoryFile):
 
         The file is named based on the directory path, replacing '/' with '_',
         and has a '.decrypt' extension.
+        The text is read from the '.encrypt' file saved by save_encrypted_text(),
+        so the original files are not needed. The content of a chunked file is
+        written without decoding, byte for byte. A per-file encrypted directory
+        is decrypted by save_decrypted_files() instead.
 
         """
-        file_name = f'{self.directory.replace("/", "_")}.decrypt'
-        file_path = os.path.join(self.new_folder, file_name)
+        if os.path.isdir(self.result_path('encrypt')):
+            return self.save_decrypted_files()
+        file_path = self.result_path('decrypt')
         if not self.new_folder.exists():
             self.new_folder.mkdir(parents=True)
-        with open(file_path, 'w', encoding='utf8') as file:
-            for text in self.decrypt():
-                file.write(f'{text}\n')
+        if container.is_container(self.result_path('encrypt')):
+            with self.create_engine() as engine:
+                self.decrypt_container_to_file(self.result_path('encrypt'), file_path, engine)
+            return
+        with atomic_output(file_path, self.fsync) as file:
+            for text in self.iter_decrypt():
+                data = f'{text}\n'.encode('utf-8')
+                with stats.timer('write', len(data)):
+                    file.write(data)
+
+    def append_text_to_file(self, text: str, file_name: str):
+        """
+        Appends the text to the files and adds it to their encrypted copies.
+
+        The encrypted output of the object and the ones of the directories containing it,
+        e.g. result/<directory>.encrypt when a file of an encrypted directory is given,
+        are updated, see append_to_output() for the cases which need only the new text.
+
+        Args:
+            text (str): The text to add to the files.
+            file_name (str): The name of the files to which the text should be added.
+
+        Returns:
+            str: Success message or file not found information.
+        """
+        files = self.matching_files(file_name) if os.path.exists(file_name) else []
+        outputs = [(output, output.current_files(files))
+                   for output in [self, *self.enclosing_outputs()]]
+        message = super().append_text_to_file(text, file_name)
+        if files:
+            for output, current in outputs:
+                output.append_to_output(text, current)
+        return message
+
+    def enclosing_outputs(self):
+        """
+        Yields objects for the encrypted outputs of the directories containing the directory.
+
+        The objects have the options of this object, with the mode of every output
+        (per-file, deduplicated, word mode or combined container) read from the result folder.
+
+        Yields:
+            EncryptDecrypt: An object for a directory with an encrypted output.
+        """
+        directory = self.directory.rstrip(os.sep)
+        parent = os.path.dirname(directory)
+        while parent and parent != directory:
+            enclosing = copy.copy(self)
+            enclosing.directory = parent
+            enclosing.file_index = None
+            enclosing.kdf_header = None
+            target = enclosing.result_path('encrypt')
+            if os.path.exists(target):
+                enclosing.per_file = os.path.isdir(target)
+                enclosing.dedup = os.path.isdir(os.path.join(target, chunkstore.FOLDER))
+                enclosing.word_mode = os.path.isfile(target) and not container.is_container(target)
+                yield enclosing
+            directory, parent = parent, os.path.dirname(parent)
+
+    def current_files(self, files):
+        """
+        Returns the files whose encrypted copies can be extended with appended text.
+
+        Args:
+            files (list of str): The files the text is appended to.
+
+        Returns:
+            list of str: In per-file mode the files whose containers match the manifest,
+            otherwise all the files.
+        """
+        target = self.result_path('encrypt')
+        if not os.path.isdir(target):
+            return files
+        manifest = Manifest(os.path.join(target, 'manifest.json'))
+        return [file for file in files if self.is_encrypted_copy_current(file, manifest)]
+
+    def append_to_output(self, text, files):
+        """
+        Adds text appended to files to the encrypted output of the directory.
+
+        Only the encrypted text is written, so the cost depends on the length of the text,
+        not on the size of the files, for the containers of a per-file directory and for
+        a combined container or word-mode file whose last file in scan order is the one
+        the text was appended to. A combined output is otherwise encrypted again as a whole,
+        as the text is in the middle of its content. A deduplicated directory encrypts
+        the files again, storing only their new chunks. Per-file containers which
+        did not match the manifest are left to the next encryption.
+
+        Args:
+            text (str): The appended text, without its new line.
+            files (list of str): The files the text was appended to, as returned
+                by current_files() before appending.
+        """
+        target = self.result_path('encrypt')
+        if not files or not os.path.exists(target):
+            return
+        if self.dedup and os.path.isdir(target):
+            self.save_encrypted_files(files)
+            return
+        data = f'{text}\n'.encode('utf-8')
+        with self.create_engine() as engine:
+            if os.path.isdir(target):
+                manifest = Manifest(os.path.join(target, 'manifest.json'))
+                for file in files:
+                    relative_path = self.relative_path(file)
+                    self.append_to_container(os.path.join(target, f'{relative_path}.encrypt'),
+                                             data, engine)
+                    stat = os.stat(file)
+                    manifest.update(relative_path, stat.st_size, stat.st_mtime_ns, None)
+                manifest.save()
+            elif files != self.get_file()[-1:]:
+                self.save_encrypted_text()
+            elif container.is_container(target):
+                self.append_to_container(target, data, engine)
+            else:
+                fernet = self.create_fernet()
+                with open(target, 'a', encoding='utf8') as output:
+                    for word in text.split():
+                        output.write(f'{fernet.encrypt(word.encode("utf-8")).decode("ascii")}\n')
+
+    def is_encrypted_copy_current(self, file, manifest):
+        """
+        Checks whether the container of a file in per-file mode matches the file.
+
+        Args:
+            file (str): The path to the file.
+            manifest (Manifest): The manifest of the encrypted directory.
+
+        Returns:
+            bool: True if the container exists and the manifest records the current
+            size and modification time of the file.
+        """
+        relative_path = self.relative_path(file)
+        stat = os.stat(file)
+        return os.path.exists(self.copy_path(self.result_path('encrypt'), relative_path)) \
+            and manifest.is_unchanged(relative_path, stat.st_size, stat.st_mtime_ns)
+
+    def copy_path(self, folder, relative_path, dedup=None):
+        """
+        Returns the path of the encrypted copy of a file in per-file mode.
+
+        Args:
+            folder (str): The folder of the encrypted directory.
+            relative_path (str): The path of the file relative to the source directory.
+            dedup (bool or None): Whether the copy is a chunk list, the setting of the object
+                by default.
+
+        Returns:
+            str: The path to the '.chunks' list with deduplication, to the '.encrypt'
+            container otherwise.
+        """
+        dedup = self.dedup if dedup is None else dedup
+        return os.path.join(folder, f'{relative_path}.{"chunks" if dedup else "encrypt"}')
+
+    def content_digest(self, file, key):
+        """
+        Computes a keyed hash of the content of a file.
+
+        The hash is keyed with the derived key, so it does not reveal the content.
+
+        Args:
+            file (str): The path to the file.
+            key (bytes): The derived key.
+
+        Returns:
+            str: The hex digest of the content.
+        """
+        digest = hashlib.blake2b(key=key, digest_size=32)
+        for block in self.read_blocks(file, self.chunk_size):
+            digest.update(block)
+        return digest.hexdigest()
+
+    def save_encrypted_files(self, paths=None):
+        """
+        Encrypts every file of the directory to its own chunked container.
+
+        The containers are saved in the 'result/<directory>.encrypt' folder, mirroring
+        the layout of the directory, together with a manifest of the encrypted files.
+        Files with the size, modification time and content recorded in the manifest
+        are skipped, and the containers of deleted files are removed. With a file index,
+        files with the same size and modification time but a different inode
+        or content are encrypted again as well. With deduplication, only the chunks
+        missing from the chunk store are encrypted, and the chunks no longer listed
+        by any file are removed from it.
+
+        Args:
+            paths (Iterable[str] or None): The files known to have changed, for example
+                by a Watcher. Only these files are checked, and the ones which no longer
+                exist are removed. By default the whole directory is scanned.
+
+        Returns:
+            dict: The numbers of 'encrypted', 'unchanged' and 'removed' files.
+        """
+        folder = self.result_path('encrypt')
+        manifest = Manifest(os.path.join(folder, 'manifest.json'))
+        self.reuse_kdf(manifest.kdf)
+        manifest.kdf = self.output_kdf()
+        key = self.output_key()
+        store = chunkstore.ChunkStore(os.path.join(folder, chunkstore.FOLDER), key, self.compression,
+                                      self.cipher, self.fsync) if self.dedup else None
+        summary = {'encrypted': 0, 'unchanged': 0, 'removed': 0}
+        seen = set()
+        removed = None
+        if paths is not None:
+            files = []
+            removed = set()
+            for path in paths:
+                try:
+                    files.append((path, os.stat(path), None))
+                except FileNotFoundError:
+                    removed.add(self.relative_path(path))
+        elif self.file_index is None:
+            files = ((file, stat, None) for file, stat in self.iter_stat())
+        else:
+            files = self.iter_changes()
+        with self.create_engine() as engine:
+            for file, stat, changed in files:
+                relative_path = self.relative_path(file)
+                seen.add(relative_path)
+                target = self.copy_path(folder, relative_path)
+                if changed is not True and os.path.exists(target) \
+                        and manifest.is_unchanged(relative_path, stat.st_size, stat.st_mtime_ns):
+                    summary['unchanged'] += 1
+                    continue
+                digest = self.content_digest(file, key)
+                chunks = manifest.chunks(relative_path)
+                if manifest.digest(relative_path) == digest and os.path.exists(target):
+                    summary['unchanged'] += 1
+                else:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    chunks = None
+                    if store is None:
+                        self.write_container(target, engine, key, self.read_blocks(file, self.chunk_size))
+                    else:
+                        refs = store.store(engine, self.read_blocks(file, self.chunk_size))
+                        self.write_container(target, engine, key, container.split_chunks(
+                            chunkstore.encode_refs(refs), self.chunk_size))
+                        chunks = [chunk_id for chunk_id, _ in refs]
+                    other = self.copy_path(folder, relative_path, not self.dedup)
+                    if os.path.exists(other):
+                        os.remove(other)
+                    summary['encrypted'] += 1
+                manifest.update(relative_path, stat.st_size, stat.st_mtime_ns, digest, chunks)
+        if removed is None:
+            removed = set(manifest.entries) - seen
+        for relative_path in removed & set(manifest.entries):
+            for dedup in (False, True):
+                target = self.copy_path(folder, relative_path, dedup)
+                if os.path.exists(target):
+                    os.remove(target)
+            manifest.remove(relative_path)
+            summary['removed'] += 1
+        manifest.save()
+        if store is not None or os.path.isdir(os.path.join(folder, chunkstore.FOLDER)):
+            referenced = {chunk_id for entry in manifest.entries.values()
+                          for chunk_id in entry.get('chunks', ())}
+            chunkstore.collect_garbage(os.path.join(folder, chunkstore.FOLDER), referenced)
+        for name, value in summary.items():
+            stats.count(f'files {name}', value)
+        return summary
+
+    def save_decrypted_files(self):
+        """
+        Decrypts every container of a per-file encrypted directory.
+
+        The files are saved unchanged in the 'result/<directory>.decrypt' folder,
+        mirroring the layout of the original directory. Files saved with deduplication
+        are put together from the chunk store.
+        """
+        source = self.result_path('encrypt')
+        folder = self.result_path('decrypt')
+        manifest = Manifest(os.path.join(source, 'manifest.json'))
+        with self.create_engine() as engine:
+            for relative_path in sorted(manifest.entries):
+                target = os.path.join(folder, relative_path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                chunk_list = self.copy_path(source, relative_path, True)
+                if os.path.exists(chunk_list):
+                    self.decrypt_chunk_list_to_file(chunk_list, target, engine)
+                else:
+                    self.decrypt_container_to_file(self.copy_path(source, relative_path, False),
+                                                   target, engine)
+
+    def decrypt_chunk_list_to_file(self, source, target, engine):
+        """
+        Decrypts the chunks of a deduplicated file from the chunk store and writes them to a file.
+
+        The chunks are decrypted with the key of the key derivation, the codec and the cipher
+        of the chunk list, which were used for the chunks as they are part of their ids.
+
+        Args:
+            source (str): The path to the '.chunks' list, in the folder of the encrypted directory.
+            target (str): The path to the decrypted file.
+            engine (ParallelEngine): The engine decrypting the chunks.
+        """
+        with open(source, 'rb') as file:
+            header = container.read_header(file)
+        refs = chunkstore.decode_refs(b''.join(self.read_container(source, engine)))
+        store = chunkstore.ChunkStore(os.path.join(self.result_path('encrypt'), chunkstore.FOLDER),
+                                      self.kdf_key(header.get('kdf')), container.header_codec(header),
+                                      container.header_cipher(header))
+        with atomic_output(target, self.fsync) as file:
+            for chunk in store.read(engine, refs):
+                with stats.timer('write', len(chunk)):
+                    file.write(chunk)
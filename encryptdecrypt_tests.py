@@ -18,13 +18,31 @@ Example:
 """
 
 
+import io
 import os
+import shutil
+import tempfile
+import tracemalloc
 import unittest
 from cryptography.fernet import Fernet
+import container
 from encryptdecrypt import EncryptDecrypt
 
 
+MEMORY_CEILING = 2 * 1024 * 1024
+
+
 class TestEncryptedDecrypted(unittest.TestCase):
+    def setUp(self):
+        """
+        Runs every test in its own temporary working directory, so the 'result' folder
+        written by the tests is never the one of the directory the suite is run from.
+        """
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(folder.name)
+
     def test_set_password(self, password='kacper95'):
         """
         Test case for the set_password method of the EncryptDecrypt class.
@@ -49,29 +67,35 @@ class TestEncryptedDecrypted(unittest.TestCase):
 
         os.remove(os.path.join('test_password_file.txt'))
 
-    def test_get_password(self):
+    def test_check_password(self):
         """
-        Test case for the get_password method of the EncryptDecrypt class.
-
-        This test validates whether the get_password method is able to
-        correctly return the password from the object instance and if it
-        matches the expected content from a file.
+        Test case for the check_password method of the EncryptDecrypt class.
 
-        This test will pass if the assertion in step 5 is True, signifying that
-        the password is correctly retrieved and matches the expected value.
+        The password file holds a salted verifier instead of the password, a correct
+        password gives the master key and a file with the password in plain text,
+        written by older versions, is replaced with a verifier.
         """
-        with open('test_password_file.txt', 'w', encoding='utf8') as file:
-            file.write('kacper95')
+        params = {'algorithm': 'pbkdf2-sha256', 'iterations': 1000}
+        encrypt_decrypt = EncryptDecrypt('random_directory', kdf_params=params)
+        encrypt_decrypt.password_file = 'test_password_file.txt'
+        encrypt_decrypt.set_password('kacper95')
+        master_key = encrypt_decrypt.master_key
 
         with open('test_password_file.txt', encoding='utf8') as file:
-            content = file.read()
-
-        encrypt_decrypt = EncryptDecrypt('random_directory')
-        encrypt_decrypt.set_password(content)
+            self.assertNotIn('kacper95', file.read())
+        checking = EncryptDecrypt('random_directory')
+        checking.password_file = 'test_password_file.txt'
+        self.assertFalse(checking.check_password('kacper96'))
+        self.assertIsNone(checking.master_key)
+        self.assertTrue(checking.check_password('kacper95'))
+        self.assertEqual(checking.master_key, master_key)
 
-        result = encrypt_decrypt.get_password()
-
-        self.assertEqual('kacper95', result)
+        with open('test_password_file.txt', 'w', encoding='utf8') as file:
+            file.write('kacper95')
+        self.assertFalse(checking.check_password('kacper9'))
+        self.assertTrue(checking.check_password('kacper95'))
+        with open('test_password_file.txt', encoding='utf8') as file:
+            self.assertNotIn('kacper95', file.read())
 
         os.remove(os.path.join('test_password_file.txt'))
 
@@ -139,8 +163,9 @@ class TestEncryptedDecrypted(unittest.TestCase):
         Test the decryption functionality of the EncryptDecrypt class.
 
         This function creates a temporary directory, writes sample text data to a file
-        in that directory, initializes an EncryptDecrypt instance, encrypts and then
-        decrypts the data, and tests whether the decrypted data matches the original.
+        in that directory, initializes an EncryptDecrypt instance, saves the encrypted data,
+        removes the original file, decrypts the saved data,
+        and tests whether the decrypted data matches the original.
         """
         temp_dir = 'random_directory1'
         os.mkdir(temp_dir)
@@ -150,8 +175,9 @@ class TestEncryptedDecrypted(unittest.TestCase):
             for text in sample_text:
                 file.write(f'{text}\n')
 
-        encrypt_decrypt = EncryptDecrypt('random_directory1')
-        encrypt_decrypt.encrypt()
+        encrypt_decrypt = EncryptDecrypt('random_directory1', word_mode=True)
+        encrypt_decrypt.save_encrypted_text()
+        os.remove(os.path.join(temp_dir, 'test_file.txt'))
         result = encrypt_decrypt.decrypt()
 
         self.assertIsInstance(result, list)
@@ -161,9 +187,693 @@ class TestEncryptedDecrypted(unittest.TestCase):
         for item in result:
             self.assertIsInstance(item, str)
 
-        os.remove(os.path.join(temp_dir, 'test_file.txt'))
         os.rmdir(temp_dir)
 
+    def test_decrypt_chunks(self):
+        """
+        Test that the chunked container keeps the exact text of the files,
+        including whitespace and characters split between chunks.
+        """
+        temp_dir = 'random_directory5'
+        os.mkdir(temp_dir)
+        sample_text = '  kacper\tkamil\n\n oliwia ąęść\n' * 20
+        with open(os.path.join(temp_dir, 'test_file.txt'), 'w', encoding='utf-8') as file:
+            file.write(sample_text)
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=7)
+        encrypt_decrypt.save_encrypted_text()
+        encrypt_decrypt.save_decrypted_text()
+
+        with open(encrypt_decrypt.result_path('decrypt'), encoding='utf-8', newline='') as file:
+            self.assertEqual(file.read(), sample_text)
+        self.assertEqual(''.join(encrypt_decrypt.decrypt()), sample_text)
+
+        shutil.rmtree(temp_dir)
+
+    def test_decrypt_chunks_with_workers(self):
+        """
+        Test that a directory encrypted by a pool of workers is decrypted
+        to the original text by another pool.
+        """
+        temp_dir = 'random_directory8'
+        os.mkdir(temp_dir)
+        sample_text = 'kacper kamil oliwia\n' * 100
+        with open(os.path.join(temp_dir, 'test_file.txt'), 'w', encoding='utf-8') as file:
+            file.write(sample_text)
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=64, workers=3)
+        encrypt_decrypt.mmap_threshold = 1
+        encrypt_decrypt.save_encrypted_text()
+        result = EncryptDecrypt(temp_dir, workers=2).decrypt()
+
+        self.assertEqual(''.join(result), sample_text)
+
+        shutil.rmtree(temp_dir)
+
+    def test_async_io_round_trip(self):
+        """
+        Test that the asyncio pipeline saves files which decrypt to the original text,
+        for a single container and per file.
+        """
+        temp_dir = 'random_directory11'
+        os.mkdir(temp_dir)
+        sample_text = 'kacper kamil oliwia\n' * 100
+        with open(os.path.join(temp_dir, 'test_file.txt'), 'w', encoding='utf-8') as file:
+            file.write(sample_text)
+
+        for per_file in (False, True):
+            encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=64, async_io=True, per_file=per_file)
+            encrypt_decrypt.save_encrypted_text()
+            encrypt_decrypt.save_decrypted_text()
+            decrypted = encrypt_decrypt.result_path('decrypt')
+            if per_file:
+                decrypted = os.path.join(decrypted, 'test_file.txt')
+            with open(decrypted, encoding='utf-8') as file:
+                self.assertEqual(file.read(), sample_text)
+            shutil.rmtree(encrypt_decrypt.new_folder)
+
+        shutil.rmtree(temp_dir)
+
+    def test_decrypt_chunks_out_of_order(self):
+        """
+        Test that swapping two chunks of the container is detected.
+        """
+        temp_dir = 'random_directory6'
+        os.mkdir(temp_dir)
+        with open(os.path.join(temp_dir, 'test_file.txt'), 'w', encoding='utf-8') as file:
+            file.write('kacper kamil oliwia')
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=4)
+        tokens = encrypt_decrypt.encrypt_chunks()
+        tokens[0], tokens[1] = tokens[1], tokens[0]
+        os.makedirs('result', exist_ok=True)
+        header = encrypt_decrypt.create_header()
+        del header['id']
+        with open(encrypt_decrypt.result_path('encrypt'), 'wb') as file:
+            container.write_header(file, header)
+            for token in tokens:
+                container.write_record(file, token)
+
+        with self.assertRaises(container.ContainerError):
+            encrypt_decrypt.decrypt()
+
+        shutil.rmtree(temp_dir)
+
+    def test_streaming_memory_ceiling(self):
+        """
+        Test that encrypting and decrypting a corpus larger than the memory ceiling
+        keeps the peak memory usage below the ceiling.
+        """
+        temp_dir = 'random_directory7'
+        os.makedirs(os.path.join(temp_dir, 'nested'))
+        line = 'kacper kamil oliwia ' * 50 + '\n'
+        for number in range(4):
+            path = os.path.join(temp_dir, 'nested' if number % 2 else '', f'file{number}.txt')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(line * (MEMORY_CEILING // len(line)))
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir)
+        encrypt_decrypt.create_kdf()
+        tracemalloc.start()
+        try:
+            encrypt_decrypt.save_encrypted_text()
+            encrypt_decrypt.save_decrypted_text()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, MEMORY_CEILING)
+        self.assertEqual(os.path.getsize(encrypt_decrypt.result_path('decrypt')),
+                         sum(os.path.getsize(path) for path in encrypt_decrypt.get_file()))
+
+        shutil.rmtree(temp_dir)
+
+    def test_save_encrypted_files_incremental(self):
+        """
+        Test that per-file encryption mirrors the directory, encrypts again only
+        changed and added files, removes outputs of deleted files and decrypts
+        every file back unchanged.
+        """
+        temp_dir = 'random_directory9'
+        os.makedirs(os.path.join(temp_dir, 'nested'))
+        contents = {'a.txt': 'kacper\n', os.path.join('nested', 'b.txt'): 'kamil\n',
+                    'c.txt': 'oliwia\n'}
+        for name, text in contents.items():
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as file:
+                file.write(text)
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, per_file=True)
+        first = encrypt_decrypt.save_encrypted_text()
+        second = encrypt_decrypt.save_encrypted_text()
+        with open(os.path.join(temp_dir, 'a.txt'), 'a', encoding='utf-8') as file:
+            file.write('appended\n')
+        os.remove(os.path.join(temp_dir, 'c.txt'))
+        third = encrypt_decrypt.save_encrypted_text()
+        encrypt_decrypt.save_decrypted_text()
+
+        self.assertEqual(first, {'encrypted': 3, 'unchanged': 0, 'removed': 0})
+        self.assertEqual(second, {'encrypted': 0, 'unchanged': 3, 'removed': 0})
+        self.assertEqual(third, {'encrypted': 1, 'unchanged': 1, 'removed': 1})
+        folder = encrypt_decrypt.result_path('encrypt')
+        self.assertTrue(os.path.exists(os.path.join(folder, 'nested', 'b.txt.encrypt')))
+        self.assertFalse(os.path.exists(os.path.join(folder, 'c.txt.encrypt')))
+        decrypted = encrypt_decrypt.result_path('decrypt')
+        with open(os.path.join(decrypted, 'a.txt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kacper\nappended\n')
+        with open(os.path.join(decrypted, 'nested', 'b.txt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kamil\n')
+
+        shutil.rmtree(temp_dir)
+
+    def test_dedup(self):
+        """
+        Test that identical content is stored once in the chunk store, that the files
+        decrypt back, and that chunks are removed once no file lists them.
+        """
+        temp_dir = 'random_directory19'
+        os.makedirs(temp_dir)
+        for name in ('a.txt', 'copy.txt'):
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as file:
+                file.write('kacper\n' * 100)
+
+        def stored_chunks():
+            store = os.path.join(encrypt_decrypt.result_path('encrypt'), '.chunks')
+            return sum(len(names) for _, _, names in os.walk(store))
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=70, dedup=True)
+        self.assertEqual(encrypt_decrypt.save_encrypted_text()['encrypted'], 2)
+        self.assertEqual(stored_chunks(), 1)
+        encrypt_decrypt.append_text_to_file('kamil', os.path.join(temp_dir, 'copy.txt'))
+        self.assertEqual(stored_chunks(), 2)
+        encrypt_decrypt.save_decrypted_text()
+        decrypted = encrypt_decrypt.result_path('decrypt')
+        with open(os.path.join(decrypted, 'a.txt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kacper\n' * 100)
+        with open(os.path.join(decrypted, 'copy.txt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kacper\n' * 100 + 'kamil\n')
+
+        os.remove(os.path.join(temp_dir, 'copy.txt'))
+        self.assertEqual(encrypt_decrypt.save_encrypted_text()['removed'], 1)
+        self.assertEqual(stored_chunks(), 1)
+        EncryptDecrypt(temp_dir, per_file=True).save_encrypted_text()
+        self.assertEqual(stored_chunks(), 0)
+        self.assertEqual(os.listdir(encrypt_decrypt.result_path('encrypt')).count('a.txt.chunks'), 0)
+
+        shutil.rmtree(temp_dir)
+
+    def test_kdf_in_header(self):
+        """
+        Test that containers store the configured key derivation with a random salt,
+        that a rewritten output keeps its salt and that any container decrypts.
+        """
+        temp_dir = 'random_directory15'
+        os.makedirs(temp_dir)
+        with open(os.path.join(temp_dir, 'log.txt'), 'w', encoding='utf-8') as file:
+            file.write('kacper\n' * 100)
+        scrypt = {'algorithm': 'scrypt', 'n': 1024, 'r': 8, 'p': 1}
+
+        first = EncryptDecrypt(temp_dir, kdf_params=scrypt)
+        first.save_encrypted_text()
+        with open(first.result_path('encrypt'), 'rb') as file:
+            header = container.read_header(file)
+        self.assertEqual({name: value for name, value in header['kdf'].items() if name != 'salt'},
+                         scrypt)
+        self.assertNotEqual(EncryptDecrypt(temp_dir).output_kdf()['salt'], header['kdf']['salt'])
+        rewriting = EncryptDecrypt(temp_dir, kdf_params=scrypt)
+        rewriting.save_encrypted_text()
+        self.assertEqual(rewriting.output_kdf(), header['kdf'])
+
+        default = EncryptDecrypt(temp_dir)
+        default.save_decrypted_text()
+        with open(default.result_path('decrypt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kacper\n' * 100)
+        with self.assertRaises(ValueError):
+            EncryptDecrypt(temp_dir, kdf_params={'algorithm': 'scrypt', 'n': 1000, 'r': 8, 'p': 1})
+
+        master = EncryptDecrypt(temp_dir, master_key=b'k' * 32)
+        master.save_encrypted_text()
+        self.assertEqual(master.output_kdf()['algorithm'], 'hkdf-sha256')
+        with self.assertRaises(container.ContainerError):
+            default.decrypt()
+        self.assertEqual(EncryptDecrypt(temp_dir, master_key=b'k' * 32).decrypt(), ['kacper\n' * 100])
+
+        shutil.rmtree(temp_dir)
+
+    def test_password_in_header(self):
+        """
+        Test that containers store the key derivation of the password, so they decrypt
+        after the password file is written again with the same password, and that
+        another password or the kdf_params of the command line are handled.
+        """
+        temp_dir = 'random_directory21'
+        os.makedirs(temp_dir)
+        with open(os.path.join(temp_dir, 'log.txt'), 'w', encoding='utf-8') as file:
+            file.write('kacper\n' * 100)
+        password_file = f'{temp_dir}.password'
+        pbkdf2 = {'algorithm': 'pbkdf2-sha256', 'iterations': 1000}
+
+        first = EncryptDecrypt(temp_dir, kdf_params=pbkdf2)
+        first.password_file = password_file
+        first.set_password('secret')
+        first.save_encrypted_text()
+        with open(first.result_path('encrypt'), 'rb') as file:
+            entry = container.read_header(file)['kdf']['password']
+        self.assertEqual(entry['iterations'], 1000)
+
+        second = EncryptDecrypt(temp_dir, kdf_params=pbkdf2)
+        second.password_file = password_file
+        second.set_password('secret')
+        self.assertNotEqual(second.master_key, first.master_key)
+        with self.assertRaises(container.ContainerError):
+            EncryptDecrypt(temp_dir, master_key=second.master_key).decrypt()
+        self.assertEqual(EncryptDecrypt(temp_dir, master_key=second.master_key,
+                                        password='secret').decrypt(), ['kacper\n' * 100])
+        with self.assertRaisesRegex(container.ContainerError, 'Wrong password'):
+            EncryptDecrypt(temp_dir, master_key=second.master_key, password='other').decrypt()
+
+        scrypt = {'algorithm': 'scrypt', 'n': 1024, 'r': 8, 'p': 1}
+        requested = EncryptDecrypt(temp_dir, kdf_params=scrypt, master_key=second.master_key,
+                                   password='secret')
+        requested.password_file = password_file
+        requested.save_encrypted_text()
+        with open(requested.result_path('encrypt'), 'rb') as file:
+            entry = container.read_header(file)['kdf']['password']
+        self.assertEqual(entry['algorithm'], 'scrypt')
+        self.assertEqual(EncryptDecrypt(temp_dir, password='secret').decrypt(), ['kacper\n' * 100])
+
+        os.remove(password_file)
+        shutil.rmtree(temp_dir)
+
+    def test_cipher_in_header(self):
+        """
+        Test that containers record their cipher, so an object with another cipher
+        decrypts them, appends to them and reads ranges of them.
+        """
+        temp_dir = 'random_directory16'
+        os.makedirs(temp_dir)
+        file_path = os.path.join(temp_dir, 'log.txt')
+
+        for cipher in ('aes-gcm', 'chacha20-poly1305'):
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.write('kacper\n' * 100)
+            encrypt_decrypt = EncryptDecrypt(file_path, chunk_size=64, cipher=cipher)
+            encrypt_decrypt.save_encrypted_text()
+            target = encrypt_decrypt.result_path('encrypt')
+            with open(target, 'rb') as file:
+                self.assertEqual(container.read_header(file)['cipher'], cipher)
+            default = EncryptDecrypt(file_path)
+            default.append_text_to_file('kamil', file_path)
+            self.assertEqual(''.join(default.decrypt()), 'kacper\n' * 100 + 'kamil\n')
+            self.assertEqual(default.decrypt_range(target, -6, 6), b'kamil\n')
+        with self.assertRaises(ValueError):
+            EncryptDecrypt(file_path, cipher='des')
+
+        shutil.rmtree(temp_dir)
+
+    def test_append_text_to_file(self):
+        """
+        Test that appended text is added to the encrypted copies without rewriting
+        their existing chunks, for a container, a per-file directory and a word-mode file,
+        and that a container cut before its index is rejected.
+        """
+        temp_dir = 'random_directory11'
+        os.makedirs(temp_dir)
+        file_path = os.path.join(temp_dir, 'log.txt')
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write('kacper\n' * 100)
+
+        single = EncryptDecrypt(file_path, chunk_size=64)
+        single.save_encrypted_text()
+        with open(single.result_path('encrypt'), 'rb') as file:
+            before = file.read()
+        with open(single.result_path('encrypt'), 'rb') as file:
+            header = container.read_header(file)
+            _, records_end = container.read_index(file, single.key_from_header(header))
+        single.append_text_to_file('kamil', file_path)
+        single.save_decrypted_text()
+        per_file = EncryptDecrypt(temp_dir, per_file=True)
+        per_file.save_encrypted_text()
+        per_file.append_text_to_file('oliwia', file_path)
+
+        with open(single.result_path('encrypt'), 'rb') as file:
+            self.assertEqual(file.read()[:records_end], before[:records_end])
+        with open(single.result_path('decrypt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kacper\n' * 100 + 'kamil\n')
+        self.assertEqual(per_file.save_encrypted_text(),
+                         {'encrypted': 0, 'unchanged': 1, 'removed': 0})
+        per_file.save_decrypted_text()
+        with open(os.path.join(per_file.result_path('decrypt'), 'log.txt'), encoding='utf-8') as file:
+            self.assertEqual(file.read(), 'kacper\n' * 100 + 'kamil\noliwia\n')
+
+        with open(single.result_path('encrypt'), 'wb') as file:
+            header = single.create_header()
+            container.write_header(file, header)
+            with single.create_engine() as engine:
+                for token in engine.encrypt(single.key_from_header(header), [b'first\n']):
+                    container.write_record(file, token)
+        with single.create_engine() as engine:
+            with self.assertRaises(container.ContainerError):
+                single.append_to_container(single.result_path('encrypt'), b'second\n', engine)
+        with self.assertRaises(container.ContainerError):
+            b''.join(single.iter_decrypt_bytes())
+        small = EncryptDecrypt(file_path, chunk_size=4)
+        encrypted = small.encrypt_bytes(b'aaaabbbbcccc')
+        self.assertEqual(small.decrypt_bytes(encrypted), b'aaaabbbbcccc')
+        file = io.BytesIO(encrypted)
+        entries, _ = container.read_index(file, small.key_from_header(container.read_header(file)))
+        with self.assertRaises(container.ContainerError):
+            small.decrypt_bytes(encrypted[:entries[2][0]])
+
+        words = EncryptDecrypt(file_path, word_mode=True)
+        words.save_encrypted_text()
+        words.append_text_to_file('ola ela', file_path)
+        self.assertEqual(words.decrypt()[-3:], ['oliwia', 'ola', 'ela'])
+
+        shutil.rmtree(temp_dir)
+
+    def test_interrupted_append(self):
+        """
+        Test that a container keeps its content when an append is interrupted,
+        that the next append continues it and that replaced indexes are compacted.
+        """
+        temp_dir = 'random_directory22'
+        os.makedirs(temp_dir)
+        file_path = os.path.join(temp_dir, 'log.txt')
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write('kacper\n')
+
+        encrypt_decrypt = EncryptDecrypt(file_path, chunk_size=16, fsync=True)
+        encrypt_decrypt.save_encrypted_text()
+        target = encrypt_decrypt.result_path('encrypt')
+        with open(target, 'ab') as file:
+            file.write(b'\0\0\0\x40partial record')
+        self.assertEqual(b''.join(encrypt_decrypt.iter_decrypt_bytes()), b'kacper\n')
+        self.assertEqual(encrypt_decrypt.decrypt_range(target, 0, 3), b'kac')
+
+        with encrypt_decrypt.create_engine() as engine:
+            for number in range(50):
+                encrypt_decrypt.append_to_container(target, f'{number}\n'.encode('ascii'), engine)
+        expected = 'kacper\n' + ''.join(f'{number}\n' for number in range(50))
+        self.assertEqual(b''.join(encrypt_decrypt.iter_decrypt_bytes()), expected.encode('ascii'))
+        with open(target, 'rb') as file:
+            header = container.read_header(file)
+            _, _, dead_size, end = container.find_index(file, encrypt_decrypt.key_from_header(header))
+        self.assertEqual(end, os.path.getsize(target))
+        self.assertLessEqual(dead_size * 2, end)
+
+        shutil.rmtree(temp_dir)
+
+    def test_spliced_record(self):
+        """
+        Test that a record copied between two containers written in the same run,
+        at the same position and with the same length, is rejected.
+        """
+        temp_dir = 'random_directory23'
+        os.makedirs(temp_dir)
+        for name, letter in [('a.txt', 'A'), ('b.txt', 'D')]:
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as file:
+                file.write(letter * 300)
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=100, per_file=True,
+                                         cipher='aes-gcm')
+        encrypt_decrypt.save_encrypted_text()
+        first, second = (os.path.join(encrypt_decrypt.result_path('encrypt'), f'{name}.encrypt')
+                         for name in ['a.txt', 'b.txt'])
+        with open(first, 'rb') as file:
+            header = container.read_header(file)
+            entries, _ = container.read_index(file, encrypt_decrypt.key_from_header(header))
+            file.seek(0)
+            data = file.read()
+        with open(second, 'rb') as file:
+            other = file.read()
+        start, end = entries[1][0], entries[2][0]
+        with open(first, 'wb') as file:
+            file.write(data[:start] + other[start:end] + data[end:])
+
+        with encrypt_decrypt.create_engine() as engine:
+            with self.assertRaises(container.ContainerError):
+                list(encrypt_decrypt.read_container(first, engine))
+
+    def test_append_to_enclosing_directory(self):
+        """
+        Test that appending to a file of an encrypted directory updates the output
+        of the directory: only the new text for the last file of a combined container
+        and for a per-file container, the whole container for another file.
+        """
+        temp_dir = 'random_directory25'
+        os.makedirs(os.path.join(temp_dir, 'sub'))
+        for name in ['a.txt', 'b.txt', os.path.join('sub', 'c.txt')]:
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as file:
+                file.write(f'{name}\n' * 20)
+        file_path = os.path.join(temp_dir, 'sub', 'c.txt')
+
+        def records(path, encrypt_decrypt):
+            with open(path, 'rb') as file:
+                header = container.read_header(file)
+                _, records_end = container.read_index(file, encrypt_decrypt.key_from_header(header))
+                file.seek(0)
+                return file.read(records_end)
+
+        def content(encrypt_decrypt):
+            data = b''
+            for path in encrypt_decrypt.get_file():
+                with open(path, 'rb') as file:
+                    data += file.read()
+            return data
+
+        combined = EncryptDecrypt(os.path.join(temp_dir, 'sub'), chunk_size=64)
+        combined.save_encrypted_text()
+        before = records(combined.result_path('encrypt'), combined)
+        EncryptDecrypt(file_path).append_text_to_file('kacper', file_path)
+        with open(combined.result_path('encrypt'), 'rb') as file:
+            encrypted = file.read()
+        self.assertEqual(encrypted[:len(before)], before)
+        self.assertEqual(combined.decrypt_bytes(encrypted), content(combined))
+
+        per_file = EncryptDecrypt(temp_dir, per_file=True)
+        per_file.save_encrypted_text()
+        target = os.path.join(per_file.result_path('encrypt'), 'sub', 'c.txt.encrypt')
+        before = records(target, per_file)
+        EncryptDecrypt(file_path).append_text_to_file('kamil', file_path)
+        with open(target, 'rb') as file:
+            self.assertEqual(file.read()[:len(before)], before)
+        self.assertEqual(per_file.save_encrypted_text(),
+                         {'encrypted': 0, 'unchanged': 3, 'removed': 0})
+        per_file.save_decrypted_text()
+        with open(os.path.join(per_file.result_path('decrypt'), 'sub', 'c.txt'), 'rb') as file:
+            self.assertTrue(file.read().endswith(b'kacper\nkamil\n'))
+
+        shutil.rmtree(per_file.result_path('encrypt'))
+        combined = EncryptDecrypt(temp_dir)
+        combined.save_encrypted_text()
+        files = combined.get_file()
+        for path, text in [(files[-1], 'oliwia'), (files[0], 'ola')]:
+            EncryptDecrypt(path).append_text_to_file(text, path)
+        with open(combined.result_path('encrypt'), 'rb') as file:
+            self.assertEqual(combined.decrypt_bytes(file.read()), content(combined))
+
+        shutil.rmtree(temp_dir)
+
+    def test_container_keys(self):
+        """
+        Test that the containers written in the same run share the key derivation
+        but have their own keys, and that the id of a container cannot be changed.
+        """
+        temp_dir = 'random_directory24'
+        os.makedirs(temp_dir)
+        for name in ['a.txt', 'b.txt']:
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as file:
+                file.write('kacper\n')
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, per_file=True)
+        encrypt_decrypt.save_encrypted_text()
+        headers = []
+        for name in ['a.txt', 'b.txt']:
+            with open(os.path.join(encrypt_decrypt.result_path('encrypt'), f'{name}.encrypt'),
+                      'rb') as file:
+                headers.append(container.read_header(file))
+        self.assertEqual(headers[0]['kdf'], headers[1]['kdf'])
+        self.assertNotEqual(headers[0]['id'], headers[1]['id'])
+        self.assertNotEqual(encrypt_decrypt.key_from_header(headers[0]),
+                            encrypt_decrypt.key_from_header(headers[1]))
+
+        encrypted = io.BytesIO(encrypt_decrypt.encrypt_bytes(b'kamil\n'))
+        header = container.read_header(encrypted)
+        records = encrypted.read()
+        without_id = dict(header)
+        del without_id['id']
+        for changed in [dict(header, id=headers[0]['id']), without_id, dict(header, id='-')]:
+            forged = io.BytesIO()
+            container.write_header(forged, changed)
+            with self.assertRaises(container.ContainerError):
+                encrypt_decrypt.decrypt_bytes(forged.getvalue() + records)
+
+        shutil.rmtree(temp_dir)
+
+    def test_decrypt_range(self):
+        """
+        Test that decrypt_range returns the same bytes as slicing the content,
+        also across appended segments, and that it reads only the chunks in the range.
+        """
+        temp_dir = 'random_directory12'
+        os.makedirs(temp_dir)
+        file_path = os.path.join(temp_dir, 'log.txt')
+        content = ''.join(f'line {number}\n' for number in range(50))
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+        encrypt_decrypt = EncryptDecrypt(file_path, chunk_size=16)
+        encrypt_decrypt.save_encrypted_text()
+        encrypt_decrypt.append_text_to_file('appended', file_path)
+        data = (content + 'appended\n').encode('utf-8')
+        target = encrypt_decrypt.result_path('encrypt')
+
+        for offset, length in [(0, 5), (10, 30), (16, 16), (len(data) - 3, 10), (-9, 9),
+                               (-1000, 4), (len(data), 5), (3, 0)]:
+            expected = data[max(len(data) + offset, 0) if offset < 0 else offset:][:length]
+            self.assertEqual(encrypt_decrypt.decrypt_range(target, offset, length), expected)
+        with open(target, 'r+b') as file:
+            header = container.read_header(file)
+            entries, _ = container.read_index(file, encrypt_decrypt.key_from_header(header))
+            file.seek(entries[1][0] + 10)
+            file.write(b'damaged')
+        self.assertEqual(encrypt_decrypt.decrypt_range(target, -9, 9), b'appended\n')
+        with self.assertRaises(Exception):
+            encrypt_decrypt.decrypt_range(target, 16, 5)
+
+        shutil.rmtree(temp_dir)
+
+    def test_compression_round_trip(self):
+        """
+        Test that compressed containers are smaller, are decrypted, appended to and read
+        in ranges without giving the codec again, and that the codec is checked.
+        """
+        temp_dir = 'random_directory13'
+        os.makedirs(temp_dir)
+        file_path = os.path.join(temp_dir, 'log.txt')
+        content = ''.join(f'INFO request {number} kacper kamil oliwia\n' for number in range(2000))
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(content)
+
+        for codec in ['zlib', 'lzma']:
+            compressed = EncryptDecrypt(file_path, chunk_size=4096, compression=codec)
+            compressed.save_encrypted_text()
+            self.assertLess(os.path.getsize(compressed.result_path('encrypt')), len(content) // 3)
+            compressed.append_text_to_file(codec, file_path)
+            content += f'{codec}\n'
+            reader = EncryptDecrypt(file_path, async_io=codec == 'lzma')
+            reader.save_decrypted_text()
+            with open(reader.result_path('decrypt'), encoding='utf-8') as file:
+                self.assertEqual(file.read(), content)
+            self.assertEqual(reader.decrypt_range(reader.result_path('encrypt'), -5000, 100),
+                             content.encode('utf-8')[-5000:-4900])
+            os.remove(reader.result_path('decrypt'))
+        with self.assertRaises(ValueError):
+            EncryptDecrypt(file_path, compression='brotli')
+
+        shutil.rmtree(temp_dir)
+
+    def test_save_encrypted_files_paths(self):
+        """
+        Test that only the given files are checked when the changed paths are known,
+        and that the given files which no longer exist are removed.
+        """
+        temp_dir = 'random_directory14'
+        os.makedirs(temp_dir)
+        for name in ['a.txt', 'b.txt', 'c.txt']:
+            with open(os.path.join(temp_dir, name), 'w', encoding='utf-8') as file:
+                file.write(name)
+        encrypt_decrypt = EncryptDecrypt(temp_dir, per_file=True)
+        encrypt_decrypt.save_encrypted_text()
+        for name in ['a.txt', 'b.txt']:
+            with open(os.path.join(temp_dir, name), 'a', encoding='utf-8') as file:
+                file.write('changed')
+        os.remove(os.path.join(temp_dir, 'c.txt'))
+
+        summary = encrypt_decrypt.save_encrypted_files([os.path.join(temp_dir, 'a.txt'),
+                                                        os.path.join(temp_dir, 'c.txt')])
+
+        self.assertEqual(summary, {'encrypted': 1, 'unchanged': 0, 'removed': 1})
+        self.assertEqual(encrypt_decrypt.save_encrypted_files(),
+                         {'encrypted': 1, 'unchanged': 1, 'removed': 0})
+
+        shutil.rmtree(temp_dir)
+
+    def test_binary_round_trip(self):
+        """
+        Test that files of any type are decrypted byte for byte, for a directory
+        encrypted per file and for a single file.
+        """
+        temp_dir = 'random_directory10'
+        os.makedirs(os.path.join(temp_dir, 'images'))
+        contents = {
+            'dump.bin': os.urandom(5000) + b'\xff\xfe\x00\r\n',
+            os.path.join('images', 'photo.jpg'): b'\xff\xd8\xff' + os.urandom(300),
+            'empty': b'',
+            'notes.txt': 'ąę\r\n  indented\n'.encode('utf-8'),
+        }
+        for name, data in contents.items():
+            with open(os.path.join(temp_dir, name), 'wb') as file:
+                file.write(data)
+
+        encrypt_decrypt = EncryptDecrypt(temp_dir, chunk_size=1000, binary=True)
+        encrypt_decrypt.mmap_threshold = 1024
+        encrypt_decrypt.save_encrypted_text()
+        encrypt_decrypt.save_decrypted_text()
+        single = EncryptDecrypt(os.path.join(temp_dir, 'dump.bin'), binary=True)
+        single.save_encrypted_text()
+        single.save_decrypted_text()
+
+        for name, data in contents.items():
+            with open(os.path.join(encrypt_decrypt.result_path('decrypt'), name), 'rb') as file:
+                self.assertEqual(file.read(), data)
+        with open(single.result_path('decrypt'), 'rb') as file:
+            self.assertEqual(file.read(), contents['dump.bin'])
+        with self.assertRaises(ValueError):
+            EncryptDecrypt(temp_dir, binary=True, word_mode=True)
+
+        shutil.rmtree(temp_dir)
+
+    def test_word_mode_master_key(self):
+        """
+        Test that with a master key the word mode is keyed with it, and that
+        word-mode files written with the key of older versions still decrypt.
+        """
+        temp_dir = 'random_directory20'
+        os.makedirs(temp_dir)
+        with open(os.path.join(temp_dir, 'log.txt'), 'w', encoding='utf-8') as file:
+            file.write('kacper kamil\n')
+
+        legacy = EncryptDecrypt(temp_dir, word_mode=True)
+        master = EncryptDecrypt(temp_dir, word_mode=True, master_key=b'k' * 32)
+        self.assertNotEqual(master.create_kdf(), legacy.create_kdf())
+        self.assertEqual(master.create_kdf(legacy=True), legacy.create_kdf())
+        legacy.save_encrypted_text()
+        self.assertEqual(master.decrypt(), ['kacper', 'kamil'])
+        master.save_encrypted_text()
+        self.assertEqual(master.decrypt(), ['kacper', 'kamil'])
+        with self.assertRaises(Exception):
+            legacy.decrypt()
+
+        shutil.rmtree(temp_dir)
+
+    def test_decrypt_legacy_lines(self):
+        """
+        Test that decrypt accepts '.encrypt' files whose lines were saved
+        as a bytes representation (b'...') by older versions.
+        """
+        encrypt_decrypt = EncryptDecrypt('random_directory4')
+        fernet = encrypt_decrypt.create_fernet()
+        os.makedirs('result', exist_ok=True)
+        with open(encrypt_decrypt.result_path('encrypt'), 'w', encoding='utf8') as file:
+            for text in ['kacper', 'kamil']:
+                file.write(f'{fernet.encrypt(text.encode("utf-8"))}\n')
+
+        result = encrypt_decrypt.decrypt()
+
+        self.assertEqual(result, ['kacper', 'kamil'])
+
+
     def test_save_encrypted_text(self):
         """
         Test the save_encrypted_text() function in the EncryptDecrypt class.
@@ -182,7 +892,7 @@ class TestEncryptedDecrypted(unittest.TestCase):
             for text in sample_text:
                 file.write(f'{text}\n')
 
-        encrypt_decrypt = EncryptDecrypt('random_directory2')
+        encrypt_decrypt = EncryptDecrypt('random_directory2', word_mode=True)
         encrypt_decrypt.encrypt()
         encrypt_decrypt.save_encrypted_text()
 
@@ -208,7 +918,7 @@ class TestEncryptedDecrypted(unittest.TestCase):
        Test the save_decrypted_text() function in the EncryptDecrypt class.
 
        This function creates a temporary directory, writes sample texts from a list to a file,
-       then uses EncryptDecrypt to encrypt, decrypt, and save the decrypted text to a file.
+       then uses EncryptDecrypt to save the encrypted text and save the decrypted text to a file.
        It checks whether the output file exists, contains the correct text data, and whether
        the number of lines in the output file matches the number of sample texts.
 
@@ -221,9 +931,8 @@ class TestEncryptedDecrypted(unittest.TestCase):
             for text in sample_text:
                 file.write(f'{text}\n')
 
-        encrypt_decrypt = EncryptDecrypt('random_directory3')
-        encrypt_decrypt.encrypt()
-        encrypt_decrypt.decrypt()
+        encrypt_decrypt = EncryptDecrypt('random_directory3', word_mode=True)
+        encrypt_decrypt.save_encrypted_text()
         encrypt_decrypt.save_decrypted_text()
 
         self.assertTrue(os.path.exists('result/random_directory3.decrypt'))
@@ -0,0 +1,222 @@
+""" This module defines the ParallelEngine class for encrypting chunks on many cores. """
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import ciphers
+import compressors
+import container
+from instrumentation import stats
+
+_ciphers = {}
+
+
+def _cipher(name, key):
+    """
+    Returns the cipher for the key, reusing it between the tasks of a worker.
+    """
+    cipher = _ciphers.get((name, key))
+    if cipher is None:
+        if len(_ciphers) >= 64:
+            _ciphers.clear()
+        cipher = _ciphers[name, key] = ciphers.create_cipher(name, key)
+    return cipher
+
+
+def _encrypt_task(key, index, chunk, codec=compressors.NONE, cipher=ciphers.FERNET):
+    return container.encrypt_chunk(_cipher(cipher, key), index, chunk, codec)
+
+
+def _decrypt_task(key, index, token, codec=compressors.NONE, cipher=ciphers.FERNET):
+    return container.decrypt_chunk(_cipher(cipher, key), index, token, codec)
+
+
+class ParallelEngine:
+    """
+    Class spreading encryption and decryption of chunks over a pool of workers.
+
+    The key is derived once by the caller and sent along with the chunks, every worker
+    creates its cipher object once per key. The results are returned in the order
+    of the input. Only a bounded number of chunks is in flight, so streaming the input
+    keeps the memory usage flat. Chunks are compressed and decompressed in the workers
+    as well, with the codec given to every call, and encrypted with the given cipher.
+
+    Attributes:
+        workers (int): The number of workers. With one worker no pool is created.
+        executor (Executor or None): The pool running the tasks.
+
+    Methods:
+        encrypt(key, chunks, start, codec, cipher): Yields the encrypted chunks in order.
+        decrypt(key, tokens, start, codec, cipher): Yields the decrypted chunks in order.
+        encrypt_indexed(key, items, codec, cipher): Encrypts chunks bound to the given positions.
+        decrypt_indexed(key, items, codec, cipher): Decrypts chunks bound to the given positions.
+        encrypt_async(key, index, chunk, codec, cipher): Encrypts a single chunk off the event loop.
+        decrypt_async(key, index, token, codec, cipher): Decrypts a single chunk off the event loop.
+        close(): Shuts the pool down.
+    """
+    def __init__(self, workers: int = 1, use_threads: bool = False):
+        """
+        Initializes the ParallelEngine object.
+
+        Args:
+            workers (int): The number of workers.
+            use_threads (bool): If True, a thread pool is used instead of a process pool.
+        """
+        if workers < 1:
+            raise ValueError('The number of workers must be at least 1')
+        self.workers = workers
+        self.max_pending = workers * 4
+        if workers == 1:
+            self.executor = None
+        elif use_threads:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Shuts the pool down, cancelling the tasks which have not started yet.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def _ordered(self, function, key, items):
+        """
+        Runs the function for the key and every (index, data) item and yields the results in order.
+        """
+        if self.executor is None:
+            for index, data in items:
+                yield function(key, index, data)
+            return
+        to_process = isinstance(self.executor, ProcessPoolExecutor)
+        pending = deque()
+        for index, data in items:
+            if to_process and isinstance(data, memoryview):
+                data = data.tobytes()
+            pending.append(self.executor.submit(function, key, index, data))
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def encrypt(self, key, chunks, start=0, codec=compressors.NONE, cipher=ciphers.FERNET):
+        """
+        Encrypts the chunks, each one bound to its position.
+
+        Args:
+            key (bytes): The 32 byte derived key.
+            chunks (Iterable[bytes or memoryview]): The plaintext chunks. Memory views
+                are copied only when they are sent to another process.
+            start (int): The position of the first chunk.
+            codec (str): The name of the codec compressing the chunks.
+            cipher (str): The name of the cipher encrypting the chunks.
+
+        Yields:
+            bytes: The encrypted chunks in the order of the input.
+        """
+        return self.encrypt_indexed(key, enumerate(chunks, start), codec, cipher)
+
+    def decrypt(self, key, tokens, start=0, codec=compressors.NONE, cipher=ciphers.FERNET):
+        """
+        Decrypts the chunks and checks their positions.
+
+        Args:
+            key (bytes): The 32 byte derived key.
+            tokens (Iterable[bytes]): The encrypted chunks.
+            start (int): The expected position of the first chunk.
+            codec (str): The name of the codec the chunks were compressed with.
+            cipher (str): The name of the cipher the chunks were encrypted with.
+
+        Yields:
+            bytes: The plaintext chunks in the order of the input.
+        """
+        return self.decrypt_indexed(key, enumerate(tokens, start), codec, cipher)
+
+    def encrypt_indexed(self, key, items, codec=compressors.NONE, cipher=ciphers.FERNET):
+        """
+        Encrypts the chunks, each one bound to the position given with it.
+
+        Args:
+            key (bytes): The 32 byte derived key.
+            items (Iterable[tuple of (int, bytes)]): The positions and the plaintext chunks.
+            codec (str): The name of the codec compressing the chunks.
+            cipher (str): The name of the cipher encrypting the chunks.
+
+        Yields:
+            bytes: The encrypted chunks in the order of the input.
+        """
+        task = partial(_encrypt_task, codec=codec, cipher=cipher)
+        return stats.iter_timed('encrypt', self._ordered(task, key, items))
+
+    def decrypt_indexed(self, key, items, codec=compressors.NONE, cipher=ciphers.FERNET):
+        """
+        Decrypts the chunks and checks that each one was bound to the position given with it.
+
+        Args:
+            key (bytes): The 32 byte derived key.
+            items (Iterable[tuple of (int, bytes)]): The expected positions and the encrypted chunks.
+            codec (str): The name of the codec the chunks were compressed with.
+            cipher (str): The name of the cipher the chunks were encrypted with.
+
+        Yields:
+            bytes: The plaintext chunks in the order of the input.
+        """
+        task = partial(_decrypt_task, codec=codec, cipher=cipher)
+        return stats.iter_timed('decrypt', self._ordered(task, key, items))
+
+    async def _run_async(self, stage, function, key, index, data):
+        """
+        Runs the function in the pool, or in a thread if there is no pool, and waits for it.
+
+        The time from the start of the call to its result is recorded for the stage.
+        """
+        start = stats.clock()
+        if self.executor is None:
+            result = await asyncio.to_thread(function, key, index, data)
+        else:
+            if isinstance(self.executor, ProcessPoolExecutor) and isinstance(data, memoryview):
+                data = data.tobytes()
+            result = await asyncio.wrap_future(self.executor.submit(function, key, index, data))
+        if stats.enabled:
+            stats.add(stage, stats.clock() - start, len(result))
+        return result
+
+    async def encrypt_async(self, key, index, chunk, codec=compressors.NONE, cipher=ciphers.FERNET):
+        """
+        Encrypts a single chunk in a worker without blocking the event loop.
+
+        Args:
+            key (bytes): The 32 byte derived key.
+            index (int): The position of the chunk.
+            chunk (bytes or memoryview): The plaintext chunk.
+            codec (str): The name of the codec compressing the chunk.
+            cipher (str): The name of the cipher encrypting the chunk.
+
+        Returns:
+            bytes: The encrypted chunk.
+        """
+        task = partial(_encrypt_task, codec=codec, cipher=cipher)
+        return await self._run_async('encrypt', task, key, index, chunk)
+
+    async def decrypt_async(self, key, index, token, codec=compressors.NONE, cipher=ciphers.FERNET):
+        """
+        Decrypts a single chunk in a worker without blocking the event loop.
+
+        Args:
+            key (bytes): The 32 byte derived key.
+            index (int): The expected position of the chunk.
+            token (bytes): The encrypted chunk.
+            codec (str): The name of the codec the chunk was compressed with.
+            cipher (str): The name of the cipher the chunk was encrypted with.
+
+        Returns:
+            bytes: The plaintext chunk.
+        """
+        task = partial(_decrypt_task, codec=codec, cipher=cipher)
+        return await self._run_async('decrypt', task, key, index, token)
@@ -0,0 +1,82 @@
+""" Module with tests for ParallelEngine class"""
+
+import os
+import unittest
+import container
+from engine import ParallelEngine
+
+
+class TestParallelEngine(unittest.TestCase):
+    """
+    Test suite for the ParallelEngine class functionalities.
+    """
+    def setUp(self):
+        """
+        Prepare a key and chunks of different contents.
+        """
+        self.key = os.urandom(32)
+        self.chunks = [os.urandom(number % 7 * 100) for number in range(50)]
+
+    def round_trip(self, workers, use_threads=False):
+        """
+        Encrypts and decrypts the chunks with the given workers.
+        """
+        with ParallelEngine(workers, use_threads) as engine:
+            tokens = list(engine.encrypt(self.key, iter(self.chunks)))
+            return tokens, list(engine.decrypt(self.key, iter(tokens)))
+
+    def test_process_pool_keeps_order(self):
+        """
+        Checks that a process pool returns the chunks in the order of the input.
+        """
+        _, result = self.round_trip(3)
+
+        self.assertEqual(result, self.chunks)
+
+    def test_thread_pool_keeps_order(self):
+        """
+        Checks that a thread pool returns the chunks in the order of the input.
+        """
+        _, result = self.round_trip(3, use_threads=True)
+
+        self.assertEqual(result, self.chunks)
+
+    def test_workers_are_compatible(self):
+        """
+        Checks that chunks encrypted by a pool can be decrypted without one.
+        """
+        tokens, _ = self.round_trip(2)
+        with ParallelEngine() as engine:
+            self.assertEqual(list(engine.decrypt(self.key, tokens)), self.chunks)
+
+    def test_many_keys(self):
+        """
+        Checks that chunks encrypted with different keys are decrypted with the right ones.
+        """
+        other_key = os.urandom(32)
+        with ParallelEngine(2, use_threads=True) as engine:
+            tokens = list(engine.encrypt(self.key, self.chunks))
+            other_tokens = list(engine.encrypt(other_key, self.chunks))
+
+            self.assertEqual(list(engine.decrypt(other_key, other_tokens)), self.chunks)
+            self.assertEqual(list(engine.decrypt(self.key, tokens)), self.chunks)
+
+    def test_error_in_worker(self):
+        """
+        Checks that an error raised in a worker process reaches the caller.
+        """
+        tokens, _ = self.round_trip(1)
+        with ParallelEngine(2) as engine:
+            with self.assertRaises(container.ContainerError):
+                list(engine.decrypt(self.key, reversed(tokens)))
+
+    def test_invalid_workers(self):
+        """
+        Checks that less than one worker is rejected.
+        """
+        with self.assertRaises(ValueError):
+            ParallelEngine(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+""" This module defines the FileIndex class remembering the state of processed files between runs. """
+import hashlib
+import os
+import sqlite3
+
+INDEX_FILE = '.cipherindex.sqlite'
+
+
+def fast_digest(path, block_size=1024 * 1024):
+    """
+    Computes a fast hash of the content of a file.
+
+    Args:
+        path (str): The path to the file.
+        block_size (int): The number of bytes read at a time.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+
+
+class FileIndex:
+    """
+    Class representing an SQLite index of the files seen by DirectoryFile.
+
+    For every file it records the inode, size, modification time and a fast hash
+    of the content, so later runs can tell unchanged files without opening them.
+    Changes are written in a single transaction, committed when the index is closed
+    without an error, so an interrupted run never marks a file as processed.
+
+    Attributes:
+        path (str): The path to the SQLite database.
+
+    Methods:
+        entries_under(directory): Returns the records of the files in a directory.
+        update(path, stat, digest): Records the state of a file.
+        remove(path): Forgets a file.
+        commit(): Saves the changes.
+        rollback(): Discards the changes made since the last commit.
+        close(): Saves the changes and closes the database.
+    """
+    def __init__(self, path=INDEX_FILE):
+        """
+        Initializes the FileIndex object, creating the database if needed.
+
+        Args:
+            path (str): The path to the SQLite database.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+        self.close()
+
+    def entries_under(self, directory):
+        """
+        Returns the records of the files in a directory and its subdirectories.
+
+        The paths are compared byte for byte, so a directory whose name differs
+        only in case is not included.
+
+        Args:
+            directory (str): An absolute path to a directory or a single file.
+
+        Returns:
+            dict: Mapping of paths to (inode, size, mtime_ns, digest) tuples.
+        """
+        prefix = directory.rstrip(os.sep) + os.sep
+        end = prefix[:-1] + chr(ord(os.sep) + 1)
+        rows = self.connection.execute(
+            "SELECT path, inode, size, mtime_ns, digest FROM files "
+            "WHERE path = ? OR (path >= ? AND path < ?)", (directory, prefix, end))
+        return {row[0]: row[1:] for row in rows}
+
+    def update(self, path, stat, digest):
+        """
+        Records the state of a file.
+
+        Args:
+            path (str): The absolute path to the file.
+            stat (os.stat_result): The stat data of the file.
+            digest (str): The fast hash of the content.
+        """
+        self.connection.execute(
+            'INSERT OR REPLACE INTO files (path, inode, size, mtime_ns, digest) VALUES (?, ?, ?, ?, ?)',
+            (path, stat.st_ino, stat.st_size, stat.st_mtime_ns, digest))
+
+    def remove(self, path):
+        """
+        Forgets a file.
+        """
+        self.connection.execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def commit(self):
+        """
+        Saves the changes.
+        """
+        self.connection.commit()
+
+    def rollback(self):
+        """
+        Discards the changes made since the last commit.
+        """
+        self.connection.rollback()
+
+    def close(self):
+        """
+        Saves the changes and closes the database.
+        """
+        self.connection.commit()
+        self.connection.close()
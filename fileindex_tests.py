@@ -0,0 +1,81 @@
+""" Module with tests for FileIndex class"""
+
+import os
+import shutil
+import unittest
+from fileindex import FileIndex, fast_digest
+
+
+class TestFileIndex(unittest.TestCase):
+    """
+    Test suite for the FileIndex class functionalities.
+    """
+    def setUp(self):
+        """
+        Creates a folder with a file to index.
+        """
+        self.temp_dir = os.path.abspath('temp_index_dir')
+        os.mkdir(self.temp_dir)
+        self.index_path = os.path.join(self.temp_dir, 'index.sqlite')
+        self.file = os.path.join(self.temp_dir, 'file_1.txt')
+        with open(self.file, 'w', encoding='utf8') as file:
+            file.write('Example content')
+
+    def tearDown(self):
+        """
+        Removes the folder.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def test_update_and_reload(self):
+        """
+        Checks that a committed record is available after reopening the index.
+        """
+        with FileIndex(self.index_path) as index:
+            index.update(self.file, os.stat(self.file), fast_digest(self.file))
+
+        with FileIndex(self.index_path) as index:
+            entries = index.entries_under(self.temp_dir)
+
+        stat = os.stat(self.file)
+        self.assertEqual(entries, {self.file: (stat.st_ino, stat.st_size, stat.st_mtime_ns,
+                                               fast_digest(self.file))})
+
+    def test_entries_under_escapes_wildcards(self):
+        """
+        Checks that '_' and '%' in a directory name do not match other directories.
+        """
+        with FileIndex(self.index_path) as index:
+            index.update(self.file, os.stat(self.file), 'abc')
+            index.update(self.temp_dir + 'x/file.txt', os.stat(self.file), 'abc')
+
+            self.assertEqual(index.entries_under(self.temp_dir.replace('_', '%')), {})
+            self.assertEqual(list(index.entries_under(self.temp_dir)), [self.file])
+
+    def test_entries_under_is_case_sensitive(self):
+        """
+        Checks that a directory whose name differs only in case does not match.
+        """
+        with FileIndex(self.index_path) as index:
+            index.update(self.file, os.stat(self.file), 'abc')
+            index.update(os.path.join(self.temp_dir, 'data', 'a.txt'), os.stat(self.file), 'abc')
+
+            self.assertEqual(index.entries_under(os.path.join(self.temp_dir, 'Data')), {})
+            self.assertEqual(list(index.entries_under(os.path.join(self.temp_dir, 'data'))),
+                             [os.path.join(self.temp_dir, 'data', 'a.txt')])
+
+    def test_error_rolls_back(self):
+        """
+        Checks that changes made before an error are not saved.
+        """
+        with self.assertRaises(RuntimeError):
+            with FileIndex(self.index_path) as index:
+                index.update(self.file, os.stat(self.file), 'abc')
+                raise RuntimeError
+
+        with FileIndex(self.index_path) as index:
+            self.assertEqual(index.entries_under(self.temp_dir), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
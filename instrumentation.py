@@ -0,0 +1,292 @@
+"""
+Module with the instrumentation of the hot paths.
+
+The stages (directory scanning, reads, key derivation, encryption, decryption
+and writes) are timed with timers that can be nested: the time spent in an inner
+stage is not counted in the outer one, so the stages add up to the time of the run.
+Every stage counts the bytes it produces: the data read, the tokens encrypted,
+the data decrypted and the bytes written. The time of every call goes to a histogram with power-of-two buckets
+in microseconds, which gives the percentiles without keeping every sample.
+
+The instrumentation is off by default. While it is off, timer() returns a shared
+no-op context manager and iter_timed() returns the iterable unchanged, so the hot
+paths pay almost nothing for it. Work done in worker processes is seen from the main
+process only, as the time spent waiting for the results. In the asyncio pipeline
+the calls overlap, so the seconds of their stages may add up to more than the run.
+"""
+
+import contextlib
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BUCKETS = 32
+_NO_TIMER = contextlib.nullcontext()
+
+
+def peak_rss_kb():
+    """
+    Returns the peak resident memory of the process.
+
+    Returns:
+        int or None: The peak in KiB, or None where the resource module is unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Stats:
+    """
+    Class collecting the timings, byte counts and counters of the stages.
+
+    Attributes:
+        enabled (bool): Whether anything is recorded.
+        stages (dict): Mapping of the stage names to their calls, seconds, bytes,
+            longest call and histogram.
+        counters (dict): Mapping of the counter names to their values.
+
+    Methods:
+        enable(): Starts recording, from an empty state.
+        timer(stage, size): Returns a context manager timing a call of the stage.
+        iter_timed(stage, iterable, size): Times every item taken from the iterable.
+        add(stage, seconds, size): Records a call of the stage.
+        count(name, value): Adds to a counter.
+        report(): Returns the collected data.
+        format(style): Returns the collected data as text or JSON.
+    """
+    def __init__(self, enabled=False, clock=time.perf_counter):
+        """
+        Initializes the Stats object.
+
+        Args:
+            enabled (bool): Whether anything is recorded.
+            clock (Callable[[], float]): The clock, replaceable in tests.
+        """
+        self.enabled = enabled
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stages = {}
+        self.counters = {}
+        self.started = clock()
+
+    def enable(self):
+        """
+        Starts recording, from an empty state.
+        """
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+        self.started = self.clock()
+        self.enabled = True
+
+    def _stack(self):
+        """
+        Returns the stack of the running timers of the current thread.
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def _start(self):
+        """
+        Starts a timer, as a [start time, time of inner stages] frame on the stack.
+        """
+        frame = [self.clock(), 0.0]
+        self._stack().append(frame)
+        return frame
+
+    def _stop(self, frame, stage, size, count=True):
+        """
+        Stops a timer and records its time without the time of the inner stages.
+        """
+        elapsed = self.clock() - frame[0]
+        stack = self._stack()
+        stack.pop()
+        if stack:
+            stack[-1][1] += elapsed
+        self.add(stage, elapsed - frame[1], size, count)
+
+    def add(self, stage, seconds, size=0, count=True):
+        """
+        Records a call of the stage.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): The time of the call.
+            size (int): The number of bytes processed by the call.
+            count (bool): If False, only the time and the bytes are added.
+        """
+        bucket = min(int(max(seconds, 0.0) * 1e6).bit_length(), BUCKETS - 1)
+        with self.lock:
+            data = self.stages.get(stage)
+            if data is None:
+                data = self.stages[stage] = {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'max_s': 0.0,
+                                             'histogram': [0] * BUCKETS}
+            data['seconds'] += seconds
+            data['bytes'] += size
+            if count:
+                data['calls'] += 1
+                data['max_s'] = max(data['max_s'], seconds)
+                data['histogram'][bucket] += 1
+
+    def count(self, name, value=1):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (int): The value to add.
+        """
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def timer(self, stage, size=0):
+        """
+        Returns a context manager timing a call of the stage.
+
+        Args:
+            stage (str): The name of the stage.
+            size (int): The number of bytes processed by the call.
+
+        Returns:
+            ContextManager: The timer, or a no-op context manager when disabled.
+        """
+        if not self.enabled:
+            return _NO_TIMER
+        return self._timer(stage, size)
+
+    @contextlib.contextmanager
+    def _timer(self, stage, size):
+        frame = self._start()
+        try:
+            yield
+        finally:
+            self._stop(frame, stage, size)
+
+    def iter_timed(self, stage, iterable, size=len):
+        """
+        Times every item taken from the iterable as a call of the stage.
+
+        Args:
+            stage (str): The name of the stage.
+            iterable (Iterable): The items, produced by the work to time.
+            size (Callable or None): The function returning the number of bytes
+                of an item, None if the items are not counted in bytes.
+
+        Returns:
+            Iterable: The same items, or the unchanged iterable when disabled.
+        """
+        if not self.enabled:
+            return iterable
+        return self._iter_timed(stage, iterable, size)
+
+    def _iter_timed(self, stage, iterable, size):
+        iterator = iter(iterable)
+        try:
+            while True:
+                frame = self._start()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._stop(frame, stage, 0, count=False)
+                    return
+                except BaseException:
+                    self._stop(frame, stage, 0)
+                    raise
+                self._stop(frame, stage, 0 if size is None else size(item))
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    @staticmethod
+    def percentile(histogram, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction of the calls.
+
+        Args:
+            histogram (list of int): The numbers of calls in the buckets.
+            fraction (float): The fraction, e.g. 0.99 for the 99th percentile.
+
+        Returns:
+            float: The bound in seconds.
+        """
+        needed = fraction * sum(histogram)
+        seen = 0
+        for bucket, calls in enumerate(histogram):
+            seen += calls
+            if calls and seen >= needed:
+                return (1 << bucket) / 1e6
+        return 0.0
+
+    def report(self):
+        """
+        Returns the collected data.
+
+        Returns:
+            dict: The 'wall_s' time since recording started, the 'peak_rss_kb' memory,
+            the 'counters' and for every stage its calls, seconds, bytes, longest call,
+            50th, 95th and 99th percentile and its non-empty histogram buckets, keyed
+            by their upper bound in microseconds.
+        """
+        with self.lock:
+            stages = {}
+            for stage, data in self.stages.items():
+                histogram = data['histogram']
+                stages[stage] = {
+                    'calls': data['calls'],
+                    'seconds': data['seconds'],
+                    'bytes': data['bytes'],
+                    'max_s': data['max_s'],
+                    'p50_s': self.percentile(histogram, 0.5),
+                    'p95_s': self.percentile(histogram, 0.95),
+                    'p99_s': self.percentile(histogram, 0.99),
+                    'histogram_us': {str(1 << bucket): calls
+                                     for bucket, calls in enumerate(histogram) if calls},
+                }
+            counters = dict(self.counters)
+        return {'wall_s': self.clock() - self.started, 'peak_rss_kb': peak_rss_kb(),
+                'counters': counters, 'stages': stages}
+
+    def format(self, style='text'):
+        """
+        Returns the collected data as a table or as JSON.
+
+        Args:
+            style (str): 'text' or 'json'.
+
+        Returns:
+            str: The formatted report.
+        """
+        report = self.report()
+        if style == 'json':
+            import json
+            return json.dumps(report, indent=1, sort_keys=True)
+        lines = [f'{"stage":<8} {"calls":>8} {"seconds":>9} {"MB":>9} {"MB/s":>8} '
+                 f'{"p50 ms":>8} {"p99 ms":>8} {"max ms":>8}']
+        for stage, data in sorted(report['stages'].items()):
+            megabytes = data['bytes'] / 1e6
+            speed = f'{megabytes / data["seconds"]:.1f}' if data['bytes'] and data['seconds'] else ''
+            lines.append(f'{stage:<8} {data["calls"]:>8} {data["seconds"]:>9.4f} {megabytes:>9.2f} '
+                         f'{speed:>8} {data["p50_s"] * 1e3:>8.3f} {data["p99_s"] * 1e3:>8.3f} '
+                         f'{data["max_s"] * 1e3:>8.3f}')
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f'{name}: {value}')
+        peak = report['peak_rss_kb']
+        lines.append(f'wall time: {report["wall_s"]:.4f} s, peak memory: '
+                     f'{"unknown" if peak is None else f"{peak / 1024:.1f} MiB"}')
+        return '\n'.join(lines)
+
+
+stats = Stats()
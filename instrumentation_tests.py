@@ -0,0 +1,92 @@
+""" Module with tests for Stats class"""
+
+import json
+import unittest
+from instrumentation import BUCKETS, Stats
+
+
+class TestStats(unittest.TestCase):
+    """
+    Test suite for the timers, counters and reports.
+    """
+    def setUp(self):
+        """
+        Create enabled stats with a manual clock.
+        """
+        self.now = 0.0
+        self.stats = Stats(clock=lambda: self.now)
+        self.stats.enable()
+
+    def test_nested_timers(self):
+        """
+        Test that the time of an inner stage is not counted in the outer one.
+        """
+        with self.stats.timer('encrypt', 10):
+            self.now += 1.0
+            with self.stats.timer('write', 20):
+                self.now += 2.0
+            self.now += 0.5
+        stages = self.stats.report()['stages']
+        self.assertEqual(stages['encrypt']['seconds'], 1.5)
+        self.assertEqual(stages['encrypt']['bytes'], 10)
+        self.assertEqual(stages['write']['seconds'], 2.0)
+        self.assertEqual(stages['write']['calls'], 1)
+
+    def test_iter_timed(self):
+        """
+        Test that every item is timed and its size is counted, and that the time
+        spent by the consumer of the items is not.
+        """
+        def produce():
+            for item in (b'ab', b'cde'):
+                self.now += 1.0
+                yield item
+
+        items = []
+        for item in self.stats.iter_timed('read', produce()):
+            self.now += 10.0
+            items.append(item)
+        self.assertEqual(items, [b'ab', b'cde'])
+        read = self.stats.report()['stages']['read']
+        self.assertEqual((read['calls'], read['seconds'], read['bytes']), (2, 2.0, 5))
+
+    def test_disabled(self):
+        """
+        Test that nothing is recorded and the iterable is returned unchanged when disabled.
+        """
+        stats = Stats()
+        items = [b'a']
+        self.assertIs(stats.iter_timed('read', items), items)
+        with stats.timer('kdf'):
+            pass
+        stats.count('files', 3)
+        self.assertEqual(stats.report()['stages'], {})
+        self.assertEqual(stats.report()['counters'], {})
+
+    def test_percentile(self):
+        """
+        Test the percentiles computed from the histogram buckets.
+        """
+        histogram = [0] * BUCKETS
+        histogram[3] = 98
+        histogram[10] = 2
+        self.assertEqual(Stats.percentile(histogram, 0.5), 8 / 1e6)
+        self.assertEqual(Stats.percentile(histogram, 0.99), 1024 / 1e6)
+        self.assertEqual(Stats.percentile([0] * BUCKETS, 0.5), 0.0)
+
+    def test_format(self):
+        """
+        Test the text and JSON reports.
+        """
+        self.stats.add('decrypt', 0.002, 1000)
+        self.stats.count('files encrypted', 2)
+        report = json.loads(self.stats.format('json'))
+        self.assertEqual(report['counters'], {'files encrypted': 2})
+        self.assertEqual(report['stages']['decrypt']['histogram_us'], {'2048': 1})
+        text = self.stats.format()
+        self.assertIn('decrypt', text)
+        self.assertIn('files encrypted: 2', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+"""
+Module with the key derivation functions turning the secret into encryption keys.
+
+Two algorithms are supported: PBKDF2-HMAC-SHA256, whose cost is the number
+of iterations, and the memory-hard Scrypt, whose cost is the N parameter
+(with r = 8, every derivation uses 128 * N * 8 bytes of memory). The parameters
+are stored in the header of every container together with its salt, so
+a container can be decrypted whatever the parameters used to write it.
+
+The cost to choose depends on the host: calibrate() measures the derivation
+and returns the cost taking about the target time. The costs are capped, so
+a container with a hostile header cannot stall the program for hours.
+
+Once the password has been checked, its derived key is the master key and the key
+of every container is derived from it with HKDF-SHA256 and the salt of the container,
+which costs microseconds. Such containers have 'hkdf-sha256' in their header.
+
+The derivations use hashlib and hmac, so checking the password does not need
+to import cryptography.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+
+PBKDF2 = 'pbkdf2-sha256'
+SCRYPT = 'scrypt'
+HKDF = 'hkdf-sha256'
+ALGORITHMS = (PBKDF2, SCRYPT)
+DEFAULT_COSTS = {PBKDF2: 390000, SCRYPT: 2 ** 15}
+SCRYPT_R = 8
+SCRYPT_P = 1
+MAX_SCRYPT_N = 2 ** 20
+MAX_SCRYPT_P = 16
+MAX_PBKDF2_ITERATIONS = 10 ** 7
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+
+def create_params(algorithm=PBKDF2, cost=None):
+    """
+    Creates the parameters of a key derivation.
+
+    Args:
+        algorithm (str): One of ALGORITHMS.
+        cost (int or None): The iterations of PBKDF2 or the N of Scrypt,
+            DEFAULT_COSTS by default.
+
+    Returns:
+        dict: The parameters, as stored in the header without the salt.
+
+    Raises:
+        ValueError: If the algorithm is unknown or the cost is invalid.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'Unsupported key derivation: {algorithm}')
+    cost = DEFAULT_COSTS[algorithm] if cost is None else cost
+    if algorithm == PBKDF2:
+        params = {'algorithm': PBKDF2, 'iterations': cost}
+    else:
+        params = {'algorithm': SCRYPT, 'n': cost, 'r': SCRYPT_R, 'p': SCRYPT_P}
+    return check_params(params)
+
+
+def check_params(params):
+    """
+    Checks the parameters of a key derivation, for example read from a header.
+
+    Args:
+        params (dict): The parameters, the salt and other fields are ignored.
+
+    Returns:
+        dict: The parameters without the salt.
+
+    Raises:
+        ValueError: If the algorithm is unknown or the parameters are invalid.
+    """
+    algorithm = params.get('algorithm')
+    if algorithm == PBKDF2:
+        checked = {'algorithm': PBKDF2, 'iterations': params.get('iterations')}
+        iterations = checked['iterations']
+        if not isinstance(iterations, int) or not 1 <= iterations <= MAX_PBKDF2_ITERATIONS:
+            raise ValueError(f'The number of iterations has to be between 1 and {MAX_PBKDF2_ITERATIONS}')
+        return checked
+    if algorithm == SCRYPT:
+        checked = {'algorithm': SCRYPT, 'n': params.get('n'), 'r': params.get('r'),
+                   'p': params.get('p')}
+        n = checked['n']
+        if not isinstance(n, int) or n < 2 or n & (n - 1) or n > MAX_SCRYPT_N:
+            raise ValueError(f'The Scrypt N has to be a power of 2 between 2 and {MAX_SCRYPT_N}')
+        if not all(isinstance(checked[name], int) and checked[name] >= 1 for name in ('r', 'p')):
+            raise ValueError('The Scrypt r and p have to be positive integers')
+        if n * checked['r'] > MAX_SCRYPT_N * SCRYPT_R or checked['p'] > MAX_SCRYPT_P:
+            raise ValueError(f'The Scrypt N * r has to be at most {MAX_SCRYPT_N * SCRYPT_R} '
+                             f'and p at most {MAX_SCRYPT_P}')
+        return checked
+    if algorithm == HKDF:
+        return {'algorithm': HKDF}
+    raise ValueError(f'Unsupported key derivation: {algorithm}')
+
+
+def create_header(params, salt):
+    """
+    Creates the description of a key derivation stored in the header of a container.
+
+    Args:
+        params (dict): The parameters.
+        salt (bytes): The salt.
+
+    Returns:
+        dict: The parameters with the salt encoded as base64.
+    """
+    return dict(check_params(params), salt=base64.b64encode(salt).decode('ascii'))
+
+
+def cache_parameters(params):
+    """
+    Returns the cost and the name identifying the parameters in the key cache.
+
+    The PBKDF2 keys keep the names they had before Scrypt was added,
+    so the keys already in a keyring are still found.
+
+    Args:
+        params (dict): The parameters.
+
+    Returns:
+        tuple of (int, str): The cost and the name of the derivation.
+    """
+    if params['algorithm'] == PBKDF2:
+        return params['iterations'], PBKDF2
+    return params['n'], f'{SCRYPT}-r{params["r"]}-p{params["p"]}'
+
+
+def derive(secret, salt, params):
+    """
+    Derives a key from the secret.
+
+    Args:
+        secret (bytes): The secret.
+        salt (bytes): The salt.
+        params (dict): The parameters.
+
+    Returns:
+        bytes: The key of KEY_SIZE bytes.
+    """
+    if params['algorithm'] == PBKDF2:
+        return hashlib.pbkdf2_hmac('sha256', secret, salt, params['iterations'], KEY_SIZE)
+    if params['algorithm'] == HKDF:
+        return hkdf(secret, salt)
+    n, r, p = params['n'], params['r'], params['p']
+    return hashlib.scrypt(secret, salt=salt, n=n, r=r, p=p, dklen=KEY_SIZE,
+                          maxmem=128 * r * (n + p + 2) + 1024)
+
+
+def hkdf(key, salt, info=b'container key'):
+    """
+    Derives a key from a master key with HKDF-SHA256 (RFC 5869).
+
+    Args:
+        key (bytes): The master key.
+        salt (bytes): The salt.
+        info (bytes): The purpose of the key, so keys for other purposes differ.
+
+    Returns:
+        bytes: The key of KEY_SIZE bytes.
+    """
+    pseudorandom_key = hmac.new(salt, key, hashlib.sha256).digest()
+    return hmac.new(pseudorandom_key, info + b'\x01', hashlib.sha256).digest()[:KEY_SIZE]
+
+
+def time_derivation(params, clock=time.perf_counter):
+    """
+    Measures a single derivation with the parameters.
+
+    Returns:
+        float: The time in seconds.
+    """
+    start = clock()
+    derive(b'calibration', bytes(SALT_SIZE), params)
+    return clock() - start
+
+
+def calibrate(algorithm, target, clock=time.perf_counter):
+    """
+    Finds the cost of the algorithm taking about the target time on this host.
+
+    A first derivation warms up the library, so it is not measured. The time of PBKDF2
+    grows linearly with the iterations, so it is measured with a small number of them
+    and scaled. The N of Scrypt has to be a power of 2, so it is doubled until
+    a derivation takes the target time.
+
+    Args:
+        algorithm (str): One of ALGORITHMS.
+        target (float): The target time of a derivation in seconds.
+        clock (Callable[[], float]): The clock, replaceable in tests.
+
+    Returns:
+        tuple of (dict, float): The parameters and the measured time of a derivation with them.
+    """
+    time_derivation(create_params(algorithm, 2), clock)
+    if algorithm == PBKDF2:
+        probe = create_params(PBKDF2, 20000)
+        seconds = min(time_derivation(probe, clock) for _ in range(3))
+        iterations = min(max(1000, round(20000 * target / max(seconds, 1e-9), -3)),
+                         MAX_PBKDF2_ITERATIONS)
+        params = create_params(PBKDF2, int(iterations))
+        return params, time_derivation(params, clock)
+    params = create_params(algorithm, 2 ** 10)
+    seconds = time_derivation(params, clock)
+    while seconds < target and params['n'] < MAX_SCRYPT_N:
+        larger = create_params(algorithm, params['n'] * 2)
+        larger_seconds = time_derivation(larger, clock)
+        if larger_seconds - target > target - seconds:
+            break
+        params, seconds = larger, larger_seconds
+    return params, seconds
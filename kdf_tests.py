@@ -0,0 +1,55 @@
+""" Module with tests for the key derivation functions"""
+
+import unittest
+import kdf
+
+
+class TestKdf(unittest.TestCase):
+    """
+    Test suite for the parameters, the derivation and the calibration.
+    """
+    def test_create_params(self):
+        """
+        Test the default parameters and the rejection of invalid ones.
+        """
+        self.assertEqual(kdf.create_params(), {'algorithm': 'pbkdf2-sha256', 'iterations': 390000})
+        self.assertEqual(kdf.create_params('scrypt', 1024),
+                         {'algorithm': 'scrypt', 'n': 1024, 'r': 8, 'p': 1})
+        for algorithm, cost in (('scrypt', 1000), ('pbkdf2-sha256', 0), ('argon2', None),
+                                ('pbkdf2-sha256', 10 ** 9), ('scrypt', 2 ** 21)):
+            with self.assertRaises(ValueError):
+                kdf.create_params(algorithm, cost)
+        for params in ({'algorithm': 'scrypt', 'n': 2 ** 20, 'r': 1024, 'p': 1},
+                       {'algorithm': 'scrypt', 'n': 1024, 'r': 8, 'p': 10 ** 6}):
+            with self.assertRaises(ValueError):
+                kdf.check_params(params)
+
+    def test_derive(self):
+        """
+        Test that the key depends on the salt and the parameters, and that
+        the header holds everything needed to derive it again.
+        """
+        params = kdf.create_params('scrypt', 1024)
+        header = kdf.create_header(params, b'salt' * 4)
+        self.assertEqual(kdf.check_params(header), params)
+        key = kdf.derive(b'secret', b'salt' * 4, params)
+        self.assertEqual(len(key), kdf.KEY_SIZE)
+        self.assertEqual(kdf.derive(b'secret', b'salt' * 4, params), key)
+        self.assertNotEqual(kdf.derive(b'secret', b'other' * 4, params), key)
+        self.assertNotEqual(kdf.derive(b'secret', b'salt' * 4, kdf.create_params('scrypt', 2048)), key)
+        self.assertNotEqual(kdf.derive(b'secret', b'salt' * 4, kdf.create_params('pbkdf2-sha256', 10)),
+                            key)
+
+    def test_calibrate(self):
+        """
+        Test that the calibrated parameters are valid and take about the target time.
+        """
+        for algorithm in kdf.ALGORITHMS:
+            params, seconds = kdf.calibrate(algorithm, 0.02)
+            self.assertEqual(kdf.check_params(params), params)
+            self.assertEqual(params['algorithm'], algorithm)
+            self.assertLess(seconds, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
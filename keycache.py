@@ -0,0 +1,193 @@
+""" This module defines the KeyCache class for reusing derived keys within a process. """
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+class KeyCache:
+    """
+    Class representing an in-memory cache of keys produced by a key derivation function.
+
+    Keys are looked up by (secret, salt, iterations, algorithm), so the expensive
+    derivation runs once per process for every distinct set of parameters.
+    The secret itself is never stored, only its SHA-256 digest.
+
+    Attributes:
+        max_entries (int or None): Maximum number of cached keys, the least recently used
+            key is evicted first. None means no limit.
+        ttl (float or None): Number of seconds a key stays valid. None means no expiry.
+        keyring_file (str or None): Path to a file where keys are persisted wrapped
+            with the wrapping key. None disables persistence.
+
+    Methods:
+        get_or_derive(secret, salt, iterations, algorithm, derive): Returns a cached key
+            or derives, caches and returns a new one.
+        evict(secret, salt, iterations, algorithm): Removes and zeroes a single key.
+        clear(): Removes and zeroes all cached keys.
+    """
+    def __init__(self, max_entries=None, ttl=None, keyring_file=None, wrapping_key=None,
+                 clock=time.monotonic):
+        """
+        Initializes the KeyCache object.
+
+        Args:
+            max_entries (int or None): Maximum number of cached keys.
+            ttl (float or None): Number of seconds a key stays valid.
+            keyring_file (str or None): Path to the keyring file used for persistence.
+            wrapping_key (bytes or None): 16, 24 or 32 byte AES key used to wrap
+                the persisted keys. Required when keyring_file is given.
+            clock (callable): Function returning the current time in seconds.
+        """
+        if keyring_file is not None and wrapping_key is None:
+            raise ValueError('A wrapping key is required to use a keyring file')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.keyring_file = keyring_file
+        self.wrapping_key = wrapping_key
+        self.clock = clock
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        self._expire()
+        return len(self._entries)
+
+    @staticmethod
+    def _fingerprint(secret, salt, iterations, algorithm):
+        """
+        Builds the lookup key for the given derivation parameters.
+
+        Returns:
+            str: Hex digest identifying the parameters without revealing the secret.
+        """
+        digest = hashlib.sha256()
+        for part in (hashlib.sha256(secret).digest(), salt,
+                     str(iterations).encode('utf-8'), algorithm.encode('utf-8')):
+            digest.update(len(part).to_bytes(4, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _zero(key):
+        """
+        Overwrites the key buffer with zeros.
+        """
+        for index in range(len(key)):
+            key[index] = 0
+
+    def _expire(self):
+        """
+        Evicts every key older than the configured ttl.
+        """
+        if self.ttl is None:
+            return
+        now = self.clock()
+        for fingerprint in [fingerprint for fingerprint, (_, created) in self._entries.items()
+                            if now - created >= self.ttl]:
+            self._zero(self._entries.pop(fingerprint)[0])
+
+    def _store(self, fingerprint, key):
+        """
+        Adds the key to the cache, evicting the least recently used keys if needed.
+        """
+        self._entries[fingerprint] = (bytearray(key), self.clock())
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._zero(self._entries.popitem(last=False)[1][0])
+
+    def get_or_derive(self, secret, salt, iterations, algorithm, derive):
+        """
+        Returns the key for the given parameters, deriving it only on a cache miss.
+
+        Args:
+            secret (bytes): The secret the key is derived from.
+            salt (bytes): The salt used by the key derivation function.
+            iterations (int): The number of iterations of the key derivation function.
+            algorithm (str): The name of the key derivation algorithm.
+            derive (callable): Function without arguments returning the derived key.
+
+        Returns:
+            bytes: The derived key.
+        """
+        self._expire()
+        fingerprint = self._fingerprint(secret, salt, iterations, algorithm)
+        if fingerprint in self._entries:
+            self._entries.move_to_end(fingerprint)
+            return bytes(self._entries[fingerprint][0])
+
+        key = self._load(fingerprint)
+        if key is None:
+            key = derive()
+            self._save(fingerprint, key)
+        self._store(fingerprint, key)
+        return key
+
+    def evict(self, secret, salt, iterations, algorithm):
+        """
+        Removes the key for the given parameters from the cache and zeroes it.
+
+        Returns:
+            bool: True if a key was evicted, False otherwise.
+        """
+        fingerprint = self._fingerprint(secret, salt, iterations, algorithm)
+        entry = self._entries.pop(fingerprint, None)
+        if entry is None:
+            return False
+        self._zero(entry[0])
+        return True
+
+    def clear(self):
+        """
+        Removes all keys from the cache and zeroes them.
+        """
+        while self._entries:
+            self._zero(self._entries.popitem()[1][0])
+
+    def _read_keyring(self):
+        """
+        Reads the keyring file.
+
+        Returns:
+            dict: Mapping of fingerprints to base64 encoded wrapped keys.
+        """
+        try:
+            with open(self.keyring_file, 'r', encoding='utf8') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _load(self, fingerprint):
+        """
+        Loads and unwraps a persisted key.
+
+        Returns:
+            bytes or None: The key, or None if it is not in the keyring.
+        """
+        if self.keyring_file is None:
+            return None
+        wrapped = self._read_keyring().get(fingerprint)
+        if wrapped is None:
+            return None
+        from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap
+        try:
+            return aes_key_unwrap(self.wrapping_key, base64.b64decode(wrapped))
+        except InvalidUnwrap:
+            return None
+
+    def _save(self, fingerprint, key):
+        """
+        Wraps the key and persists it in the keyring file.
+        """
+        if self.keyring_file is None:
+            return
+        from cryptography.hazmat.primitives.keywrap import aes_key_wrap
+        keyring = self._read_keyring()
+        keyring[fingerprint] = base64.b64encode(aes_key_wrap(self.wrapping_key, key)).decode('ascii')
+        descriptor = os.open(self.keyring_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(descriptor, 'w', encoding='utf8') as file:
+            json.dump(keyring, file)
+
+
+default_cache = KeyCache()
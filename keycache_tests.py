@@ -0,0 +1,82 @@
+""" Module with tests for KeyCache class"""
+
+import os
+import unittest
+from keycache import KeyCache
+
+
+class TestKeyCache(unittest.TestCase):
+    """
+    Test suite for the KeyCache class functionalities.
+    """
+    def setUp(self):
+        """
+        Set up a counter of calls to the derivation function and a controllable clock.
+        """
+        self.calls = 0
+        self.now = 0.0
+
+    def derive(self):
+        """
+        Fake derivation function counting how many times it was called.
+        """
+        self.calls += 1
+        return bytes([self.calls]) * 32
+
+    def test_get_or_derive_derives_once(self):
+        """
+        Checks that the same parameters hit the cache and different ones miss it.
+        """
+        cache = KeyCache()
+        first = cache.get_or_derive(b'secret', b'salt', 10, 'pbkdf2-sha256', self.derive)
+        second = cache.get_or_derive(b'secret', b'salt', 10, 'pbkdf2-sha256', self.derive)
+        cache.get_or_derive(b'secret', b'salt', 11, 'pbkdf2-sha256', self.derive)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_lru_eviction_zeroes_key(self):
+        """
+        Checks that the least recently used key is evicted and its buffer is zeroed.
+        """
+        cache = KeyCache(max_entries=1)
+        cache.get_or_derive(b'secret', b'salt1', 10, 'pbkdf2-sha256', self.derive)
+        buffer = next(iter(cache._entries.values()))[0]
+        cache.get_or_derive(b'secret', b'salt2', 10, 'pbkdf2-sha256', self.derive)
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(bytes(buffer), bytes(32))
+
+    def test_ttl_expiry(self):
+        """
+        Checks that keys older than the ttl are derived again.
+        """
+        cache = KeyCache(ttl=5, clock=lambda: self.now)
+        cache.get_or_derive(b'secret', b'salt', 10, 'pbkdf2-sha256', self.derive)
+        self.now = 10.0
+        cache.get_or_derive(b'secret', b'salt', 10, 'pbkdf2-sha256', self.derive)
+
+        self.assertEqual(self.calls, 2)
+
+    def test_keyring_file(self):
+        """
+        Checks that a key persisted in the keyring file is reused by a new cache.
+        """
+        keyring_file = 'test_keyring.json'
+        try:
+            first = KeyCache(keyring_file=keyring_file, wrapping_key=b'k' * 32)
+            key = first.get_or_derive(b'secret', b'salt', 10, 'pbkdf2-sha256', self.derive)
+            second = KeyCache(keyring_file=keyring_file, wrapping_key=b'k' * 32)
+            result = second.get_or_derive(b'secret', b'salt', 10, 'pbkdf2-sha256', self.derive)
+
+            self.assertEqual(result, key)
+            self.assertEqual(self.calls, 1)
+            with open(keyring_file, encoding='utf8') as file:
+                self.assertNotIn(key.hex(), file.read())
+        finally:
+            os.remove(keyring_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
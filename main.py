@@ -6,23 +6,161 @@ performing encryption and decryption operations on the directory,
 and controlling the main program flow.
 
 Functions:
-    - set_password_if_not_set(directory):
-        Sets a password for the directory if it is not already set.
+    - set_password_if_not_set(parser):
+        Sets the access password if it is not already set.
+    - create_directory(parser, path, file_index, engine, master_key):
+        Creates the EncryptDecrypt object for a path with the options of the command line.
+    - encrypt_directory(directory), decrypt_directory(directory):
+        Encrypt or decrypt a directory and return a message about the result.
     - process_mode(parser, directory, saved_password):
         Processes the specified mode of operation for a directory.
+    - watch_directory(parser, directory):
+        Encrypts the files of a directory as soon as they change.
+    - process_batch(parser, file_index, master_key):
+        Encrypts or decrypts all targets of a batch in one process.
+    - serve(parser, master_key):
+        Runs the server answering encryption requests on a local socket.
+    - calibrate(parser):
+        Prints the key derivation cost taking the target time on this host.
+    - dispatch(parser, master_key): Runs the requested operation.
+    - run(parser): Checks the password and runs the requested operation.
     - main(): Main function for performing directory operations based on command-line arguments.
 
+The wrapper scripts run the program many times, so only the argument parser and
+the password file are imported at startup. The modules doing the work, together
+with cryptography and asyncio, are imported once the password has been checked.
 """
 
 import os.path
 import getpass
+import sys
 from parser import create_parser
-from encryptdecrypt import EncryptDecrypt
+import kdf
+from instrumentation import stats
+from passwordfile import PASSWORD_FILE, verify_password, write_password
 
 
-def set_password_if_not_set(directory):
+def set_password_if_not_set(parser):
     password_from_user = getpass.getpass('Enter the password: ')
-    return directory.set_password(password_from_user)
+    return write_password(password_from_user,
+                          params=kdf.create_params(parser.kdf or kdf.PBKDF2, parser.kdf_cost))
+
+
+def requested_kdf(parser):
+    """
+    Returns the key derivation asked for on the command line.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+
+    Returns:
+        dict or None: The parameters of --kdf and --kdf-cost, None if neither is given,
+        so the containers follow the password file.
+    """
+    if parser.kdf is None and parser.kdf_cost is None:
+        return None
+    return kdf.create_params(parser.kdf or kdf.PBKDF2, parser.kdf_cost)
+
+
+def create_directory(parser, path, file_index=None, engine=None, master_key=None):
+    """
+    Creates the EncryptDecrypt object for a path with the options of the command line.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+        path (str): The directory or file to operate on.
+        file_index (FileIndex or None): The index of the files seen in previous runs.
+        engine (ParallelEngine or None): The engine shared by all targets of a batch.
+        master_key (bytes or None): The key of the checked access password.
+
+    Returns:
+        EncryptDecrypt: The object operating on the path.
+    """
+    from encryptdecrypt import EncryptDecrypt
+    from scanner import DEFAULT_EXCLUDE
+    return EncryptDecrypt(path, word_mode=parser.words, workers=parser.workers,
+                          use_threads=parser.threads, per_file=parser.per_file,
+                          include=parser.include, exclude=DEFAULT_EXCLUDE + tuple(parser.exclude),
+                          file_index=file_index, binary=parser.binary, async_io=parser.async_io,
+                          compression=parser.compression, engine=engine,
+                          kdf_params=requested_kdf(parser), master_key=master_key,
+                          password=parser.accessPassword, cipher=parser.cipher,
+                          fsync=parser.fsync, dedup=parser.dedup)
+
+
+def encrypt_directory(directory):
+    """
+    Encrypts a directory unless its encrypted file is up to date.
+
+    Params:
+        directory (EncryptDecrypt): The directory to encrypt.
+
+    Returns:
+        str: The message about the result.
+    """
+    if directory.per_file:
+        if os.path.isfile(directory.result_path('encrypt')):
+            return 'Encrypted file already exists'
+        summary = directory.save_encrypted_files()
+        return (f'Encrypted: {summary["encrypted"]}, unchanged: {summary["unchanged"]}, '
+                f'removed: {summary["removed"]}')
+    if not os.path.exists(directory.result_path('encrypt')):
+        if directory.file_index is not None:
+            directory.has_changes()
+        directory.save_encrypted_text()
+        return 'Encrypted file has been saved'
+    if directory.file_index is not None and directory.has_changes():
+        directory.save_encrypted_text()
+        return 'Encrypted file has been updated'
+    return 'Encrypted file already exists'
+
+
+def decrypt_directory(directory):
+    """
+    Decrypts the encrypted file of a directory unless it is already decrypted.
+
+    Params:
+        directory (EncryptDecrypt): The directory to decrypt.
+
+    Returns:
+        str: The message about the result.
+    """
+    if not os.path.exists(directory.result_path('encrypt')):
+        return 'There is no file with encrypted text'
+    if os.path.exists(directory.result_path('decrypt')):
+        return 'Decrypted file already exists'
+    directory.save_decrypted_text()
+    return 'Decrypted file has been saved'
+
+
+def watch_directory(parser, directory):
+    """
+    Encrypts a directory per file and then every file created, modified or deleted in it,
+    until the program is interrupted or terminated.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+        directory (EncryptDecrypt): The directory to watch.
+    """
+    import signal
+    import threading
+    from engine import ParallelEngine
+    from watcher import Watcher
+    directory.per_file = True
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    watcher = Watcher(directory, parser.interval, parser.debounce)
+    with ParallelEngine(parser.workers, parser.threads) as engine:
+        directory.engine = engine
+        print(encrypt_directory(directory), flush=True)
+        try:
+            for files in watcher.watch(stop):
+                summary = directory.save_encrypted_files(files)
+                print(f'Changed: {len(files)}, encrypted: {summary["encrypted"]}, '
+                      f'removed: {summary["removed"]}', flush=True)
+        except KeyboardInterrupt:
+            pass
+    print('Stopped watching')
 
 
 def process_mode(parser, directory):
@@ -39,55 +177,207 @@ def process_mode(parser, directory):
         elif not os.path.exists(parser.directoryFile):
             print('The specified directory does not exist')
         elif parser.mode == 'encrypt':
-            if not os.path.exists(f'result/{parser.directoryFile.replace("/", "_")}.encrypt'):
-                directory.save_encrypted_text()
+            print(encrypt_directory(directory))
+        elif parser.mode == 'decrypt' and parser.range is not None:
+            if os.path.isfile(directory.result_path('encrypt')):
+                sys.stdout.buffer.write(directory.decrypt_range(directory.result_path('encrypt'),
+                                                                *parser.range))
+                sys.stdout.flush()
             else:
-                print('Encrypted file already exists')
+                print('There is no single file with encrypted text')
         elif parser.mode == 'decrypt':
-            if os.path.exists(f'result/{parser.directoryFile.replace("/", "_")}.encrypt'):
-                if not os.path.exists(f'result/{parser.directoryFile.replace("/", "_")}.decrypt'):
-                    directory.save_decrypted_text()
-                else:
-                    print('Decrypted file already exists')
-            else:
-                print('There is no file with encrypted text')
+            print(decrypt_directory(directory))
+        elif parser.mode == 'watch':
+            watch_directory(parser, directory)
         elif parser.mode == 'append':
             text = input('Write what you want to add to the file: ')
             print(directory.append_text_to_file(text, parser.directoryFile))
         elif parser.mode is None:
-            print('Add -m with one of the given options [encrypt, decrypt, append]')
+            print('Add -m with one of the given options '
+                  '[encrypt, decrypt, append, watch, serve, calibrate]')
         else:
             raise Exception('Unknown mode')
     except Exception as error:
+        if directory.file_index is not None:
+            directory.file_index.rollback()
         print(str(error))
 
 
-def main():
+def process_batch(parser, file_index=None, master_key=None):
     """
-    Main function for performing directory operations based on command-line arguments.
-    This function creates a command-line argument parser,
-     initializes a directory for encryption/decryption,
-    checks if a password is already set or sets it if not,
-     and then processes the specified mode of operation.
+    Encrypts or decrypts all targets of a batch in one process and prints a summary.
+
+    The targets share the derived key, kept by the key cache, and a single pool
+    of workers. A failing target is reported and the others are processed anyway.
+    With a file index, the changes are committed after every successful target.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+        file_index (FileIndex or None): The index of the files seen in previous runs.
+        master_key (bytes or None): The key of the checked access password.
     """
-    parser = create_parser()
-    directory = EncryptDecrypt(parser.directoryFile)
+    import batch
+    from engine import ParallelEngine
+    operations = {'encrypt': encrypt_directory, 'decrypt': decrypt_directory}
+    if parser.mode not in operations:
+        print('Use -m encrypt or -m decrypt with --targets and --job-file')
+        return
+    targets = batch.expand_targets(parser.targets, parser.job_file)
+
+    with ParallelEngine(parser.workers, parser.threads) as engine:
+        def operation(target):
+            if not os.path.exists(target):
+                raise FileNotFoundError('The specified directory does not exist')
+            directory = create_directory(parser, target, file_index, engine, master_key)
+            try:
+                message = operations[parser.mode](directory)
+            except Exception:
+                if file_index is not None:
+                    file_index.rollback()
+                raise
+            if file_index is not None:
+                file_index.commit()
+            return message
+
+        failed = 0
+        total = 0.0
+        for result in batch.run_batch(targets, operation):
+            failed += not result['ok']
+            total += result['seconds']
+            status = 'ok' if result['ok'] else 'FAILED'
+            print(f'{result["target"]}: {status}, {result["message"]} ({result["seconds"]:.2f} s)')
+    print(f'Processed {len(targets)} targets in {total:.2f} s, {failed} failed')
+
+
+def serve(parser, master_key=None):
+    """
+    Runs the server answering encryption requests until it is interrupted.
+
+    The key is derived before the server starts listening, so the first request
+    is as fast as the next ones. On a TCP port, a new token is saved in the token file
+    and the clients have to send it.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+    """
+    import asyncio
+    from engine import ParallelEngine
+    from server import CipherServer, create_token_file
+    path = parser.socket
+    if path is None and parser.port is None:
+        path = 'cipher.sock'
+    token = None
+    if path is None:
+        token = create_token_file(parser.token_file)
+        print(f'The token of the clients is saved in {parser.token_file}')
+    with ParallelEngine(parser.workers, parser.threads) as engine:
+        directory = create_directory(parser, parser.directoryFile, engine=engine,
+                                     master_key=master_key)
+        directory.output_key()
+        try:
+            asyncio.run(CipherServer(directory, token=token).serve_forever(path,
+                                                                           port=parser.port or 0))
+        except KeyboardInterrupt:
+            print('The server has been stopped')
+        finally:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            if token is not None and os.path.exists(parser.token_file):
+                os.remove(parser.token_file)
+
+
+def calibrate(parser):
+    """
+    Prints the cost of the chosen key derivation taking the target time on this host.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+    """
+    params, seconds = kdf.calibrate(parser.kdf or kdf.PBKDF2, parser.target)
+    cost = params['iterations'] if params['algorithm'] == kdf.PBKDF2 else params['n']
+    print(f'--kdf {params["algorithm"]} --kdf-cost {cost} takes {seconds:.3f} s '
+          f'(target {parser.target:.3f} s)')
+
+
+def dispatch(parser, master_key=None):
+    """
+    Runs the operation requested on the command line, once the password has been checked.
 
-    if not os.path.exists('password.txt'):
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+        master_key (bytes or None): The key of the checked access password,
+            from which the keys of the encrypted files are derived.
+    """
+    if parser.mode == 'serve':
+        serve(parser, master_key)
+        return
+    from fileindex import FileIndex
+    file_index = FileIndex() if parser.index else None
+    try:
+        if parser.targets or parser.job_file:
+            process_batch(parser, file_index, master_key)
+        else:
+            process_mode(parser, create_directory(parser, parser.directoryFile, file_index,
+                                                  master_key=master_key))
+    finally:
+        if file_index is not None:
+            file_index.close()
+
+
+def run(parser):
+    """
+    Checks if a password is already set or sets it if not, and then processes
+    the specified mode of operation.
+
+    The password is checked before anything heavy is imported or created. Its key,
+    derived once for the check, is the master key of the encrypted files.
+    The calibrate mode needs no password, so it can choose the key derivation
+    of the password before it is set with -p.
+
+    Params:
+        parser (argparse.Namespace): The parsed command-line arguments.
+    """
+    if parser.mode == 'calibrate':
+        calibrate(parser)
+    elif not os.path.exists(PASSWORD_FILE):
         if parser.password:
-            set_password_if_not_set(directory)
+            set_password_if_not_set(parser)
             print('Password has been set')
         elif not parser.password:
             print('You must provide a password using -p')
-    elif os.path.exists('password.txt') and parser.password:
+    elif os.path.exists(PASSWORD_FILE) and parser.password:
         print('The password has already been set')
     else:
-        access_password = directory.get_password()
-        if parser.accessPassword == access_password:
-            process_mode(parser, directory)
+        master_key = verify_password(parser.accessPassword)
+        if master_key is not None:
+            dispatch(parser, master_key)
         else:
             print('Wrong password')
 
 
+def main():
+    """
+    Main function for performing directory operations based on command-line arguments.
+    This function creates a command-line argument parser and runs the operation,
+    with --stats collecting the timings of the stages and with --profile under cProfile.
+    """
+    parser = create_parser()
+    if parser.stats:
+        stats.enable()
+    if parser.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            run(parser)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(parser.profile)
+    else:
+        run(parser)
+    if parser.stats:
+        print(stats.format(parser.stats), file=sys.stderr)
+
+
 if __name__ == '__main__':
     main()
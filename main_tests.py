@@ -0,0 +1,100 @@
+"""
+Tests for the startup of the program.
+
+The wrapper scripts run main.py many times, so the help and a rejected password
+must not import the modules doing the encryption. The imported modules are read
+from the output of python -X importtime.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ('cryptography', 'asyncio', 'concurrent.futures', 'encryptdecrypt', 'engine')
+MAIN = os.path.abspath('main.py')
+
+
+def imported_modules(*args, cwd=None):
+    """
+    Runs main.py with -X importtime.
+
+    Returns:
+        tuple of (str, dict): The output of the program and the mapping of the imported
+        modules to their cumulative import time in microseconds.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', MAIN, *args], cwd=cwd,
+                            capture_output=True, text=True, check=False)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return result.stdout, modules
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Test suite for the modules imported at startup.
+    """
+    def setUp(self):
+        """
+        Create a working directory with a saved password.
+        """
+        os.makedirs('temp_startup_dir')
+        with open(os.path.join('temp_startup_dir', 'password.txt'), 'w', encoding='utf8') as file:
+            file.write('kacper95')
+
+    def tearDown(self):
+        """
+        Remove the working directory.
+        """
+        shutil.rmtree('temp_startup_dir')
+
+    def assert_light(self, modules):
+        """
+        Assert that none of the heavy modules or their submodules were imported.
+        """
+        imported = [name for name in modules
+                    if any(name == heavy or name.startswith(f'{heavy}.') for heavy in HEAVY_MODULES)]
+        self.assertEqual(imported, [])
+
+    def test_help(self):
+        """
+        Test that the help does not import the heavy modules.
+        """
+        output, modules = imported_modules('--help', cwd='temp_startup_dir')
+        self.assertIn('usage', output)
+        self.assertIn('parser', modules)
+        self.assert_light(modules)
+
+    def test_wrong_password(self):
+        """
+        Test that a wrong password is rejected before the heavy modules are imported.
+        """
+        output, modules = imported_modules('-ap', 'wrong', '-m', 'encrypt', '-d', '.',
+                                           cwd='temp_startup_dir')
+        self.assertEqual(output.strip(), 'Wrong password')
+        self.assert_light(modules)
+
+    def test_right_password(self):
+        """
+        Test that the encryption modules are imported once the password is accepted.
+        """
+        _, modules = imported_modules('-ap', 'kacper95', cwd='temp_startup_dir')
+        self.assertIn('encryptdecrypt', modules)
+
+    def test_calibrate_without_password(self):
+        """
+        Test that the key derivation is calibrated before a password is set.
+        """
+        os.remove(os.path.join('temp_startup_dir', 'password.txt'))
+        output, _ = imported_modules('-m', 'calibrate', '--target', '0.001', cwd='temp_startup_dir')
+        self.assertIn('--kdf pbkdf2-sha256 --kdf-cost', output)
+        self.assertEqual(os.listdir('temp_startup_dir'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+""" This module defines the Manifest class describing files encrypted one by one. """
+import json
+import os
+from outputfile import atomic_output
+
+
+class Manifest:
+    """
+    Class representing the manifest of a mirrored, per-file encrypted directory.
+
+    For every source file it records the size, the modification time and a keyed hash
+    of the content, so unchanged files can be recognized on the next run. It also
+    records the key derivation of the directory, so the next run derives the same key.
+    With deduplication, it records the ids of the chunks of every file as well.
+
+    Attributes:
+        path (str): The path to the manifest file.
+        entries (dict): Mapping of paths relative to the source directory to their records.
+        kdf (dict or None): The key derivation parameters and salt of the containers.
+
+    Methods:
+        is_unchanged(relative_path, size, mtime_ns): Checks the recorded size and modification time.
+        chunks(relative_path): Returns the recorded chunk ids of a file.
+        update(relative_path, size, mtime_ns, digest, chunks): Records the state of a file.
+        remove(relative_path): Forgets a file.
+        save(): Writes the manifest to its file.
+    """
+    def __init__(self, path: str):
+        """
+        Initializes the Manifest object, loading the entries if the file exists.
+
+        Args:
+            path (str): The path to the manifest file.
+        """
+        self.path = path
+        self.kdf = None
+        try:
+            with open(path, 'r', encoding='utf8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            data = {'version': 2, 'files': {}}
+        if isinstance(data.get('version'), int):
+            self.entries = data['files']
+            self.kdf = data.get('kdf')
+        else:
+            self.entries = data
+
+    def is_unchanged(self, relative_path, size, mtime_ns):
+        """
+        Checks whether the file has the recorded size and modification time.
+
+        Returns:
+            bool: True if the file is known and both values match.
+        """
+        entry = self.entries.get(relative_path)
+        return entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns
+
+    def digest(self, relative_path):
+        """
+        Returns the recorded content hash of the file.
+
+        Returns:
+            str or None: The hex digest, or None if the file or its content is not known.
+        """
+        entry = self.entries.get(relative_path)
+        return None if entry is None else entry['digest']
+
+    def chunks(self, relative_path):
+        """
+        Returns the ids of the chunks of the file in the chunk store.
+
+        Returns:
+            list of str or None: The ids, or None if the file is not deduplicated.
+        """
+        entry = self.entries.get(relative_path)
+        return None if entry is None else entry.get('chunks')
+
+    def update(self, relative_path, size, mtime_ns, digest, chunks=None):
+        """
+        Records the state of the file.
+
+        Args:
+            relative_path (str): The path of the file relative to the source directory.
+            size (int): The size of the file in bytes.
+            mtime_ns (int): The modification time of the file in nanoseconds.
+            digest (str or None): The hex digest of the content, None if it is not known.
+            chunks (list of str or None): The ids of the chunks in the chunk store,
+                None if the file is not deduplicated.
+        """
+        self.entries[relative_path] = {'size': size, 'mtime_ns': mtime_ns, 'digest': digest}
+        if chunks is not None:
+            self.entries[relative_path]['chunks'] = chunks
+
+    def remove(self, relative_path):
+        """
+        Forgets the file.
+        """
+        self.entries.pop(relative_path, None)
+
+    def save(self):
+        """
+        Writes the manifest to its file, replacing the previous one only once it is complete.
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        content = json.dumps({'version': 2, 'kdf': self.kdf, 'files': self.entries},
+                             indent=1, sort_keys=True)
+        with atomic_output(self.path) as file:
+            file.write(content.encode('utf-8'))
@@ -0,0 +1,69 @@
+""" Module with tests for Manifest class"""
+
+import json
+import os
+import shutil
+import unittest
+from manifest import Manifest
+
+
+class TestManifest(unittest.TestCase):
+    """
+    Test suite for the Manifest class functionalities.
+    """
+    def tearDown(self):
+        """
+        Remove the folder with the manifest.
+        """
+        shutil.rmtree('temp_manifest_dir', ignore_errors=True)
+
+    def test_save_and_load(self):
+        """
+        Checks that the entries are written to the file and loaded back.
+        """
+        path = os.path.join('temp_manifest_dir', 'manifest.json')
+        manifest = Manifest(path)
+        manifest.update('a/file.txt', 10, 123, 'abc')
+        manifest.update('b.txt', 5, 321, 'def')
+        manifest.remove('b.txt')
+        manifest.save()
+
+        loaded = Manifest(path)
+
+        self.assertEqual(loaded.entries, {'a/file.txt': {'size': 10, 'mtime_ns': 123, 'digest': 'abc'}})
+        self.assertEqual(loaded.digest('a/file.txt'), 'abc')
+        self.assertIsNone(loaded.digest('b.txt'))
+
+    def test_kdf_and_legacy_format(self):
+        """
+        Checks that the key derivation is saved and that a manifest holding only the entries,
+        as written by older versions, is loaded.
+        """
+        path = os.path.join('temp_manifest_dir', 'manifest.json')
+        manifest = Manifest(path)
+        manifest.kdf = {'algorithm': 'pbkdf2-sha256', 'iterations': 10, 'salt': 'c2FsdA=='}
+        manifest.update('file.txt', 10, 123, 'abc')
+        manifest.save()
+        self.assertEqual(Manifest(path).kdf, manifest.kdf)
+
+        with open(path, 'w', encoding='utf8') as file:
+            json.dump({'file.txt': {'size': 10, 'mtime_ns': 123, 'digest': 'abc'}}, file)
+        legacy = Manifest(path)
+        self.assertIsNone(legacy.kdf)
+        self.assertTrue(legacy.is_unchanged('file.txt', 10, 123))
+
+    def test_is_unchanged(self):
+        """
+        Checks that a file is unchanged only if both the size and the modification time match.
+        """
+        manifest = Manifest(os.path.join('temp_manifest_dir', 'manifest.json'))
+        manifest.update('file.txt', 10, 123, 'abc')
+
+        self.assertTrue(manifest.is_unchanged('file.txt', 10, 123))
+        self.assertFalse(manifest.is_unchanged('file.txt', 11, 123))
+        self.assertFalse(manifest.is_unchanged('file.txt', 10, 124))
+        self.assertFalse(manifest.is_unchanged('other.txt', 10, 123))
+
+
+if __name__ == '__main__':
+    unittest.main()
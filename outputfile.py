@@ -0,0 +1,193 @@
+"""
+Module writing the output files in large batches and atomically.
+
+The data is collected in a buffer and handed to the operating system once the buffer
+holds BUFFER_SIZE bytes, so writing many small tokens costs a few system calls.
+The file is written under a temporary name in the folder of the target and renamed
+over it only when it is complete, so a crash or an error never leaves a half-written
+file: the target keeps either its previous or its new content. With fsync, the data
+and the rename are flushed to the disk before atomic_output() returns.
+
+Files updated in place, such as containers being appended to, are opened with
+locked_file(), which holds an exclusive lock on them, so the writers of all threads
+and processes take turns.
+"""
+
+import contextlib
+import os
+import threading
+from instrumentation import stats
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BUFFER_SIZE = 1024 * 1024
+
+
+class BufferedOutput:
+    """
+    Class collecting small writes in a buffer and writing them to a file in batches.
+
+    Writes larger than the buffer are passed to the file directly after the buffer.
+    A raw file may write only a part of the data, for example when the disk is full,
+    so the writes are repeated until all the data is written or the file raises an error.
+
+    Attributes:
+        file (BinaryIO): The file, best opened without buffering.
+        buffer_size (int): The number of bytes collected before they are written.
+    """
+    def __init__(self, file, buffer_size=BUFFER_SIZE):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        """
+        Adds data to the buffer and writes the buffer once it is full.
+
+        Args:
+            data (bytes or bytearray or memoryview): The data to write.
+        """
+        if len(self.buffer) + len(data) < self.buffer_size:
+            self.buffer += data
+            return
+        if self.buffer:
+            self.buffer += data
+            self.flush()
+        else:
+            self._write_all(data)
+
+    def writelines(self, items):
+        """
+        Writes every item of an iterable of bytes.
+        """
+        for data in items:
+            self.write(data)
+
+    def tell(self):
+        """
+        Returns the position in the file at which the next data will be written.
+        """
+        return self.file.tell() + len(self.buffer)
+
+    def flush(self):
+        """
+        Writes the data collected in the buffer to the file.
+        """
+        if self.buffer:
+            self._write_all(self.buffer)
+            self.buffer.clear()
+
+    def _write_all(self, data):
+        """
+        Writes the data to the file, repeating the call after a short write.
+        """
+        with memoryview(data) as view:
+            written = 0
+            while written < view.nbytes:
+                with view[written:] as rest:
+                    written += self.file.write(rest)
+
+
+def sync_directory(folder):
+    """
+    Flushes the entries of a folder to the disk, so a rename in it survives a crash.
+
+    Does nothing on systems which cannot open a folder, such as Windows.
+    """
+    try:
+        descriptor = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _thread_lock(path):
+    """
+    Holds a lock of the current process for a path, used where flock() is not available.
+    """
+    with _thread_locks_lock:
+        lock = _thread_locks.setdefault(os.path.realpath(path), threading.Lock())
+    with lock:
+        yield
+
+
+@contextlib.contextmanager
+def locked_file(path, mode='r+b'):
+    """
+    Opens an existing file holding an exclusive lock on it until the block ends.
+
+    Other threads and processes opening the file with locked_file() wait for the lock.
+    If the file was replaced, for example by atomic_output(), while waiting for the lock,
+    the new file is opened and locked instead, so the writes are never lost in the old one.
+    Without flock(), as on Windows, only the threads of the process take turns.
+
+    Args:
+        path (str): The path to the file.
+        mode (str): The mode the file is opened in.
+
+    Yields:
+        BinaryIO: The locked file.
+    """
+    if fcntl is None:
+        with _thread_lock(path), open(path, mode) as file:
+            yield file
+        return
+    while True:
+        file = open(path, mode)
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            if os.path.samestat(os.fstat(file.fileno()), os.stat(path)):
+                break
+        except BaseException:
+            file.close()
+            raise
+        file.close()
+    with file:
+        yield file
+
+
+@contextlib.contextmanager
+def atomic_output(path, fsync=False, buffer_size=BUFFER_SIZE):
+    """
+    Opens a file for writing which replaces the target only once it is complete.
+
+    If the block raises an exception, the temporary file is removed and the target
+    is left untouched.
+
+    Args:
+        path (str): The path to the target.
+        fsync (bool): If True, the file and its folder are flushed to the disk.
+        buffer_size (int): The number of bytes collected before they are written.
+
+    Yields:
+        BufferedOutput: The file to write to.
+    """
+    folder, name = os.path.split(path)
+    temporary = os.path.join(folder, f'.{name}.{os.getpid()}.{os.urandom(4).hex()}.tmp')
+    descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with open(descriptor, 'wb', buffering=0) as file:
+            output = BufferedOutput(file, buffer_size)
+            yield output
+            with stats.timer('write'):
+                output.flush()
+                if fsync:
+                    os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary)
+        raise
+    if fsync:
+        sync_directory(folder or '.')
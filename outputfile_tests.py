@@ -0,0 +1,115 @@
+""" Module with tests for the outputfile module"""
+
+import io
+import os
+import shutil
+import threading
+import unittest
+from outputfile import BufferedOutput, atomic_output, locked_file
+
+
+class CountingFile(io.BytesIO):
+    """
+    In-memory file counting the calls of write().
+    """
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+class ShortWriteFile(io.BytesIO):
+    """
+    In-memory file writing at most three bytes per call, as a raw file may.
+    """
+    def write(self, data):
+        return super().write(bytes(data[:3]))
+
+
+class TestOutputFile(unittest.TestCase):
+    """
+    Test suite for the buffered and atomic output files.
+    """
+    def setUp(self):
+        self.folder = 'random_directory17'
+        os.makedirs(self.folder)
+        self.path = os.path.join(self.folder, 'output.encrypt')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_buffered_output(self):
+        """
+        Checks that small writes are batched, large ones are passed through,
+        and that tell() includes the buffered data.
+        """
+        file = CountingFile()
+        output = BufferedOutput(file, buffer_size=100)
+        output.writelines(b'token\n' for _ in range(50))
+        self.assertEqual(output.tell(), 300)
+        output.write(b'x' * 500)
+        output.flush()
+
+        self.assertEqual(file.getvalue(), b'token\n' * 50 + b'x' * 500)
+        self.assertLessEqual(file.writes, 4)
+
+    def test_short_writes(self):
+        """
+        Checks that the writes are repeated until all the data is written.
+        """
+        file = ShortWriteFile()
+        output = BufferedOutput(file, buffer_size=10)
+        output.write(b'small')
+        output.write(b'x' * 20)
+        output.write(b'y' * 20)
+        output.flush()
+
+        self.assertEqual(file.getvalue(), b'small' + b'x' * 20 + b'y' * 20)
+
+    def test_atomic_output(self):
+        """
+        Checks that the target is replaced only by a complete file, is left untouched
+        by a failed write, and that no temporary file remains.
+        """
+        with atomic_output(self.path, fsync=True) as file:
+            file.write(b'first')
+        with self.assertRaises(RuntimeError):
+            with atomic_output(self.path) as file:
+                file.write(b'second' * 1000000)
+                raise RuntimeError('interrupted')
+
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), b'first')
+        self.assertEqual(os.listdir(self.folder), ['output.encrypt'])
+
+    def test_locked_file(self):
+        """
+        Checks that a writer waits for the lock and writes to the file which replaced
+        the one it was waiting for.
+        """
+        with open(self.path, 'wb') as file:
+            file.write(b'old')
+
+        def append():
+            with locked_file(self.path) as file:
+                file.seek(0, 2)
+                file.write(b'+appended')
+
+        with locked_file(self.path):
+            thread = threading.Thread(target=append)
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            with atomic_output(self.path) as file:
+                file.write(b'new')
+        thread.join()
+
+        with open(self.path, 'rb') as file:
+            self.assertEqual(file.read(), b'new+appended')
+
+
+if __name__ == '__main__':
+    unittest.main()
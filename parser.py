@@ -1,6 +1,9 @@
 """Module with parser function"""
 
 import argparse
+from ciphers import CIPHERS, FERNET
+from compressors import CODECS
+from kdf import ALGORITHMS, PBKDF2
 
 
 def create_parser(args=None):
@@ -21,15 +24,75 @@ def create_parser(args=None):
         description='You can use this program for secure message sending',
         formatter_class=argparse.RawTextHelpFormatter)
 
-    parser.add_argument('-m', '--mode', choices=['encrypt', 'decrypt', 'append'],
+    parser.add_argument('-m', '--mode', choices=['encrypt', 'decrypt', 'append', 'watch', 'serve',
+                                                    'calibrate'],
                         help='''Choose what you want to do:
     encrypt given file or files
     decrypt encrypted file or files
-    append -> decrypt file, append text and encrypt the file again '''
+    append -> decrypt file, append text and encrypt the file again
+    watch -> encrypt files as soon as they are created or modified
+    serve -> answer encryption requests on a local socket
+    calibrate -> find the --kdf-cost taking --target seconds on this host '''
                         )
     parser.add_argument('-p', '--password', help='Use this option to enter a password', action='store_true')
     parser.add_argument('-ap', '--accessPassword', help='Enter accessPassword', required=False)
     parser.add_argument('-d', '--directoryFile', help='directoryFile with files to process')
+    parser.add_argument('--targets', help='Directories, files or globs to encrypt or decrypt\n'
+                        'in one run, instead of -d', nargs='+', default=[])
+    parser.add_argument('--job-file', help='File listing the targets, one path or glob per line')
+    formats = parser.add_mutually_exclusive_group()
+    formats.add_argument('--words', help='Encrypt every word separately (legacy format)',
+                         action='store_true')
+    formats.add_argument('--binary', help='Encrypt files of any type byte for byte,\n'
+                         'a directory is encrypted per file', action='store_true')
 
-    args = parser.parse_args()
+    parser.add_argument('--include', help='Globs of the file names to process\n'
+                        '(default: *.txt, or * with --binary)', nargs='+')
+    parser.add_argument('--exclude', help='Globs of the files and directories to skip,\n'
+                        'rules from .cipherignore files are applied as well', nargs='+', default=[])
+    parser.add_argument('--per-file', help='Encrypt every file separately, only the changed ones\n'
+                        'are encrypted again on the next run', action='store_true')
+    parser.add_argument('--dedup', help='Encrypt every file separately and store identical chunks\n'
+                        'once, in result/<directory>.encrypt/.chunks', action='store_true')
+    parser.add_argument('--index', help='Remember the files in .cipherindex.sqlite to skip\n'
+                        'the unchanged ones on the next run', action='store_true')
+    parser.add_argument('--workers', help='Number of workers encrypting and decrypting in parallel',
+                        type=int, default=1)
+    parser.add_argument('--async-io', help='Overlap reading, encryption and writing\n'
+                        'in an asyncio pipeline', action='store_true')
+    parser.add_argument('--threads', help='Use threads instead of processes as workers',
+                        action='store_true')
+    parser.add_argument('--compression', help='Compress every chunk before encryption',
+                        choices=sorted(CODECS), default='none')
+    parser.add_argument('--cipher', help='The cipher encrypting every chunk, stored in the header,\n'
+                        'so decryption detects it', choices=CIPHERS, default=FERNET)
+    parser.add_argument('--fsync', help='Flush every output file to the disk before it replaces\n'
+                        'the previous one', action='store_true')
+    parser.add_argument('--interval', help='With -m watch, seconds between two scans of the directory',
+                        type=float, default=1.0)
+    parser.add_argument('--debounce', help='With -m watch, seconds a file has to stay unchanged\n'
+                        'before it is encrypted', type=float, default=1.0)
+    parser.add_argument('--socket', help='With -m serve, the path to the Unix socket\n'
+                        '(default: cipher.sock unless --port is given)')
+    parser.add_argument('--port', help='With -m serve, listen on this localhost TCP port instead',
+                        type=int)
+    parser.add_argument('--token-file', help='With -m serve --port, the file readable only by you\n'
+                        'where the token the clients have to send is saved', default='cipher.token')
+    parser.add_argument('--range', help='With -m decrypt, print only LENGTH bytes of the content\n'
+                        'starting at OFFSET (a negative OFFSET counts from the end)',
+                        nargs=2, type=int, metavar=('OFFSET', 'LENGTH'))
+    parser.add_argument('--kdf', help='The key derivation of the password, stored in the headers\n'
+                        'of the encrypted files with a random salt (default: the one of\n'
+                        f'the password file, {PBKDF2} for a new one)', choices=ALGORITHMS)
+    parser.add_argument('--kdf-cost', help='The iterations of pbkdf2-sha256 or the N of scrypt\n'
+                        '(default: 390000 or 32768), use -m calibrate to choose it', type=int)
+    parser.add_argument('--target', help='With -m calibrate, the time of a key derivation in seconds',
+                        type=float, default=0.5)
+    parser.add_argument('--stats', help='Print the time, bytes and latency percentiles of every stage\n'
+                        'and the peak memory to stderr, as text or json (default: text)',
+                        nargs='?', const='text', choices=['text', 'json'])
+    parser.add_argument('--profile', help='Run under cProfile and dump the profile to this file\n'
+                        '(read it with python -m pstats)', metavar='PATH')
+
+    args = parser.parse_args(args)
     return args
@@ -57,6 +57,14 @@ class TestCreateParser(unittest.TestCase):
             args = create_parser()
             self.assertTrue(args.password)
 
+    def test_range(self):
+        """
+        Test that --range is parsed into an offset and a length.
+        """
+        args = create_parser(['-m', 'decrypt', '--range', '-100', '50'])
+        self.assertEqual(args.range, [-100, 50])
+        self.assertIsNone(create_parser([]).range)
+
 
 if __name__ == '__main__':
     unittest.main()
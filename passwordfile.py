@@ -0,0 +1,203 @@
+"""
+Module saving and checking the access password of the program.
+
+The password itself is not saved. Its key is derived with the key derivation
+of the kdf module and a random salt, and the file holds the parameters, the salt
+and a verifier computed from the key with HMAC-SHA256:
+
+    {"version": 2, "kdf": {"algorithm": ..., "salt": ...}, "verifier": <base64>}
+
+A password is checked by deriving its key again and comparing the verifiers
+in constant time. The key of a correct password is returned, so it can be used as
+the master key of the containers without running the expensive derivation twice.
+The parameters, the salt and the verifier together form the password entry, which
+every container keyed from the master key stores in its header, so the password
+alone decrypts it, even with another password file or on another machine.
+Files written by older versions, holding the password in plain text, are still
+accepted and replaced with a verifier on the first successful check.
+
+It imports nothing but the standard library, so the command line can check
+the password before the modules doing the encryption are imported.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import kdf
+from instrumentation import stats
+from keycache import default_cache
+
+PASSWORD_FILE = 'password.txt'
+
+
+def compute_verifier(master_key):
+    """
+    Computes the verifier saved instead of the password.
+
+    Args:
+        master_key (bytes): The key derived from the password.
+
+    Returns:
+        bytes: The verifier, which does not reveal the key.
+    """
+    return hmac.new(master_key, b'password verifier', hashlib.sha256).digest()
+
+
+def derive_master_key(password, kdf_header, key_cache=default_cache):
+    """
+    Derives the key of a password with the parameters and the salt of a password file.
+
+    The key is kept in the key cache, so it is derived once per process.
+
+    Args:
+        password (str): The password.
+        kdf_header (dict): The key derivation parameters and the salt in base64.
+        key_cache (KeyCache): The cache of the derived keys.
+
+    Returns:
+        bytes: The master key.
+    """
+    params = kdf.check_params(kdf_header)
+    salt = base64.b64decode(kdf_header['salt'])
+    secret = password.encode('utf-8')
+    cost, name = kdf.cache_parameters(params)
+
+    def derive():
+        with stats.timer('kdf'):
+            return kdf.derive(secret, salt, params)
+
+    return key_cache.get_or_derive(secret, salt, cost, f'password-{name}', derive)
+
+
+def create_entry(password, params=None, key_cache=default_cache):
+    """
+    Derives the master key of a password with a random salt.
+
+    Args:
+        password (str): The password.
+        params (dict or None): The key derivation parameters, kdf.create_params() by default.
+        key_cache (KeyCache): The cache of the derived keys.
+
+    Returns:
+        tuple of (bytes, dict): The master key and the password entry: the parameters,
+        the salt and the verifier in base64.
+    """
+    kdf_header = kdf.create_header(kdf.create_params() if params is None else params,
+                                   os.urandom(kdf.SALT_SIZE))
+    master_key = derive_master_key(password, kdf_header, key_cache)
+    return master_key, dict(kdf_header,
+                            verifier=base64.b64encode(compute_verifier(master_key)).decode('ascii'))
+
+
+def check_entry(password, entry, key_cache=default_cache):
+    """
+    Checks a password against a password entry.
+
+    Args:
+        password (str): The password to check.
+        entry (dict): The parameters, the salt and the verifier of a password.
+        key_cache (KeyCache): The cache of the derived keys.
+
+    Returns:
+        bytes or None: The master key if the password is correct, None otherwise.
+    """
+    master_key = derive_master_key(password, entry, key_cache)
+    if not matches_entry(master_key, entry):
+        return None
+    return master_key
+
+
+def matches_entry(master_key, entry):
+    """
+    Checks whether a master key is the one of a password entry, without a derivation.
+
+    Returns:
+        bool: True if the verifier of the key is the one of the entry.
+    """
+    return hmac.compare_digest(compute_verifier(master_key), base64.b64decode(entry['verifier']))
+
+
+def write_password(password, path=PASSWORD_FILE, params=None, key_cache=default_cache):
+    """
+    Saves the verifier of the access password, readable only by its owner.
+
+    Args:
+        password (str): The password to save.
+        path (str): The path to the password file.
+        params (dict or None): The key derivation parameters, kdf.create_params() by default.
+        key_cache (KeyCache): The cache of the derived keys.
+
+    Returns:
+        bytes: The master key of the password.
+    """
+    master_key, entry = create_entry(password, params, key_cache)
+    content = {'version': 2, 'kdf': kdf.create_header(entry, base64.b64decode(entry['salt'])),
+               'verifier': entry['verifier']}
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(descriptor, 'w', encoding='utf8') as file:
+        json.dump(content, file)
+    return master_key
+
+
+def read_password_file(path=PASSWORD_FILE):
+    """
+    Reads the password file.
+
+    Args:
+        path (str): The path to the password file.
+
+    Returns:
+        dict or str or None: The content of the file, a str if it holds the password
+        in plain text, or None if the file is not found.
+    """
+    try:
+        with open(path, 'r', encoding='utf8') as file:
+            text = file.read().strip()
+    except FileNotFoundError:
+        return None
+    try:
+        content = json.loads(text)
+    except ValueError:
+        return text
+    return content if isinstance(content, dict) and content.get('version') == 2 else text
+
+
+def read_entry(path=PASSWORD_FILE):
+    """
+    Reads the password entry of the password file.
+
+    Args:
+        path (str): The path to the password file.
+
+    Returns:
+        dict or None: The parameters, the salt and the verifier, None if there is no file
+        or it holds the password in plain text.
+    """
+    content = read_password_file(path)
+    if not isinstance(content, dict):
+        return None
+    return dict(content['kdf'], verifier=content['verifier'])
+
+
+def verify_password(password, path=PASSWORD_FILE, key_cache=default_cache):
+    """
+    Checks the access password against the saved verifier.
+
+    Args:
+        password (str or None): The password to check.
+        path (str): The path to the password file.
+        key_cache (KeyCache): The cache of the derived keys.
+
+    Returns:
+        bytes or None: The master key if the password is correct, None otherwise.
+    """
+    content = read_password_file(path)
+    if content is None or password is None:
+        return None
+    if isinstance(content, str):
+        if not hmac.compare_digest(content.encode('utf-8'), password.encode('utf-8')):
+            return None
+        return write_password(password, path, key_cache=key_cache)
+    return check_entry(password, dict(content['kdf'], verifier=content['verifier']), key_cache)
@@ -0,0 +1,121 @@
+"""
+Module with the directory scanner used to find the files to process.
+
+The scanner walks the tree with os.scandir, so the type and stat data of every entry
+come from the directory listing itself. Files are selected with include and exclude
+globs and with '.cipherignore' files, and excluded directories are never entered.
+
+A '.cipherignore' file holds one glob per line and applies to the directory it is in
+and all of its subdirectories. Lines starting with '#' are comments, a pattern ending
+with '/' matches only directories and a pattern containing '/' is matched against
+the path relative to the directory of the '.cipherignore' file instead of the name.
+"""
+
+import os
+from fnmatch import fnmatch
+
+IGNORE_FILE = '.cipherignore'
+DEFAULT_INCLUDE = ('*.txt',)
+DEFAULT_EXCLUDE = ('.DS_Store', '.git/')
+
+
+class IgnoreRule:
+    """
+    Class representing a single exclude pattern.
+
+    Attributes:
+        pattern (str): The glob without the trailing '/'.
+        base (str): The directory the pattern is relative to.
+        directory_only (bool): True if the pattern matches only directories.
+        anchored (bool): True if the pattern is matched against the relative path.
+    """
+    def __init__(self, pattern: str, base: str = ''):
+        """
+        Initializes the IgnoreRule object.
+
+        Args:
+            pattern (str): The glob, as written in '.cipherignore'.
+            base (str): The directory the pattern is relative to.
+        """
+        self.directory_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        self.anchored = '/' in pattern
+        self.pattern = pattern.lstrip('/')
+        self.base = base
+
+    def matches(self, path: str, name: str, is_dir: bool):
+        """
+        Checks whether the entry matches the pattern.
+
+        Args:
+            path (str): The path of the entry.
+            name (str): The name of the entry.
+            is_dir (bool): True if the entry is a directory.
+
+        Returns:
+            bool: True if the entry is excluded by the pattern.
+        """
+        if self.directory_only and not is_dir:
+            return False
+        if self.anchored:
+            return fnmatch(os.path.relpath(path, self.base).replace(os.sep, '/'), self.pattern)
+        return fnmatch(name, self.pattern)
+
+
+def read_ignore_file(directory: str):
+    """
+    Reads the rules of the '.cipherignore' file in the directory.
+
+    Args:
+        directory (str): The directory which may hold a '.cipherignore' file.
+
+    Returns:
+        list of IgnoreRule: The rules, empty if there is no such file.
+    """
+    try:
+        with open(os.path.join(directory, IGNORE_FILE), 'r', encoding='utf8') as file:
+            lines = [line.strip() for line in file]
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    return [IgnoreRule(line, directory) for line in lines if line and not line.startswith('#')]
+
+
+def scan(root: str, include=DEFAULT_INCLUDE, exclude=DEFAULT_EXCLUDE, use_ignore_files=True):
+    """
+    Lazily yields the files of the tree which match the include globs.
+
+    The files of a directory are yielded before the ones of its subdirectories,
+    in the same order os.walk would give them.
+
+    Args:
+        root (str): The directory to scan.
+        include (Iterable[str]): Globs matched against the file names, a file has to match one.
+        exclude (Iterable[str]): Globs of files and directories to skip, relative to the root.
+        use_ignore_files (bool): If True, the rules of '.cipherignore' files are applied.
+
+    Yields:
+        os.DirEntry: The entries of the matching files, with cached type and stat data.
+    """
+    include = tuple(include)
+    base_rules = [IgnoreRule(pattern, root) for pattern in exclude]
+    stack = [(root, base_rules)]
+    while stack:
+        directory, rules = stack.pop()
+        if use_ignore_files:
+            rules = rules + read_ignore_file(directory)
+        try:
+            with os.scandir(directory) as iterator:
+                entries = list(iterator)
+        except (FileNotFoundError, PermissionError, NotADirectoryError):
+            continue
+        subdirectories = []
+        for entry in entries:
+            is_dir = entry.is_dir(follow_symlinks=False)
+            if any(rule.matches(entry.path, entry.name, is_dir) for rule in rules):
+                continue
+            if is_dir:
+                subdirectories.append((entry.path, rules))
+            elif entry.name != IGNORE_FILE and entry.is_file() \
+                    and any(fnmatch(entry.name, pattern) for pattern in include):
+                yield entry
+        stack.extend(reversed(subdirectories))
@@ -0,0 +1,84 @@
+""" Module with tests for scanner module"""
+
+import os
+import shutil
+import unittest
+from scanner import scan
+
+
+class TestScan(unittest.TestCase):
+    """
+    Test suite for the scan function.
+    """
+    def setUp(self):
+        """
+        Creates a tree with text files, other files, a hidden clutter file and nested directories.
+        """
+        self.temp_dir = 'temp_scan_dir'
+        for path in ['a.txt', 'b.log', '.DS_Store', 'sub/c.txt', 'sub/deep/d.txt', 'skip/e.txt',
+                     'sub/skip/f.txt']:
+            full_path = os.path.join(self.temp_dir, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w', encoding='utf8') as file:
+                file.write(path)
+
+    def tearDown(self):
+        """
+        Removes the tree.
+        """
+        shutil.rmtree(self.temp_dir)
+
+    def relative(self, entries):
+        """
+        Returns the sorted paths of the entries relative to the tree.
+        """
+        return sorted(os.path.relpath(entry.path, self.temp_dir).replace(os.sep, '/')
+                      for entry in entries)
+
+    def test_default_include(self):
+        """
+        Checks that only text files are found, in the order of os.walk.
+        """
+        entries = list(scan(self.temp_dir))
+        walked = [os.path.join(path, file) for path, _, files in os.walk(self.temp_dir)
+                  for file in files if file.endswith('.txt')]
+
+        self.assertEqual([entry.path for entry in entries], walked)
+        self.assertEqual(entries[0].stat().st_size, len('a.txt'))
+
+    def test_include_and_exclude(self):
+        """
+        Checks the include globs, excluded names and excluded relative paths.
+        """
+        entries = scan(self.temp_dir, include=['*.txt', '*.log'], exclude=['skip/', 'sub/deep'])
+
+        self.assertEqual(self.relative(entries), ['a.txt', 'b.log', 'sub/c.txt'])
+
+    def test_ignore_file_prunes_subtree(self):
+        """
+        Checks that rules of nested '.cipherignore' files apply to their own subtree
+        and that ignored directories are not entered.
+        """
+        with open(os.path.join(self.temp_dir, 'sub', '.cipherignore'), 'w', encoding='utf8') as file:
+            file.write('# comment\ndeep/\nskip\n')
+        os.chmod(os.path.join(self.temp_dir, 'sub', 'deep'), 0)
+        try:
+            entries = self.relative(scan(self.temp_dir))
+        finally:
+            os.chmod(os.path.join(self.temp_dir, 'sub', 'deep'), 0o755)
+
+        self.assertEqual(entries, ['a.txt', 'skip/e.txt', 'sub/c.txt'])
+
+    def test_ignore_files_disabled(self):
+        """
+        Checks that '.cipherignore' files can be disabled.
+        """
+        with open(os.path.join(self.temp_dir, '.cipherignore'), 'w', encoding='utf8') as file:
+            file.write('*.txt\n')
+
+        self.assertEqual(list(scan(self.temp_dir)), [])
+        self.assertEqual(len(list(scan(self.temp_dir, use_ignore_files=False))), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,370 @@
+"""
+Module with the server encrypting and decrypting data on request.
+
+The server runs in a single long-lived process, so the imports, the key derivation
+and the Fernet objects are paid for once instead of on every request. It listens on
+a Unix domain socket, readable only by its owner, or on a localhost TCP port, and
+handles the connections concurrently with asyncio. The encryption itself runs in
+threads, on the workers of a shared ParallelEngine.
+
+Any local user can connect to a TCP port, so over TCP the first message of every
+connection has to carry the token saved by the server in a file readable only by
+its owner, 'cipher.token' by default. The container files of 'append' and 'read'
+are given relative to the 'result' folder and cannot be outside of it.
+
+Every message, in both directions, is a JSON object prefixed with its length
+as a 4-byte big-endian integer. Binary data is sent as base64. The requests are:
+
+    {"op": "auth", "token": <token>}          (first, over TCP)
+    {"op": "ping"}
+    {"op": "encrypt", "data": <base64>}       -> {"ok": true, "data": <base64 container>}
+    {"op": "decrypt", "data": <base64 container>} -> {"ok": true, "data": <base64>}
+    {"op": "append", "path": <container>, "data": <base64>} -> {"ok": true}
+    {"op": "read", "path": <container>, "offset": <int>, "length": <int>}
+        -> {"ok": true, "data": <base64>}
+
+A failed request is answered with {"ok": false, "error": <message>}.
+"""
+
+import asyncio
+import base64
+import contextlib
+import json
+import hmac
+import os
+import secrets
+import signal
+import socket
+import struct
+
+_LENGTH = struct.Struct('>I')
+MAX_MESSAGE = 64 * 1024 * 1024
+TOKEN_FILE = 'cipher.token'
+
+
+class ProtocolError(Exception):
+    """ Raised when a message does not follow the protocol. """
+
+
+def encode_message(message):
+    """
+    Encodes a message as length-prefixed JSON.
+
+    Args:
+        message (dict): The message.
+
+    Returns:
+        bytes: The encoded message.
+    """
+    encoded = json.dumps(message).encode('utf-8')
+    return _LENGTH.pack(len(encoded)) + encoded
+
+
+async def read_message(reader, max_message=MAX_MESSAGE):
+    """
+    Reads a length-prefixed JSON message from a stream.
+
+    Args:
+        reader (asyncio.StreamReader): The stream.
+        max_message (int): The maximal size of a message in bytes.
+
+    Returns:
+        dict or None: The message, or None if the stream ended before it.
+    """
+    try:
+        (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    except asyncio.IncompleteReadError:
+        return None
+    if length > max_message:
+        raise ProtocolError(f'The message is larger than {max_message} bytes')
+    try:
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError as error:
+        raise ProtocolError('The message is truncated') from error
+
+
+def create_token_file(path=TOKEN_FILE):
+    """
+    Saves a new random token in a file readable only by its owner.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The token.
+    """
+    token = secrets.token_hex(32)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(descriptor, 'w', encoding='ascii') as file:
+        os.chmod(path, 0o600)
+        file.write(token)
+    return token
+
+
+def read_token_file(path=TOKEN_FILE):
+    """
+    Reads the token saved by create_token_file().
+    """
+    with open(path, encoding='ascii') as file:
+        return file.read().strip()
+
+
+class CipherServer:
+    """
+    Class representing the server handling encryption requests.
+
+    Attributes:
+        encrypt_decrypt (EncryptDecrypt): The object encrypting and decrypting the data.
+        max_message (int): The maximal size of a request in bytes.
+        root (str): The folder holding the container files of 'append' and 'read'.
+        token (str or None): The token the clients have to send first, required over TCP.
+
+    Methods:
+        handle(request): Returns the response to a single request.
+        start(path, host, port): Starts listening on a Unix socket or a TCP port.
+        serve_forever(path, host, port): Starts the server and handles requests until cancelled.
+    """
+    def __init__(self, encrypt_decrypt, max_message=MAX_MESSAGE, root=None, token=None):
+        """
+        Initializes the CipherServer object.
+
+        Args:
+            encrypt_decrypt (EncryptDecrypt): The object encrypting and decrypting the data.
+                Its engine should be shared, so the workers stay alive between requests.
+            max_message (int): The maximal size of a request in bytes.
+            root (str or None): The folder holding the container files of 'append'
+                and 'read', the output folder of encrypt_decrypt by default.
+            token (str or None): The token the clients have to send first.
+                It is required to listen on a TCP port.
+        """
+        self.encrypt_decrypt = encrypt_decrypt
+        self.max_message = max_message
+        self.root = os.path.realpath(encrypt_decrypt.new_folder if root is None else root)
+        self.token = token
+        self.operations = {
+            'ping': self._ping,
+            'encrypt': self._encrypt,
+            'decrypt': self._decrypt,
+            'append': self._append,
+            'read': self._read,
+        }
+
+    def _ping(self, request):
+        """ Answers without doing anything, to check that the server is alive. """
+        return {}
+
+    def _encrypt(self, request):
+        """ Encrypts the data to a container. """
+        data = base64.b64decode(request['data'])
+        return {'data': base64.b64encode(self.encrypt_decrypt.encrypt_bytes(data)).decode('ascii')}
+
+    def _decrypt(self, request):
+        """ Decrypts a container sent as the data. """
+        data = base64.b64decode(request['data'])
+        return {'data': base64.b64encode(self.encrypt_decrypt.decrypt_bytes(data)).decode('ascii')}
+
+    def container_path(self, path):
+        """
+        Returns the path of a container file given relative to the root folder.
+
+        Raises:
+            ValueError: If the path, with its symbolic links resolved, is outside of the root.
+        """
+        if not isinstance(path, str) or os.path.isabs(path):
+            raise ValueError('The path has to be relative to the result folder')
+        resolved = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, resolved]) != self.root or resolved == self.root:
+            raise ValueError('The path is outside of the result folder')
+        return resolved
+
+    def _append(self, request):
+        """ Appends the data to a container file as a new segment. """
+        path = self.container_path(request['path'])
+        with self.encrypt_decrypt.create_engine() as engine:
+            self.encrypt_decrypt.append_to_container(path, base64.b64decode(request['data']), engine)
+        return {}
+
+    def _read(self, request):
+        """ Decrypts a range of a container file. """
+        data = self.encrypt_decrypt.decrypt_range(self.container_path(request['path']),
+                                                  int(request['offset']), int(request['length']))
+        return {'data': base64.b64encode(data).decode('ascii')}
+
+    async def handle(self, request):
+        """
+        Returns the response to a single request, running the work in a thread.
+
+        Args:
+            request (dict): The request.
+
+        Returns:
+            dict: The response, with 'ok' telling whether the request succeeded.
+        """
+        operation = self.operations.get(request.get('op')) if isinstance(request, dict) else None
+        if operation is None:
+            return {'ok': False, 'error': 'Unknown operation'}
+        try:
+            response = await asyncio.to_thread(operation, request)
+        except Exception as error:
+            return {'ok': False, 'error': str(error) or type(error).__name__}
+        response['ok'] = True
+        return response
+
+    def is_authenticated(self, request):
+        """
+        Checks that the first request of a connection carries the token, if one is required.
+        """
+        if self.token is None:
+            return True
+        if not isinstance(request, dict) or request.get('op') != 'auth' \
+                or not isinstance(request.get('token'), str):
+            return False
+        return hmac.compare_digest(request['token'].encode('utf-8'), self.token.encode('utf-8'))
+
+    async def serve_client(self, reader, writer):
+        """
+        Answers the requests of a connection one after another until it is closed.
+
+        With a token, the connection is closed unless its first request carries it.
+        """
+        try:
+            if self.token is not None:
+                try:
+                    request = await read_message(reader, self.max_message)
+                except (ProtocolError, ValueError):
+                    request = None
+                if request is None or not self.is_authenticated(request):
+                    writer.write(encode_message({'ok': False, 'error': 'Not authenticated'}))
+                    return
+                writer.write(encode_message({'ok': True}))
+            while True:
+                try:
+                    request = await read_message(reader, self.max_message)
+                except (ProtocolError, ValueError) as error:
+                    writer.write(encode_message({'ok': False, 'error': str(error)}))
+                    break
+                if request is None:
+                    break
+                writer.write(encode_message(await self.handle(request)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, path=None, host='127.0.0.1', port=0):
+        """
+        Starts listening on a Unix socket or on a TCP port.
+
+        Args:
+            path (str or None): The path to the Unix socket. If None, TCP is used.
+            host (str): The address to listen on with TCP.
+            port (int): The TCP port, 0 to pick a free one.
+
+        Returns:
+            asyncio.Server: The listening server.
+
+        Raises:
+            ValueError: If TCP is used without a token.
+        """
+        if path is None:
+            if self.token is None:
+                raise ValueError('A server listening on a TCP port needs a token')
+            return await asyncio.start_server(self.serve_client, host, port)
+        if os.path.exists(path):
+            os.remove(path)
+        old_umask = os.umask(0o177)
+        try:
+            return await asyncio.start_unix_server(self.serve_client, path)
+        finally:
+            os.umask(old_umask)
+
+    async def serve_forever(self, path=None, host='127.0.0.1', port=0):
+        """
+        Starts the server and handles requests until it is cancelled or, when run
+        in the main thread, until the process receives SIGTERM.
+
+        Args:
+            path (str or None): The path to the Unix socket. If None, TCP is used.
+            host (str): The address to listen on with TCP.
+            port (int): The TCP port.
+        """
+        server = await self.start(path, host, port)
+        if path is None:
+            host, port = server.sockets[0].getsockname()[:2]
+        print(f'Listening on {path or f"{host}:{port}"}', flush=True)
+        stopped = asyncio.Event()
+        with contextlib.suppress(NotImplementedError, RuntimeError, ValueError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+        async with server:
+            await stopped.wait()
+
+
+class CipherClient:
+    """
+    Class representing a blocking client of the server, used by scripts and tests.
+
+    Methods:
+        request(op, **fields): Sends a request and returns the response.
+        close(): Closes the connection.
+    """
+    def __init__(self, path=None, host='127.0.0.1', port=None, token=None):
+        """
+        Initializes the CipherClient object, connects to the server and sends the token.
+
+        Args:
+            path (str or None): The path to the Unix socket. If None, TCP is used.
+            host (str): The address of the server with TCP.
+            port (int or None): The TCP port of the server.
+            token (str or None): The token of the server, read with read_token_file().
+
+        Raises:
+            ProtocolError: If the server rejects the token.
+        """
+        if path is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile('rb')
+        if token is not None and not self.request('auth', token=token)['ok']:
+            self.close()
+            raise ProtocolError('The server rejected the token')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, op, **fields):
+        """
+        Sends a request and waits for the response.
+
+        Args:
+            op (str): The operation.
+            **fields: The other fields of the request. Bytes are sent as base64.
+
+        Returns:
+            dict: The response. Its 'data' field is decoded to bytes.
+        """
+        message = {'op': op}
+        for name, value in fields.items():
+            message[name] = base64.b64encode(value).decode('ascii') if isinstance(value, bytes) \
+                else value
+        self.socket.sendall(encode_message(message))
+        prefix = self.file.read(_LENGTH.size)
+        if len(prefix) < _LENGTH.size:
+            raise ProtocolError('The server closed the connection')
+        (length,) = _LENGTH.unpack(prefix)
+        response = json.loads(self.file.read(length))
+        if 'data' in response:
+            response['data'] = base64.b64decode(response['data'])
+        return response
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self.file.close()
+        self.socket.close()
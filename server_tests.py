@@ -0,0 +1,158 @@
+""" Module with tests for server module"""
+
+import asyncio
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from encryptdecrypt import EncryptDecrypt
+from engine import ParallelEngine
+from server import CipherClient, CipherServer, ProtocolError, create_token_file, read_token_file
+
+
+class TestServer(unittest.TestCase):
+    """
+    Test suite for the server and its client over a Unix socket.
+    """
+    def setUp(self):
+        """
+        Start the server in a thread with its own event loop.
+        """
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'cipher.sock')
+        self.engine = ParallelEngine(2, use_threads=True)
+        self.server = CipherServer(EncryptDecrypt(None, chunk_size=1000, engine=self.engine),
+                                   max_message=1024 * 1024, root=self.temp_dir)
+        self.loop = asyncio.new_event_loop()
+        listening = self.loop.run_until_complete(self.server.start(self.path))
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+        self.listening = listening
+
+    def tearDown(self):
+        """
+        Stop the server and remove the socket.
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.listening.close()
+        self.loop.run_until_complete(self.listening.wait_closed())
+        self.loop.close()
+        self.engine.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """
+        Checks that data encrypted by the server is decrypted back, also by the CLI classes,
+        and that a container file can be appended to and read in ranges.
+        """
+        data = os.urandom(5000)
+        with CipherClient(self.path) as client:
+            self.assertTrue(client.request('ping')['ok'])
+            encrypted = client.request('encrypt', data=data)['data']
+            self.assertEqual(client.request('decrypt', data=encrypted)['data'], data)
+            container_path = os.path.join(self.temp_dir, 'log.encrypt')
+            with open(container_path, 'wb') as file:
+                file.write(encrypted)
+            self.assertTrue(client.request('append', path='log.encrypt', data=b'tail')['ok'])
+            response = client.request('read', path='log.encrypt', offset=-10, length=10)
+
+        self.assertEqual(response['data'], data[-6:] + b'tail')
+        self.assertEqual(EncryptDecrypt(None).decrypt_bytes(encrypted), data)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_concurrent_clients(self):
+        """
+        Checks that many clients are answered concurrently with their own data.
+        """
+        def run(number):
+            with CipherClient(self.path) as client:
+                data = str(number).encode() * 100
+                encrypted = client.request('encrypt', data=data)['data']
+                return client.request('decrypt', data=encrypted)['data'] == data
+
+        with ThreadPoolExecutor(8) as executor:
+            self.assertTrue(all(executor.map(run, range(16))))
+
+    def test_concurrent_appends(self):
+        """
+        Checks that appends of many clients to the same container all end up in it.
+        """
+        with CipherClient(self.path) as client:
+            encrypted = client.request('encrypt', data=b'first\n')['data']
+        with open(os.path.join(self.temp_dir, 'log.encrypt'), 'wb') as file:
+            file.write(encrypted)
+
+        def run(number):
+            with CipherClient(self.path) as client:
+                return all(client.request('append', path='log.encrypt',
+                                          data=f'{number} {line}\n'.encode('ascii'))['ok']
+                           for line in range(20))
+
+        with ThreadPoolExecutor(8) as executor:
+            self.assertTrue(all(executor.map(run, range(8))))
+        with open(os.path.join(self.temp_dir, 'log.encrypt'), 'rb') as file:
+            lines = EncryptDecrypt(None).decrypt_bytes(file.read()).decode('ascii').splitlines()
+        self.assertEqual(lines[0], 'first')
+        self.assertEqual(sorted(lines[1:]), sorted(f'{number} {line}' for number in range(8)
+                                                   for line in range(20)))
+
+    def test_errors(self):
+        """
+        Checks that failed requests are answered with an error and oversized messages
+        close the connection.
+        """
+        with CipherClient(self.path) as client:
+            self.assertEqual(client.request('unknown'),
+                             {'ok': False, 'error': 'Unknown operation'})
+            response = client.request('decrypt', data=b'not a container')
+            self.assertFalse(response['ok'])
+            self.assertTrue(client.request('ping')['ok'])
+        with CipherClient(self.path) as client:
+            client.socket.sendall(struct.pack('>I', 2 * 1024 * 1024))
+            response = client.file.read()
+            self.assertIn(b'larger than', response)
+
+    def test_paths_outside_root(self):
+        """
+        Checks that container files outside of the root folder are refused,
+        also through a symbolic link.
+        """
+        outside = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside)
+        os.symlink(outside, os.path.join(self.temp_dir, 'link'))
+        with CipherClient(self.path) as client:
+            for path in ['../log.encrypt', os.path.join(outside, 'log.encrypt'), 'link/log.encrypt',
+                         '.']:
+                response = client.request('read', path=path, offset=0, length=10)
+                self.assertFalse(response['ok'])
+                self.assertIn('result folder', response['error'])
+
+    def test_tcp_token(self):
+        """
+        Checks that a TCP server needs a token, closes connections without it
+        and answers the clients sending it.
+        """
+        with self.assertRaises(ValueError):
+            asyncio.run_coroutine_threadsafe(self.server.start(port=0), self.loop).result()
+        token_file = os.path.join(self.temp_dir, 'cipher.token')
+        self.server.token = create_token_file(token_file)
+        self.assertEqual(os.stat(token_file).st_mode & 0o777, 0o600)
+        listening = asyncio.run_coroutine_threadsafe(self.server.start(port=0), self.loop).result()
+        port = listening.sockets[0].getsockname()[1]
+        try:
+            with CipherClient(port=port) as client:
+                self.assertEqual(client.request('ping'), {'ok': False, 'error': 'Not authenticated'})
+            with self.assertRaises(ProtocolError):
+                CipherClient(port=port, token='0' * 64)
+            with CipherClient(port=port, token=read_token_file(token_file)) as client:
+                self.assertTrue(client.request('ping')['ok'])
+        finally:
+            self.loop.call_soon_threadsafe(listening.close)
+
+
+if __name__ == '__main__':
+    unittest.main()
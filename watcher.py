@@ -0,0 +1,102 @@
+"""
+Module with the Watcher class detecting changed files by polling.
+
+The standard library has no portable file-system notifications (inotify, kqueue
+and ReadDirectoryChangesW need third-party packages), so the directory is polled:
+every interval it is scanned, with the stat data cached by os.scandir, and the size
+and modification time of every file are compared with the previous snapshot.
+
+Changes are debounced: a file is reported only once it has not changed for
+the debounce period, so a file written in many steps is encrypted once, when it is
+complete. All files which settle at the same time are reported together.
+"""
+
+import threading
+import time
+
+
+class Watcher:
+    """
+    Class watching the files of a directory for creation, modification and deletion.
+
+    Attributes:
+        directory (DirectoryFile): The directory to watch, with its include and exclude globs.
+        interval (float): The time between two scans in seconds.
+        debounce (float): The time in seconds a file has to stay unchanged to be reported.
+        snapshot (dict): Mapping of the paths of the files to their size and modification time.
+        pending (dict): Mapping of the paths of changed files to the time of their last change.
+
+    Methods:
+        take_snapshot(): Scans the directory.
+        poll(): Scans the directory and returns the files whose changes have settled.
+        watch(stop): Yields the settled files until stopped.
+    """
+    def __init__(self, directory, interval=1.0, debounce=1.0, clock=time.monotonic):
+        """
+        Initializes the Watcher object and takes the first snapshot.
+
+        Args:
+            directory (DirectoryFile): The directory to watch.
+            interval (float): The time between two scans in seconds.
+            debounce (float): The time in seconds a file has to stay unchanged to be reported.
+            clock (Callable[[], float]): The monotonic clock, replaceable in tests.
+        """
+        self.directory = directory
+        self.interval = interval
+        self.debounce = debounce
+        self.clock = clock
+        self.snapshot = self.take_snapshot()
+        self.pending = {}
+
+    def take_snapshot(self):
+        """
+        Scans the directory.
+
+        Returns:
+            dict: Mapping of the paths of the files to (size, mtime_ns) tuples.
+        """
+        return {path: (stat.st_size, stat.st_mtime_ns) for path, stat in self.directory.iter_stat()}
+
+    def poll(self):
+        """
+        Scans the directory and returns the files whose changes have settled.
+
+        Returns:
+            list of str: The created, modified or deleted files which have not changed
+            for the debounce period, sorted by path.
+        """
+        now = self.clock()
+        snapshot = self.take_snapshot()
+        for path in snapshot.keys() | self.snapshot.keys():
+            if snapshot.get(path) != self.snapshot.get(path):
+                self.pending[path] = now
+        self.snapshot = snapshot
+        settled = sorted(path for path, changed in self.pending.items() if now - changed >= self.debounce)
+        for path in settled:
+            del self.pending[path]
+        return settled
+
+    def watch(self, stop=None):
+        """
+        Polls the directory and yields the files whose changes have settled.
+
+        While changes are pending, the next scan is made as soon as the earliest
+        of them may settle, so the delay is not longer than needed.
+
+        Args:
+            stop (threading.Event or None): The event ending the watch when set.
+
+        Yields:
+            list of str: The files which settled since the previous scan.
+        """
+        stop = stop or threading.Event()
+        while True:
+            timeout = self.interval
+            if self.pending:
+                settles = min(self.pending.values()) + self.debounce - self.clock()
+                timeout = min(timeout, max(settles, 0))
+            if stop.wait(timeout):
+                return
+            settled = self.poll()
+            if settled:
+                yield settled
@@ -0,0 +1,73 @@
+""" Module with tests for Watcher class"""
+
+import os
+import shutil
+import threading
+import unittest
+from directoryfile import DirectoryFile
+from watcher import Watcher
+
+
+class TestWatcher(unittest.TestCase):
+    """
+    Test suite for detecting and debouncing changes.
+    """
+    def setUp(self):
+        """
+        Create a directory with a file and a watcher with a manual clock.
+        """
+        os.makedirs('temp_watch_dir')
+        self.write('old.txt', 'kacper\n')
+        self.now = 0.0
+        self.watcher = Watcher(DirectoryFile('temp_watch_dir'), interval=0.01, debounce=1.0,
+                               clock=lambda: self.now)
+
+    def tearDown(self):
+        """
+        Remove the directory.
+        """
+        shutil.rmtree('temp_watch_dir')
+
+    def write(self, name, text, mtime_ns=None):
+        path = os.path.join('temp_watch_dir', name)
+        with open(path, 'a', encoding='utf8') as file:
+            file.write(text)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+    def test_debounce_and_coalesce(self):
+        """
+        Checks that a file written in many steps is reported once, after it settled,
+        together with the other changes, and that other files are ignored.
+        """
+        created = self.write('new.txt', 'kamil\n')
+        os.remove(os.path.join('temp_watch_dir', 'old.txt'))
+        self.write('image.png', 'binary')
+        self.assertEqual(self.watcher.poll(), [])
+
+        self.now = 0.6
+        self.write('new.txt', 'oliwia\n', mtime_ns=10 ** 18)
+        self.assertEqual(self.watcher.poll(), [])
+        self.now = 1.2
+        self.assertEqual(self.watcher.poll(), [os.path.join('temp_watch_dir', 'old.txt')])
+        self.now = 1.6
+        self.assertEqual(self.watcher.poll(), [created])
+        self.now = 5.0
+        self.assertEqual(self.watcher.poll(), [])
+
+    def test_watch_stops(self):
+        """
+        Checks that watch yields changes and ends when the stop event is set.
+        """
+        watcher = Watcher(DirectoryFile('temp_watch_dir'), interval=0.01, debounce=0.0)
+        stop = threading.Event()
+        created = self.write('new.txt', 'kamil\n')
+        for files in watcher.watch(stop):
+            self.assertEqual(files, [created])
+            stop.set()
+        self.assertTrue(stop.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()